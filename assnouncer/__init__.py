@@ -1,12 +1,14 @@
+import os
+import sys
+import atexit
 import logging
 
-from assnouncer import downloaders
-from assnouncer import commands
-from assnouncer import audio
+from assnouncer import config
+from assnouncer import logs
 
-from logging import DEBUG, INFO, WARNING, ERROR, CRITICAL, StreamHandler, Formatter
-from typing import Any
-from discord import utils
+from logging import DEBUG, INFO, WARNING, ERROR, CRITICAL, Handler, StreamHandler, Formatter
+from logging.handlers import RotatingFileHandler
+from typing import Any, List, TextIO
 
 
 class ColourFormatter(Formatter):
@@ -52,19 +54,54 @@ class ColourFormatter(Formatter):
         return output
 
 
-utils.setup_logging = lambda **_: None
+def is_docker() -> bool:
+    path = "/proc/self/cgroup"
+    return os.path.exists("/.dockerenv") or (os.path.isfile(path) and any("docker" in line for line in open(path)))
 
-handler = StreamHandler()
+
+def stream_supports_colour(stream: TextIO) -> bool:
+    # Same as discord.utils.stream_supports_colour, without importing discord
+    is_a_tty = hasattr(stream, "isatty") and stream.isatty()
+    if "PYCHARM_HOSTED" in os.environ or os.environ.get("TERM_PROGRAM") == "vscode":
+        return is_a_tty
+
+    if sys.platform != "win32":
+        return is_a_tty or is_docker()
+
+    return is_a_tty and ("ANSICON" in os.environ or "WT_SESSION" in os.environ)
+
+
+dt_fmt = '%Y-%m-%d %H:%M:%S'
+plain_formatter = Formatter('[{asctime}] [{levelname:<8}] {name:<24}: {message}', dt_fmt, style='{')
+
+stream_handler = StreamHandler()
 
 formatter: Any
-if utils.stream_supports_colour(handler.stream):
+if stream_supports_colour(stream_handler.stream):
     formatter = ColourFormatter()
 else:
-    dt_fmt = '%Y-%m-%d %H:%M:%S'
-    formatter = Formatter('[{asctime}] [{levelname:<8}] {name:<24}: {message}', dt_fmt, style='{')
+    formatter = plain_formatter
+
+stream_handler.setFormatter(formatter)
+
+handlers: List[Handler] = [stream_handler]
+if config.LOG_PATH is not None:
+    file_handler = RotatingFileHandler(
+        config.LOG_PATH,
+        maxBytes=config.LOG_MAX_BYTES,
+        backupCount=config.LOG_BACKUPS,
+        encoding="utf8",
+        delay=True
+    )
+    file_handler.setFormatter(plain_formatter)
+    handlers.append(file_handler)
+
+# Formatting and writing happen on a background thread, so that a slow terminal or pipe
+# never stalls the event loop or the player
+handler = logs.start(handlers, capacity=config.LOG_QUEUE_SIZE)
+atexit.register(handler.listener.stop)
 
 logger = logging.getLogger()
 
-handler.setFormatter(formatter)
 logger.setLevel(INFO)
 logger.addHandler(handler)
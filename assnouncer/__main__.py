@@ -1,11 +1,12 @@
 from __future__ import annotations
 
+import os
+
 from argparse import ArgumentParser
 from pathlib import Path
 
-import assnouncer
+import assnouncer  # noqa: F401, sets up logging
 from assnouncer import config
-from assnouncer.assnouncer import Assnouncer
 
 #
 # Parse
@@ -17,8 +18,15 @@ parser = ArgumentParser(
 parser.add_argument(
     "--guild",
     type=int,
-    help="The guild (server) ID of the server to connect to.",
-    default=config.GUILD_ID,
+    action="append",
+    help="The guild (server) ID of a server to connect to. Can be given multiple times.",
+    required=False
+)
+parser.add_argument(
+    "--shards",
+    type=int,
+    help="Number of player worker processes, -1 for one per core and 0 to play in-process.",
+    default=config.PLAYER_SHARDS,
     required=False
 )
 args = parser.parse_args()
@@ -26,10 +34,19 @@ args = parser.parse_args()
 #
 # Configure
 #
-config.GUILD_ID = int(args.guild)
+if args.guild:
+    config.GUILD_IDS = [int(guild) for guild in args.guild]
+
+config.PLAYER_SHARDS = args.shards
+if config.PLAYER_SHARDS < 0:
+    config.PLAYER_SHARDS = os.cpu_count()
+
+config.init()
 
 #
 # Run
 #
+from assnouncer.assnouncer import Assnouncer  # noqa: E402, discord is slow to import and not needed for --help
+
 ass = Assnouncer()
 ass.run(Path("token").read_text())
@@ -1,27 +1,26 @@
 from __future__ import annotations
 
-import time
 import asyncio
 import logging
 
-from assnouncer import debug
 from assnouncer import util
 from assnouncer import config
+from assnouncer import metadata
+from assnouncer import trace
+from assnouncer.metrics import MetricsServer
+from assnouncer.watchdog import Watchdog
 from assnouncer.util import SongRequest
-from assnouncer.queue import Queue
+from assnouncer.player import Player
+from assnouncer.outbox import Outbox, Priority
+from assnouncer.audio.shard import ShardPool
 from assnouncer.commands import BaseCommand
-from assnouncer.audio import music
-from assnouncer.audio.music import MusicState
+from assnouncer.commands.batch import Batch
 
 from dataclasses import dataclass, field
-from typing import Awaitable, List, TypeVar, TYPE_CHECKING
+from typing import Awaitable, Dict, TypeVar, TYPE_CHECKING
 from concurrent.futures import Future
-from threading import Event, Thread
-from asyncio import Lock
 from discord import (
-    Client, Game, TextChannel, Message,
-    Guild, VoiceClient, Member, VoiceState,
-    Intents, VoiceChannel, SpeakingState
+    Client, Game, Message, Member, VoiceState, Intents, utils
 )
 
 if TYPE_CHECKING:
@@ -29,195 +28,100 @@ if TYPE_CHECKING:
 
 T = TypeVar("T")
 
+# Logging is set up by the package, keep Client.run from adding its own handler
+utils.setup_logging = lambda **_: None
+
 
 logger = logging.getLogger(__name__)
 
 
 @dataclass
 class Assnouncer(Client):
-    skip_event: Event = field(default_factory=Event)
-    song_queue: Queue[Future[SongRequest]] = field(default_factory=Queue)
-    theme_queue: Queue[SongRequest] = field(default_factory=Queue)
-    lock: Lock = field(default_factory=Lock)
-    thread: Thread = None
-    server: Guild = None
-    general: TextChannel = None
-    voice: VoiceClient = None
+    players: Dict[int, Player] = field(default_factory=dict)
+    shards: ShardPool = None
+    outbox: Outbox = field(default_factory=Outbox)
+    metrics: MetricsServer = None
+    watchdog: Watchdog = None
 
     def __post_init__(self):
         intents = Intents.default()
         intents.message_content = True
         super().__init__(intents=intents)
 
-    def skip(self):
-        self.skip_event.set()
+    async def setup_hook(self):
+        if config.PLAYER_SHARDS > 0:
+            self.shards = ShardPool(size=config.PLAYER_SHARDS)
+            self.shards.start()
 
-    def stop(self):
-        self.song_queue.clear()
-        self.skip()
+        if config.LOOP_LAG_THRESHOLD > 0:
+            self.watchdog = Watchdog(loop=self.loop, threshold=config.LOOP_LAG_THRESHOLD)
+            self.watchdog.start()
 
-    async def set_activity(self, activity: str):
-        return await self.change_presence(activity=Game(name=activity))
+        self.loop.create_task(metadata.scan(), name="metadata-scan")
 
-    async def set_speaking(self, speaking: SpeakingState):
-        return await self.voice.ws.speak(speaking)
+        if config.METRICS_PORT is not None:
+            self.metrics = MetricsServer(ass=self, port=int(config.METRICS_PORT))
+            await self.metrics.start()
 
-    async def message(self, message: str, channel: MessageableChannel = None):
-        if channel is None:
-            channel = self.general
+    async def close(self):
+        if self.shards is not None:
+            self.shards.close()
 
-        await channel.send(message)
+        if self.metrics is not None:
+            self.metrics.close()
 
-    def run_coroutine(self, coro: Awaitable[T]) -> Future[T]:
-        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+        if self.watchdog is not None:
+            self.watchdog.close()
 
-    @debug.profiled
-    def reconnect_callback(self) -> VoiceClient:
-        return self.run_coroutine(self.ensure_connected()).result()
-
-    @debug.profiled
-    def skip_callback(self) -> MusicState:
-        if self.skip_event.is_set():
-            self.skip_event.clear()
-
-            return MusicState.STOPPED
-        return MusicState.CONTINUED
-
-    @debug.profiled
-    def theme_callback(self) -> MusicState:
-        state = self.skip_callback()
-        if state is MusicState.STOPPED:
-            return MusicState.STOPPED
-
-        while not self.theme_queue.empty():
-            state = MusicState.INTERRUPTED
-
-            request = self.theme_queue.pop()
-            self.run_coroutine(self.set_speaking(SpeakingState.soundshare))
-            music.play(
-                request.source,
-                reconnect_callback=self.reconnect_callback,
-                state_callback=self.skip_callback
-            )
+        for player in self.players.values():
+            if player.journal is not None:
+                player.journal.close()
+
+        await super().close()
+
+    def get_player(self, guild_id: int) -> Player:
+        if guild_id not in config.GUILD_IDS:
+            return None
 
-        return state
-
-    @debug.profiled
-    def handle_song(self, request: SongRequest):
-        if not request.sneaky:
-            parts = ["Playing", request.uri]
-            if (request.start, request.stop) != (None, None):
-                start = "<"
-                stop = ">"
-
-                if request.start is not None:
-                    start = str(request.start)
-
-                if request.stop is not None:
-                    stop = str(request.stop)
-
-                parts.append(f"[{start}-{stop}]")
-
-            if request.uri != request.query:
-                parts.append(f"({request.query!r})")
-
-            coro = self.message(" ".join(parts), channel=request.channel)
-            self.run_coroutine(coro)
-
-        self.skip_event.clear()
-
-        self.run_coroutine(self.set_speaking(SpeakingState.soundshare))
-        music.play(
-            request.source,
-            reconnect_callback=self.reconnect_callback,
-            state_callback=self.theme_callback
-        )
-        self.run_coroutine(self.set_speaking(SpeakingState.none))
-
-    def song_loop(self):
-        while True:
-            request = self.theme_queue.pop() or self.song_queue.pop()
-            if request is None:
-                time.sleep(0.1)
-                continue
-
-            if isinstance(request, Future):
-                request = request.result()
-
-            if request is None:
-                message = "Маняк на бота му стана лошо, няма такава песен"
-                self.run_coroutine(self.message(message))
-                continue
-
-            self.handle_song(request)
-            debug.print_report()
-
-    @debug.profiled
-    async def ensure_connected(self):
-        async with self.lock:
-            if self.voice is not None and self.voice.is_connected():
-                return self.voice
-
-            if self.voice is not None:
-                logger.info("Trying to reconnect to voice")
-                if await self.voice.potential_reconnect():
-                    return self.voice
-
-            logger.info(f"Connecting to {config.GUILD_ID}")
-            self.server: Guild = self.get_guild(config.GUILD_ID)
-            self.general: TextChannel = self.server.text_channels[0]
-            vc: VoiceChannel = self.server.voice_channels[0]
-
-            while True:
-                try:
-                    self.voice = await vc.connect(timeout=10.0)
-                    return self.voice
-                except TimeoutError:
-                    logger.warn(f"Failed to connect to {config.GUILD_ID}")
+        player = self.players.get(guild_id)
+        if player is None:
+            logger.info(f"Creating player for {guild_id}")
+            player = Player(ass=self, guild_id=guild_id)
+            self.players[guild_id] = player
+
+        player.start()
+        return player
+
+    async def set_activity(self, activity: str):
+        return await self.change_presence(activity=Game(name=activity))
+
+    async def message(self, message: str, channel: MessageableChannel, priority: Priority = Priority.RESPONSE):
+        self.outbox.post(channel, message, priority=priority)
+
+    def run_coroutine(self, coro: Awaitable[T]) -> Future[T]:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
 
     async def on_ready(self):
         logger.info("Getting ready")
         await self.set_activity("Getting ready")
-        await self.ensure_connected()
+
+        players = [self.get_player(guild_id) for guild_id in config.GUILD_IDS]
+        await asyncio.gather(*(player.ensure_connected() for player in players))
+
         await self.set_activity("Ready")
         logger.info("Ready")
 
         theme_path = util.get_theme_path("Assnouncer")
-        theme_source = await util.load_source(theme_path)
-        theme_request = SongRequest(
-            source=theme_source,
-            query="Assnouncer's theme",
-            uri="Assnouncer's theme",
-            channel=self.general,
-            sneaky=True
-        )
-        self.theme_queue.put(theme_request)
-
-        if self.thread is None or not self.thread.is_alive():
-            self.thread = Thread(target=self.song_loop, daemon=True)
-            self.thread.start()
-
-    async def queue_song(self, request: Awaitable[SongRequest]):
-        self.song_queue.put(self.run_coroutine(request))
-
-    async def play_theme(self, user: Member):
-        await self.ensure_connected()
-
-        theme_path = util.get_theme_path(user)
-
-        source = await util.load_source(theme_path)
-        if source is None:
-            logger.warn(f"No theme for {user}")
-            return
-
-        request = SongRequest(
-            source=source,
-            query=f"{user}'s theme",
-            uri=f"{user}'s theme",
-            channel=self.general
-        )
-
-        self.theme_queue.put(request)
+        for player in players:
+            theme_source = await util.load_source(theme_path)
+            theme_request = SongRequest(
+                source=theme_source,
+                query="Assnouncer's theme",
+                uri="Assnouncer's theme",
+                channel=player.general,
+                sneaky=True
+            )
+            player.queue_theme(theme_request)
 
     async def on_voice_state_update(
         self,
@@ -225,40 +129,55 @@ class Assnouncer(Client):
         before: VoiceState,
         after: VoiceState
     ):
-        if member == self.user or member.guild != self.server:
+        if member == self.user:
+            return
+
+        player = self.get_player(member.guild.id)
+        if player is None:
             return
 
         prev_channel = before.channel
         next_channel = after.channel
         if prev_channel is None and next_channel is not None:
             print(f"[chat] <{next_channel.name}>: {member} has joined")
-            await self.play_theme(member)
+            await player.play_theme(member)
 
     async def on_message(self, message: Message):
-        if message.guild != self.server:
+        if message.guild is None:
             return
 
         if message.author == self.user:
             return
 
+        player = self.get_player(message.guild.id)
+        if player is None:
+            return
+
         # TODO: Move this to asspp.parse or BaseCommand
 
         content: str = message.content
-        lines: List[str] = [content]
         if content.startswith("```ass\n") and content.endswith("```"):
             content = content[7:-3]
 
             lines = [line for line in content.splitlines() if line.strip()]
+            if lines:
+                logger.info(f"Running batch of {len(lines)} line(s)")
+                trace.begin("batch", lines=len(lines), guild=message.guild.id)
+                await Batch(ass=self, message=message, lines=lines).run()
+            return
         elif "\n" in content:
             return
 
+        if not BaseCommand.is_command(content):
+            return
+
         logger.info(f"Parsing: {message.content!r}")
-        await self.ensure_connected()
-
-        for idx, line in enumerate(lines):
-            try:
-                command = BaseCommand.parse(line)
-                logger.info(f"Trying to run '{command}'")
-                await BaseCommand.run(self, message, command)
-            except (SyntaxError, TypeError) as e:
-                logger.warn(f"Command #{idx}: {e}")
+        trace.begin("message", content=content, guild=message.guild.id)
+
+        try:
+            with trace.span("parse"):
+                command = BaseCommand.parse(content)
+            logger.info(f"Trying to run '{command}'")
+            await BaseCommand.run(self, message, command)
+        except (SyntaxError, TypeError) as e:
+            logger.warn(f"Command: {e}")
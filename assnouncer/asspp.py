@@ -2,12 +2,14 @@ from __future__ import annotations
 
 import ast
 import math
-import regex
+import functools
 
-from regex import VERSION1
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Dict, List, Tuple, Match, TypeVar, Type, Generic
+from typing import Dict, List, Tuple, Match, TypeVar, Type, Generic, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import regex
 
 
 T = TypeVar("T")
@@ -208,11 +210,19 @@ def make_token(match: Match):
             )
 
 
-def tokenize(text: str) -> List[Token]:
+@functools.cache
+def tokenizer() -> regex.Pattern:
+    # `regex` is slow to import, only pay for it once there is something to parse
+    import regex
+
     regexes = [f"(?P<{type.name}>{type.value})" for type in TokenType]
     gigaregex = "|".join(regexes)
 
-    return list(map(make_token, regex.finditer(gigaregex, text, flags=VERSION1)))
+    return regex.compile(gigaregex, flags=regex.VERSION1)
+
+
+def tokenize(text: str) -> List[Token]:
+    return list(map(make_token, tokenizer().finditer(text)))
 
 
 def strip_comments(tokens: List[Token]) -> List[Token]:
@@ -1,18 +1,29 @@
 from __future__ import annotations
 
 import time
+import shutil
+import asyncio
 
+from assnouncer import trace
+from assnouncer import metrics
+from assnouncer import metadata
 from assnouncer.config import FFMPEG_DIR, FFMPEG_PATH, FFPROBE_PATH
+from assnouncer.supervisor import SUPERVISOR, ProcessRecord
 
-from typing import Callable
+from dataclasses import dataclass, field
+from collections import deque
+from typing import Awaitable, Callable, List, Tuple
 from enum import IntEnum
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from threading import Event, Thread
 from discord.opus import Encoder
 from discord import FFmpegOpusAudio, VoiceClient
 
 OPUS_DELAY = Encoder.FRAME_LENGTH / 1000.0
 
+READ_BATCH = 10
+
 
 class MusicState(IntEnum):
     INTERRUPTED = 0
@@ -20,72 +31,242 @@ class MusicState(IntEnum):
     CONTINUED = 2
 
 
-class AudioSource(FFmpegOpusAudio):
+async def private_copy(source_path: Path) -> Tuple[TemporaryDirectory, Path]:
+    """
+    Copies `source_path` into a new temporary directory, which deletes the copy when it
+    is garbage collected.
+    """
+    where = TemporaryDirectory()
+    load_path = Path(where.name) / "bingchillin.opus"
+    await asyncio.to_thread(shutil.copyfile, source_path, load_path)
+    return where, load_path
+
+
+class SourceFile:
+    """
+    A private copy of a song that is decoded by someone else, i.e. a shard worker. The
+    copy lives as long as this object, keep it referenced until the track finished.
+    """
+
     where: TemporaryDirectory
+    path: Path
+    # Seconds into the file where playback starts
+    offset: float = 0
+
+    def __init__(self, source: str, *, where: TemporaryDirectory, offset: float = 0):
+        self.where = where
+        self.path = Path(source)
+        self.offset = offset
+
+    @property
+    def position(self) -> float:
+        return self.offset
+
+    @classmethod
+    async def from_source(cls, source_path: Path, offset: float = 0) -> SourceFile:
+        where, load_path = await private_copy(source_path)
+        return cls(str(load_path), where=where, offset=offset)
+
+
+class AudioSource(FFmpegOpusAudio, SourceFile):
+    record: ProcessRecord = None
+    # Packets read since `offset`
+    packets: int = 0
 
-    def __init__(self, source: str, *, where: TemporaryDirectory, **kwargs):
+    def __init__(self, source: str, *, where: TemporaryDirectory, offset: float = 0, **kwargs):
+        if offset:
+            kwargs["before_options"] = f"-ss {offset:.2f}"
         super().__init__(source, **kwargs)
 
         self.where = where
+        self.path = Path(source)
+        self.offset = offset
+        self.record = SUPERVISOR.watch("ffmpeg-play", self._process)
+
+    @property
+    def position(self) -> float:
+        return self.offset + self.packets * OPUS_DELAY
+
+    def read(self) -> bytes:
+        data = super().read()
+        if data:
+            self.packets += 1
+        return data
+
+    def cleanup(self):
+        process = self._process
+        super().cleanup()
+
+        # Also called from __del__ after an explicit cleanup, release only once
+        if self.record is not None:
+            SUPERVISOR.release(self.record, getattr(process, "returncode", None))
+            self.record = None
 
     @classmethod
-    async def from_source(cls, source_path: Path, **kwargs):
-        where = TemporaryDirectory()
-        load_path = Path(where.name) / "bingchillin.opus"
-        load_path.write_bytes(source_path.read_bytes())
+    async def from_source(cls, source_path: Path, offset: float = 0, **kwargs) -> AudioSource:
+        where, load_path = await private_copy(source_path)
+
+        info = await metadata.index(source_path)
+        if info is None:
+            return await super().from_probe(
+                source=str(load_path),
+                executable=str(FFMPEG_PATH),
+                method="fallback",
+                where=where,
+                offset=offset,
+                **kwargs
+            )
 
-        return await super().from_probe(
-            source=str(load_path),
+        return cls(
+            str(load_path),
+            codec=info.codec,
+            bitrate=info.bitrate or 128,
             executable=str(FFMPEG_PATH),
-            method="fallback",
             where=where,
+            offset=offset,
             **kwargs
         )
 
 
-def play(
-    source: AudioSource,
-    reconnect_callback: Callable[[], VoiceClient],
-    state_callback: Callable[[], MusicState]
-):
-    client = reconnect_callback()
+@dataclass
+class PacketBuffer:
+    """
+    Single-producer/single-consumer queue of Opus packets. The event loop is the
+    only producer and the pacer thread the only consumer, so neither side ever
+    waits on the other while holding a lock.
+    """
 
-    loops: int = None
-    time_start: float = None
+    capacity: int = 25
+    packets: deque[Tuple[int, bytes]] = field(default_factory=deque)
+    readable: Event = field(default_factory=Event)
+    epoch: int = 0
 
-    def reset():
-        nonlocal loops
-        nonlocal time_start
+    def full(self) -> bool:
+        return len(self.packets) >= self.capacity
 
-        loops = 0
-        time_start = time.perf_counter()
+    def empty(self) -> bool:
+        return not self.packets
 
-    reset()
+    def put(self, data: bytes):
+        self.packets.append((self.epoch, data))
+        self.readable.set()
 
-    while True:
-        while not client.is_connected():
-            client = reconnect_callback()
-            time.sleep(0.1)
-            reset()
+    def flush(self):
+        self.epoch += 1
+
+    def get(self) -> Tuple[int, bytes]:
+        if not self.packets:
+            self.readable.clear()
+            if not self.packets:
+                self.readable.wait()
+
+        return self.packets.popleft()
+
+
+@dataclass
+class Pacer:
+    buffer: PacketBuffer = field(default_factory=PacketBuffer)
+    client: VoiceClient = None
+    thread: Thread = None
 
+    def start(self, name: str = "pacer"):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = Thread(target=self.run, name=name, daemon=True)
+            self.thread.start()
+
+    async def drained(self):
+        while not self.buffer.empty():
+            await asyncio.sleep(OPUS_DELAY)
+
+    def run(self):
+        loops: int = None
+        time_start: float = None
+        time_sent: float = None
+        epoch: int = None
+
+        def reset():
+            nonlocal loops
+            nonlocal time_start
+            nonlocal time_sent
+
+            loops = 0
+            time_start = time.perf_counter()
+            time_sent = None
+
+        reset()
+
+        while True:
+            if self.buffer.empty():
+                packet_epoch, data = self.buffer.get()
+                reset()
+            else:
+                packet_epoch, data = self.buffer.get()
+
+            if packet_epoch != self.buffer.epoch:
+                continue
+
+            if packet_epoch != epoch:
+                epoch = packet_epoch
+                reset()
+
+            client = self.client
+            while client is None or not client.is_connected():
+                time.sleep(0.1)
+                client = self.client
+                reset()
+
+            loops += 1
+
+            client.send_audio_packet(data, encode=False)
+
+            now = time.perf_counter()
+            if time_sent is not None:
+                metrics.PACING_JITTER.observe(abs(now - time_sent - OPUS_DELAY))
+            time_sent = now
+
+            time_next = time_start + OPUS_DELAY * loops
+            delay = max(0, OPUS_DELAY + (time_next - time.perf_counter()))
+
+            if delay > 0:
+                time.sleep(delay)
+
+
+def read_packets(source: AudioSource, count: int) -> List[bytes]:
+    packets = []
+    for _ in range(count):
         data = source.read()
         if not data:
             break
 
-        loops += 1
+        packets.append(data)
 
-        client.send_audio_packet(data, encode=not source.is_opus())
+    return packets
 
-        result = state_callback()
-        if result is MusicState.STOPPED:
-            break
 
-        if result is MusicState.INTERRUPTED:
-            reset()
-            continue
+async def play(
+    source: AudioSource,
+    pacer: Pacer,
+    reconnect_callback: Callable[[], Awaitable[VoiceClient]],
+    state_callback: Callable[[], Awaitable[MusicState]]
+) -> MusicState:
+    buffer = pacer.buffer
+
+    while True:
+        if pacer.client is None or not pacer.client.is_connected():
+            pacer.client = await reconnect_callback()
+
+        state = await state_callback()
+        if state is MusicState.STOPPED:
+            buffer.flush()
+            return MusicState.STOPPED
+
+        packets = await asyncio.to_thread(read_packets, source, READ_BATCH)
+        if not packets:
+            return MusicState.CONTINUED
 
-        time_next = time_start + OPUS_DELAY * loops
-        delay = max(0, OPUS_DELAY + (time_next - time.perf_counter()))
+        for data in packets:
+            buffer.put(data)
+        trace.first_packet()
 
-        if delay > 0:
-            time.sleep(delay)
+        while buffer.full():
+            await asyncio.sleep(OPUS_DELAY * buffer.capacity / 2)
@@ -0,0 +1,399 @@
+from __future__ import annotations
+
+import time
+import heapq
+import logging
+import itertools
+import multiprocessing
+
+from assnouncer.config import FFMPEG_PATH
+from assnouncer.audio.music import OPUS_DELAY, SourceFile
+from assnouncer.supervisor import SUPERVISOR, ProcessRecord
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Set, Tuple
+from concurrent.futures import Future
+from multiprocessing.connection import Connection, wait
+from multiprocessing.process import BaseProcess
+from threading import RLock, Thread
+from discord import FFmpegOpusAudio, VoiceClient
+
+logger = logging.getLogger(__name__)
+
+# Control plane messages are plain tuples, the first element is the opcode:
+#   main -> worker
+#     (VOICE, session, state)          attach or replace the voice transport
+#     (PLAY, session, token, path, s)  push a track, starting at s seconds
+#     (SKIP, session)                  drop the track on top of the stack
+#     (EXIT,)
+#   worker -> main
+#     (FINISHED, session, token)
+#     (PROGRESS, session, token, frames, sequence, timestamp, nonce)
+VOICE, PLAY, SKIP, EXIT, FINISHED, PROGRESS = range(6)
+
+PROGRESS_INTERVAL = 50
+
+
+class VoiceTransport:
+    """
+    The packet send path of a `VoiceClient`, detached from its gateway connection
+    so that it can live in a worker process.
+    """
+
+    checked_add = VoiceClient.checked_add
+    send_audio_packet = VoiceClient.send_audio_packet
+    _get_voice_packet = VoiceClient._get_voice_packet
+    _encrypt_xsalsa20_poly1305 = VoiceClient._encrypt_xsalsa20_poly1305
+    _encrypt_xsalsa20_poly1305_suffix = VoiceClient._encrypt_xsalsa20_poly1305_suffix
+    _encrypt_xsalsa20_poly1305_lite = VoiceClient._encrypt_xsalsa20_poly1305_lite
+
+    def __init__(self, state: Dict[str, Any]):
+        self.socket = state["socket"]
+        self.endpoint_ip = state["endpoint_ip"]
+        self.voice_port = state["voice_port"]
+        self.ssrc = state["ssrc"]
+        self.secret_key = state["secret_key"]
+        self.mode = state["mode"]
+        self.sequence = state["sequence"]
+        self.timestamp = state["timestamp"]
+        self._lite_nonce = state["nonce"]
+
+    @staticmethod
+    def capture(voice: VoiceClient) -> Dict[str, Any]:
+        return dict(
+            socket=voice.socket,
+            endpoint_ip=voice.endpoint_ip,
+            voice_port=voice.voice_port,
+            ssrc=voice.ssrc,
+            secret_key=voice.secret_key,
+            mode=voice.mode,
+            sequence=voice.sequence,
+            timestamp=voice.timestamp,
+            nonce=voice._lite_nonce
+        )
+
+    def close(self):
+        self.socket.close()
+
+
+@dataclass
+class WorkerTrack:
+    token: int
+    source: FFmpegOpusAudio
+    frames: int = 0
+
+
+@dataclass
+class WorkerSession:
+    id: int
+    transport: VoiceTransport = None
+    tracks: List[WorkerTrack] = field(default_factory=list)
+    loops: int = 0
+    time_start: float = 0
+
+    def reset(self):
+        self.loops = 0
+        self.time_start = time.perf_counter()
+
+    def deadline(self) -> float:
+        if self.transport is None or not self.tracks:
+            return None
+
+        return self.time_start + OPUS_DELAY * self.loops
+
+    def finish(self, conn: Connection):
+        track = self.tracks.pop()
+        track.source.cleanup()
+        conn.send((FINISHED, self.id, track.token))
+        self.reset()
+
+    def step(self, conn: Connection):
+        track = self.tracks[-1]
+
+        data = track.source.read()
+        if not data:
+            self.finish(conn)
+            return
+
+        try:
+            self.transport.send_audio_packet(data, encode=False)  # type: ignore
+        except OSError as e:
+            logger.warn(f"Dropped packet for {self.id}: {e}")
+
+        self.loops += 1
+        track.frames += 1
+
+        if track.frames % PROGRESS_INTERVAL == 0:
+            transport = self.transport
+            conn.send((
+                PROGRESS, self.id, track.token, track.frames,
+                transport.sequence, transport.timestamp, transport._lite_nonce
+            ))
+
+
+def worker_main(conn: Connection, executable: str):
+    sessions: Dict[int, WorkerSession] = {}
+
+    def handle(message: Tuple):
+        op, *args = message
+
+        if op == EXIT:
+            raise SystemExit
+
+        session_id = args[0]
+        session = sessions.get(session_id)
+        if session is None:
+            session = sessions[session_id] = WorkerSession(id=session_id)
+
+        if op == VOICE:
+            if session.transport is not None:
+                session.transport.close()
+            session.transport = VoiceTransport(args[1])
+            session.reset()
+        elif op == PLAY:
+            _, token, path, offset = args
+            before_options = f"-ss {offset:.2f}" if offset else None
+            source = FFmpegOpusAudio(path, codec="opus", executable=executable, before_options=before_options)
+            session.tracks.append(WorkerTrack(token=token, source=source))
+            session.reset()
+        elif op == SKIP:
+            if session.tracks:
+                session.finish(conn)
+
+    while True:
+        deadlines = [
+            (deadline, session.id)
+            for session in sessions.values()
+            if (deadline := session.deadline()) is not None
+        ]
+        heapq.heapify(deadlines)
+
+        timeout = None
+        if deadlines:
+            timeout = max(0, deadlines[0][0] - time.perf_counter())
+
+        if conn.poll(timeout):
+            handle(conn.recv())
+            continue
+
+        now = time.perf_counter()
+        while deadlines and deadlines[0][0] <= now:
+            _, session_id = heapq.heappop(deadlines)
+            sessions[session_id].step(conn)
+
+
+@dataclass
+class Track:
+    token: int
+    # Holds the file for as long as the track lives, a recovered worker opens it again
+    source: SourceFile
+    future: Future[None] = field(default_factory=Future)
+    # Seconds into the file that the current worker started at, and frames it sent since
+    offset: float = 0
+    frames: int = 0
+
+
+@dataclass
+class Session:
+    id: int
+    worker: Worker = None
+    voice: Dict[str, Any] = None
+    tracks: List[Track] = field(default_factory=list)
+
+    def find(self, token: int) -> Track:
+        for track in self.tracks:
+            if track.token == token:
+                return track
+        return None
+
+
+@dataclass(eq=False)
+class Worker:
+    index: int
+    process: BaseProcess
+    conn: Connection
+    record: ProcessRecord
+    sessions: Set[int] = field(default_factory=set)
+
+    def send(self, *message):
+        try:
+            self.conn.send(message)
+        except OSError as e:
+            logger.warn(f"Player worker #{self.index} is unreachable: {e}")
+
+
+@dataclass
+class ShardPool:
+    """
+    Runs the packet pacing and send path of every voice session inside a pool of
+    worker processes, one session per guild. The event loop and player threads only
+    exchange small control messages with the workers.
+    """
+
+    size: int
+    workers: List[Worker] = field(default_factory=list)
+    sessions: Dict[int, Session] = field(default_factory=dict)
+    lock: RLock = field(default_factory=RLock)
+    tokens: itertools.count = field(default_factory=itertools.count)
+    thread: Thread = None
+    closed: bool = False
+
+    def start(self):
+        with self.lock:
+            self.workers = [self.spawn(index) for index in range(self.size)]
+
+        self.thread = Thread(target=self.monitor, name="shard-monitor", daemon=True)
+        self.thread.start()
+
+    def spawn(self, index: int) -> Worker:
+        context = multiprocessing.get_context("spawn")
+        conn, child_conn = context.Pipe()
+        process = context.Process(
+            target=worker_main,
+            args=(child_conn, str(FFMPEG_PATH)),
+            name=f"player-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+
+        logger.info(f"Started player worker #{index} (pid {process.pid})")
+        record = SUPERVISOR.register("player-worker", f"player worker #{index}", process.pid, group=False)
+        return Worker(index=index, process=process, conn=conn, record=record)
+
+    def assign(self, session: Session):
+        worker = min(self.workers, key=lambda w: len(w.sessions))
+        worker.sessions.add(session.id)
+        session.worker = worker
+
+        if session.voice is not None:
+            worker.send(VOICE, session.id, session.voice)
+
+        for track in session.tracks:
+            # The new worker counts frames from where it starts
+            track.offset += track.frames * OPUS_DELAY
+            track.frames = 0
+            worker.send(PLAY, session.id, track.token, str(track.source.path), track.offset)
+
+    def session(self, session_id: int) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = Session(id=session_id)
+            self.assign(session)
+        return session
+
+    def attach(self, session_id: int, voice: VoiceClient):
+        with self.lock:
+            session = self.session(session_id)
+            previous = session.voice
+
+            state = VoiceTransport.capture(voice)
+            if previous is not None and previous["socket"] is state["socket"]:
+                return
+
+            session.voice = state
+            session.worker.send(VOICE, session_id, state)
+
+    def play(self, session_id: int, source: SourceFile) -> Future[None]:
+        with self.lock:
+            session = self.session(session_id)
+            track = Track(token=next(self.tokens), source=source, offset=source.offset)
+            session.tracks.append(track)
+            session.worker.send(PLAY, session_id, track.token, str(source.path), track.offset)
+
+        return track.future
+
+    def skip(self, session_id: int):
+        with self.lock:
+            session = self.session(session_id)
+            session.worker.send(SKIP, session_id)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            for worker in self.workers:
+                worker.send(EXIT)
+
+    def finish(self, session: Session, token: int):
+        track = session.find(token)
+        if track is None:
+            return
+
+        session.tracks.remove(track)
+        track.future.set_result(None)
+
+    def receive(self, worker: Worker, message: Tuple):
+        op, session_id, token, *args = message
+        session = self.sessions.get(session_id)
+        if session is None or session.worker is not worker:
+            return
+
+        if op == FINISHED:
+            self.finish(session, token)
+        elif op == PROGRESS:
+            frames, sequence, timestamp, nonce = args
+            track = session.find(token)
+            if track is not None:
+                track.frames = frames
+            if session.voice is not None:
+                session.voice.update(sequence=sequence, timestamp=timestamp, nonce=nonce)
+
+    def recover(self, worker: Worker):
+        # Called without the lock, the event loop takes it to play and skip and must not
+        # wait for the dead process to be reaped or for its replacement to start
+        with self.lock:
+            worker.conn.close()
+
+        worker.process.join(timeout=1.0)
+        SUPERVISOR.release(worker.record, worker.process.exitcode)
+        logger.warn(
+            f"Player worker #{worker.index} died with exit code {worker.process.exitcode}, "
+            f"redistributing its session(s)"
+        )
+        replacement = self.spawn(worker.index)
+
+        with self.lock:
+            if self.closed:
+                replacement.send(EXIT)
+                replacement.process.join(timeout=1.0)
+                SUPERVISOR.release(replacement.record, replacement.process.exitcode)
+                return
+
+            self.workers[worker.index] = replacement
+
+            # Including sessions assigned to the dead worker in the meantime, their tracks are sent again
+            for session_id in worker.sessions:
+                self.assign(self.sessions[session_id])
+
+    def monitor(self):
+        while not self.closed:
+            with self.lock:
+                workers = list(self.workers)
+
+            handles: Dict[Any, Worker] = {}
+            for worker in workers:
+                handles[worker.conn] = worker
+                handles[worker.process.sentinel] = worker
+
+            for ready in wait(list(handles)):
+                worker = handles[ready]
+                with self.lock:
+                    if self.closed or worker not in self.workers:
+                        continue
+
+                    if ready is worker.conn:
+                        try:
+                            self.receive(worker, worker.conn.recv())
+                            continue
+                        except (EOFError, OSError):
+                            pass
+
+                self.recover(worker)
+
+        # Closed, the workers exit once they read EXIT
+        with self.lock:
+            workers = list(self.workers)
+
+        for worker in workers:
+            worker.process.join(timeout=1.0)
+            SUPERVISOR.release(worker.record, worker.process.exitcode)
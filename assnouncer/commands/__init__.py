@@ -1,19 +1,3 @@
 from __future__ import annotations
 
-import assnouncer.commands.ass
-import assnouncer.commands.parse
-import assnouncer.commands.print
-import assnouncer.commands.help
-import assnouncer.commands.search
-import assnouncer.commands.download
-import assnouncer.commands.play
-import assnouncer.commands.queue
-import assnouncer.commands.stop
-import assnouncer.commands.next
-import assnouncer.commands.settheme
-import assnouncer.commands.dumb
-import assnouncer.commands.apricot
-import assnouncer.commands.math
-import assnouncer.commands.update
-
 from assnouncer.commands.base import BaseCommand
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from assnouncer.asspp import String
 from assnouncer.commands.base import BaseCommand
+from assnouncer.outbox import Priority
 
 from dataclasses import dataclass
 from typing import List, ClassVar
@@ -21,7 +22,7 @@ class Ass(BaseCommand):
         """
         try:
             command = BaseCommand.parse(payload.value)
-            result = await BaseCommand.run(self.ass, self.message, command)
+            result = await BaseCommand.run(self.ass, self.message, command, batch=self.batch)
 
             if result is not None:
                 await self.respond(f"Command result: {result}")
@@ -30,4 +31,4 @@ class Ass(BaseCommand):
                 f"Could not run command:\n"
                 f"    {e.__class__.__name__}: {e}"
             )
-            await self.respond(f"```{message}```")
+            await self.respond(f"```{message}```", priority=Priority.ERROR)
@@ -1,24 +1,32 @@
 from __future__ import annotations
 
+import re
 import inspect
 import logging
+import importlib
 
 from assnouncer import asspp
-from assnouncer import util
+from assnouncer import trace
 from assnouncer.asspp import Command, Null, Timestamp, String, Identifier, Number, Value, Expression
 from assnouncer.metaclass import Descriptor
+from assnouncer.outbox import Priority
+from assnouncer.commands import manifest
 
 from dataclasses import dataclass
-from typing import TYPE_CHECKING, Any, ClassVar, List, Tuple, Type
+from typing import TYPE_CHECKING, Any, ClassVar, Dict, List, Tuple, Type
 from discord import Message
 
 if TYPE_CHECKING:
     from assnouncer.assnouncer import Assnouncer
-    
+    from assnouncer.player import Player
+    from assnouncer.commands.batch import Batch
+
     from discord.abc import MessageableChannel
 
 logger = logging.getLogger(__name__)
 
+COMMAND_NAME = re.compile(r"\s*(\w+)")
+
 
 @dataclass
 class Parameter:
@@ -146,18 +154,29 @@ class Help:
 @dataclass
 class BaseCommand(metaclass=Descriptor):
     ALIASES: ClassVar[List[str]]
+    VOICE: ClassVar[bool] = False
+
+    COMMANDS: ClassVar[Dict[str, Type[BaseCommand]]] = {}
 
     on_command: ClassVar[Any]
 
     ass: Assnouncer
     message: Message
     channel: MessageableChannel = None
+    batch: Batch = None
 
     def __post_init__(self):
         self.channel = self.message.channel
 
-    async def respond(self, message: str):
-        await self.ass.message(message, channel=self.channel)
+    @property
+    def player(self) -> Player:
+        return self.ass.get_player(self.message.guild.id)
+
+    async def respond(self, message: str, priority: Priority = Priority.RESPONSE):
+        if self.batch is not None:
+            self.batch.respond(message)
+        else:
+            await self.ass.message(message, channel=self.channel, priority=priority)
 
     @classmethod
     def validate(cls):
@@ -169,10 +188,27 @@ class BaseCommand(metaclass=Descriptor):
         assert isinstance(cls.ALIASES, list), msg
         assert all(isinstance(k, str) for k in cls.ALIASES), msg
 
+    @classmethod
+    def register(cls):
+        if cls == BaseCommand:
+            return
+
+        for alias in cls.ALIASES:
+            module = manifest.ALIASES.get(alias)
+            assert module == cls.__module__, f"Alias '{alias}' of {cls.__name__} is not in commands/manifest.py"
+
+            other = BaseCommand.COMMANDS.setdefault(alias, cls)
+            assert other is cls, f"Alias '{alias}' of {cls.__name__} is already used by {other.__name__}"
+
     @staticmethod
     def parse(content: str) -> Command:
         return asspp.parse(content)
 
+    @staticmethod
+    def is_command(content: str) -> bool:
+        match = COMMAND_NAME.match(content)
+        return match is not None and match.group(1) in manifest.ALIASES
+
     @staticmethod
     def can_run(content: str) -> bool:
         try:
@@ -191,13 +227,26 @@ class BaseCommand(metaclass=Descriptor):
 
     @staticmethod
     def find_command(name: Identifier) -> Type[BaseCommand]:
-        for command_type in util.subclasses(BaseCommand):
-            if command_type.accept(name):
-                return command_type
-        return None
+        command_type = BaseCommand.COMMANDS.get(name.value)
+        if command_type is None:
+            module = manifest.ALIASES.get(name.value)
+            if module is None:
+                return None
+
+            importlib.import_module(module)
+            command_type = BaseCommand.COMMANDS.get(name.value)
+
+        return command_type
 
     @staticmethod
-    async def run(ass: Assnouncer, message: Message, expression: Expression) -> Value:
+    def load_all() -> List[Type[BaseCommand]]:
+        for module in dict.fromkeys(manifest.ALIASES.values()):
+            importlib.import_module(module)
+
+        return list(dict.fromkeys(BaseCommand.COMMANDS[alias] for alias in manifest.ALIASES))
+
+    @staticmethod
+    async def run(ass: Assnouncer, message: Message, expression: Expression, batch: Batch = None) -> Value:
         if isinstance(expression, Null):
             return None
 
@@ -207,7 +256,7 @@ class BaseCommand(metaclass=Descriptor):
         if not isinstance(expression, Command):
             raise TypeError("Cannot evaluate expression")
 
-        name = await BaseCommand.run(ass, message, expression.callable)
+        name = await BaseCommand.run(ass, message, expression.callable, batch=batch)
         if not isinstance(name, Identifier):
             raise TypeError("Callable experssion must result in identifier")
 
@@ -226,19 +275,23 @@ class BaseCommand(metaclass=Descriptor):
 
         evaluated_args: List[Value] = []
         for arg in args:
-            arg = await BaseCommand.run(ass, message, arg)
+            arg = await BaseCommand.run(ass, message, arg, batch=batch)
             evaluated_args.append(arg)
 
         evaluated_kwargs: List[Tuple[Value, Value]] = []
         for key, value in kwargs:
-            key = await BaseCommand.run(ass, message, key)
-            value = await BaseCommand.run(ass, message, value)
+            key = await BaseCommand.run(ass, message, key, batch=batch)
+            value = await BaseCommand.run(ass, message, value, batch=batch)
             evaluated_kwargs.append((key, value))
 
         help.validate(evaluated_args, evaluated_kwargs)
 
-        instance = command_type(ass=ass, message=message)
-        result = await instance.on_command(*evaluated_args, **{k.value: v for k, v in evaluated_kwargs})
+        if command_type.VOICE:
+            await ass.get_player(message.guild.id).ensure_connected()
+
+        instance = command_type(ass=ass, message=message, batch=batch)
+        with trace.span(command_type.__name__):
+            result = await instance.on_command(*evaluated_args, **{k.value: v for k, v in evaluated_kwargs})
 
         if result is not None and not isinstance(result, Value):
             raise TypeError("Commands must return wrapped values or None")
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from assnouncer import util
+from assnouncer import config
+from assnouncer.asspp import Command
+from assnouncer.commands.base import BaseCommand
+from assnouncer.outbox import MESSAGE_LIMIT
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, List, Tuple
+from discord import Message
+
+if TYPE_CHECKING:
+    from assnouncer.assnouncer import Assnouncer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Batch:
+    """
+    Runs every line of a ```ass block as one unit: all lines are parsed up front,
+    searches run concurrently in the background while songs keep their place in the
+    queue, and the outcome is reported in a single summary message.
+    """
+
+    ass: Assnouncer
+    message: Message
+    lines: List[str]
+    line: int = 0
+    errors: List[str] = field(default_factory=list)
+    output: List[str] = field(default_factory=list)
+    searches: List[Tuple[int, str, asyncio.Future[str]]] = field(default_factory=list)
+    semaphore: asyncio.Semaphore = field(default_factory=lambda: asyncio.Semaphore(config.BATCH_CONCURRENCY))
+
+    def parse(self) -> List[Tuple[int, Command]]:
+        commands = []
+        for idx, line in enumerate(self.lines, start=1):
+            if line.lstrip().startswith("#"):
+                continue
+
+            if not BaseCommand.is_command(line):
+                self.errors.append(f"Line {idx}: Unknown command {line.split()[0]!r}")
+                continue
+
+            try:
+                commands.append((idx, BaseCommand.parse(line)))
+            except (SyntaxError, TypeError) as e:
+                self.errors.append(f"Line {idx}: {e.__class__.__name__}: {e}")
+
+        return commands
+
+    def respond(self, message: str):
+        self.output.append(f"Line {self.line}: {message}")
+
+    def resolve(self, query: str) -> asyncio.Future[str]:
+        async def bounded_resolve() -> str:
+            async with self.semaphore:
+                return await util.resolve_uri(query)
+
+        future = asyncio.ensure_future(bounded_resolve())
+        self.searches.append((self.line, query, future))
+        return future
+
+    def format(self, commands: int, songs: int, missing: List[str]) -> str:
+        parts = [f"Ran {commands}/{len(self.lines)} command(s), queued {songs - len(missing)} song(s)."]
+        if missing:
+            parts.append("No source found:")
+            parts.extend(f"  {entry}" for entry in missing)
+        if self.errors:
+            parts.append("Errors:")
+            parts.extend(f"  {entry}" for entry in self.errors)
+        if self.output:
+            parts.append("Output:")
+            parts.extend(f"  {entry}" for entry in self.output)
+
+        summary = "\n".join(parts)
+        if len(summary) > MESSAGE_LIMIT - 10:
+            summary = summary[:MESSAGE_LIMIT - 14] + "\n..."
+
+        return f"```{summary}```"
+
+    async def run(self):
+        commands = self.parse()
+
+        ran = 0
+        for idx, command in commands:
+            self.line = idx
+            try:
+                logger.info(f"Trying to run '{command}'")
+                await BaseCommand.run(self.ass, self.message, command, batch=self)
+                ran += 1
+            except (SyntaxError, TypeError) as e:
+                logger.warn(f"Command #{idx}: {e}")
+                self.errors.append(f"Line {idx}: {e.__class__.__name__}: {e}")
+
+        missing: List[str] = []
+        for idx, query, future in self.searches:
+            try:
+                uri = await future
+            except Exception as e:
+                # One failed search must not cost the summary of the others
+                logger.warning(f"Search for {query!r} on line {idx} failed: {e!r}")
+                uri = None
+
+            if uri is None:
+                missing.append(f"Line {idx}: {query!r}")
+
+        await self.ass.message(self.format(ran, len(self.searches), missing), channel=self.message.channel)
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from assnouncer import debug
+from assnouncer.asspp import Identifier
+from assnouncer.commands.base import BaseCommand
+
+from dataclasses import dataclass
+from typing import List, ClassVar
+
+
+@dataclass
+class Debug(BaseCommand):
+    ALIASES: ClassVar[List[str]] = ["debug"]
+
+    async def on_command(self, mode: Identifier = None):
+        """
+        Turn profiling of `debug.profiled` functions on or off, or print its report.
+
+        :param mode: (Optional) on or off, prints the report if absent.
+        """
+        if mode is None:
+            await self.respond(f"```{debug.format_report()}```")
+        elif mode.value == "on":
+            debug.enable()
+            await self.respond("Profiling enabled.")
+        elif mode.value == "off":
+            debug.disable()
+            await self.respond("Profiling disabled.")
+        else:
+            await self.respond(f"Unknown mode {mode.value!r}, expected on or off.")
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from assnouncer.downloaders import stats
+from assnouncer.commands.base import BaseCommand
+
+from dataclasses import dataclass
+from typing import List, ClassVar
+
+
+@dataclass
+class Downloads(BaseCommand):
+    ALIASES: ClassVar[List[str]] = ["downloads", "dlstats"]
+
+    async def on_command(self):
+        """
+        Print timings and throughput of the most recent downloads.
+        """
+        if not stats.HISTORY.entries:
+            await self.respond("No downloads yet.")
+            return
+
+        await self.respond(f"```{stats.HISTORY.format()}```")
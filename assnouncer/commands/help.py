@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-from assnouncer import util
 from assnouncer.asspp import Identifier
 from assnouncer.commands.base import BaseCommand
 
@@ -27,7 +26,7 @@ class Help(BaseCommand):
                 aliases = ", ".join(command_type.ALIASES)
                 return f" - {aliases}"
 
-            command_types = util.subclasses(BaseCommand)
+            command_types = BaseCommand.load_all()
             commands = "\n".join(map(format_aliases, command_types))
             message = (
                 f"Assnouncer has the following commands:\n"
@@ -0,0 +1,39 @@
+"""
+Which module defines which command aliases. The prefilter and dispatch only need
+this, a command module is imported the first time one of its aliases is run.
+"""
+from __future__ import annotations
+
+from typing import Dict, List
+
+MODULES: Dict[str, List[str]] = {
+    "ass": ["ass"],
+    "parse": ["parse"],
+    "print": ["print"],
+    "help": ["help", "halp", "хелп", "халп"],
+    "search": ["search", "find"],
+    "download": ["download", "dl"],
+    "downloads": ["downloads", "dlstats"],
+    "play": ["play", "Play", "плаъ", "πλαυ", "playing"],
+    "queue": ["queue", "Queue", "q", "яуеуе"],
+    "stop": ["stop", "Stop", "dilyankata"],
+    "next": ["next", "Next", "skip", "Skip", "маняк"],
+    "settheme": ["settheme", "set_theme"],
+    "dumb": ["dumb", "мамкамуипрасе", "dumbdumb"],
+    "apricot": ["кайсий", "кайсии", "apricot"],
+    "math.add": ["add", "sum"],
+    "math.sub": ["sub"],
+    "math.mul": ["mul"],
+    "math.div": ["div"],
+    "math.mod": ["mod"],
+    "update": ["update"],
+    "processes": ["processes", "procs", "ps"],
+    "debug": ["debug"],
+    "profile": ["profile", "prof"],
+}
+
+ALIASES: Dict[str, str] = {
+    alias: f"assnouncer.commands.{module}"
+    for module, aliases in MODULES.items()
+    for alias in aliases
+}
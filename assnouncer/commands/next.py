@@ -14,4 +14,4 @@ class Next(BaseCommand):
         """
         Skip the current song.
         """
-        self.ass.skip()
+        self.player.skip()
@@ -5,9 +5,11 @@ import logging
 from assnouncer import util
 from assnouncer.asspp import String, Timestamp
 from assnouncer.commands.base import BaseCommand
+from assnouncer.util import SongRequest
+from assnouncer.outbox import Priority
 
 from dataclasses import dataclass
-from typing import List, ClassVar
+from typing import Awaitable, List, ClassVar
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +17,14 @@ logger = logging.getLogger(__name__)
 @dataclass
 class Play(BaseCommand):
     ALIASES: ClassVar[List[str]] = ["play", "Play", "плаъ", "πλαυ", "playing"]
+    VOICE: ClassVar[bool] = True
+
+    async def download(self, query: str, uri: Awaitable[str], start: Timestamp, stop: Timestamp) -> SongRequest:
+        resolved = await uri
+        if resolved is None:
+            return None
+
+        return await util.download(query, resolved, start=start, stop=stop, channel=self.channel)
 
     async def on_command(self, payload: String, start: Timestamp = None, stop: Timestamp = None):
         """
@@ -24,10 +34,28 @@ class Play(BaseCommand):
         :param start: (Optional) Start timestamp within the song.
         :param stop: (Optional) End timestamp within the song.
         """
+        if self.batch is not None:
+            pending = self.batch.resolve(payload.value)
+            await self.player.queue_song(
+                self.download(payload.value, pending, start, stop),
+                query=payload.value,
+                start=start,
+                stop=stop,
+                channel=self.channel
+            )
+            return
+
         uri = await util.resolve_uri(payload.value)
         if uri is None:
             logger.warn(f"No source found for '{payload.value}'")
-            await self.respond("No source found - skipping song")
+            await self.respond("No source found - skipping song", priority=Priority.ERROR)
         else:
             request = util.download(payload.value, uri, start=start, stop=stop, channel=self.channel)
-            await self.ass.queue_song(request)
+            await self.player.queue_song(
+                request,
+                query=payload.value,
+                uri=uri,
+                start=start,
+                stop=stop,
+                channel=self.channel
+            )
@@ -18,5 +18,5 @@ class Print(BaseCommand):
         :param payload: The command line for another command.
         """
         command = BaseCommand.parse(payload.value)
-        result = await BaseCommand.run(self.ass, self.message, command)
+        result = await BaseCommand.run(self.ass, self.message, command, batch=self.batch)
         await self.respond(repr(result))
@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+from assnouncer.supervisor import SUPERVISOR
+from assnouncer.commands.base import BaseCommand
+
+from dataclasses import dataclass
+from typing import List, ClassVar
+
+
+@dataclass
+class Processes(BaseCommand):
+    ALIASES: ClassVar[List[str]] = ["processes", "procs", "ps"]
+
+    async def on_command(self):
+        """
+        Print resource usage of child processes and the top consumers.
+        """
+        await self.respond(f"```{SUPERVISOR.format()}```")
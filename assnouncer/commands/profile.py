@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from assnouncer import sampler
+from assnouncer.asspp import Number
+from assnouncer.commands.base import BaseCommand
+
+from dataclasses import dataclass
+from typing import List, ClassVar
+
+
+@dataclass
+class Profile(BaseCommand):
+    ALIASES: ClassVar[List[str]] = ["profile", "prof"]
+
+    async def on_command(self, seconds: Number = None):
+        """
+        Sample what every thread of the bot is doing, save the stacks for a flamegraph
+        and print the busiest frames. Safe to run while music is playing.
+
+        :param seconds: (Optional) How long to sample for, 10 seconds if absent.
+        """
+        duration = 10.0 if seconds is None else float(seconds.value)
+        if not 0 < duration <= sampler.MAX_DURATION:
+            await self.respond(f"Can only profile for up to {sampler.MAX_DURATION:.0f} seconds.")
+            return
+
+        if sampler.LOCK.locked():
+            await self.respond("Already profiling, wait for it to finish.")
+            return
+
+        await self.respond(f"Profiling for {duration:g} seconds.")
+        result, path = await sampler.profile(duration)
+        await self.respond(f"```{result.format()}\n\nStacks saved to {path}```")
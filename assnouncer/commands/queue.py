@@ -18,12 +18,18 @@ class Queue(BaseCommand):
         """
         def stringify(fuck_you: Tuple[int, Future[SongRequest]]) -> str:
             idx, future = fuck_you
-            song = future.result()
+            if not future.done():
+                return f"{idx}: (still downloading)"
+
+            song = future.result() if future.exception() is None else None
+            if song is None:
+                return f"{idx}: (failed)"
+
             if song.uri == song.query:
                 return f"{idx}: {song.uri}"
             return f"{idx}: {song.uri} ({song.query})"
 
-        queue_content = "\n".join(map(stringify, enumerate(self.ass.song_queue)))
+        queue_content = "\n".join(map(stringify, enumerate(self.player.song_queue)))
         if not queue_content:
             queue_content = "Queue is empty."
         await self.respond(f"```{queue_content}```")
@@ -14,4 +14,4 @@ class Stop(BaseCommand):
         """
         Tell Assnouncer to shut up.
         """
-        self.ass.stop()
+        self.player.stop()
@@ -1,7 +1,6 @@
 from __future__ import annotations
 
-import asyncio
-
+from assnouncer.supervisor import SUPERVISOR
 from assnouncer.commands.base import BaseCommand
 
 from dataclasses import dataclass
@@ -16,4 +15,4 @@ class Update(BaseCommand):
         """
         Update yt-dlp which has been a pain in the ass(nouncer) for some time.
         """
-        await asyncio.create_subprocess_shell("pip install -U yt-dlp")
+        await SUPERVISOR.run("pip", "pip install -U yt-dlp")
@@ -3,7 +3,7 @@ from __future__ import annotations
 import os
 
 from pathlib import Path
-from typing import Any
+from typing import Any, List
 
 
 def env(k: str, d: Any = None):
@@ -13,15 +13,70 @@ def env(k: str, d: Any = None):
 HERE = Path(".")
 
 DOWNLOAD_DIR = HERE / "downloads"
-DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
-
 THEMES_DIR = HERE / "themes"
-THEMES_DIR.mkdir(parents=True, exist_ok=True)
 
 TOKEN_PATH = HERE / "token"
 
+METADATA_PATH = HERE / "metadata.sqlite3"
+
+# Queue journals, one per guild, replayed on startup
+JOURNAL_DIR = HERE / "journal"
+
+# Collapsed stacks written by the profile command
+PROFILES_DIR = HERE / "profiles"
+
 FFMPEG_DIR = Path(env("FFMPEG_DIR", "C:/Users/Admin/Documents/Applications/"))
 FFMPEG_PATH = FFMPEG_DIR / "ffmpeg.exe"
 FFPROBE_PATH = FFMPEG_DIR / "ffprobe.exe"
 
-GUILD_ID = 642747343208185857
+# Number of searches a ```ass block may run at the same time
+BATCH_CONCURRENCY = int(env("ASS_BATCH_CONCURRENCY", 4))
+
+# Seconds to wait for more messages to the same channel before sending them as one
+OUTBOX_WINDOW = float(env("ASS_OUTBOX_WINDOW", 0.25))
+
+# "inprocess" downloads through yt-dlp's Python API in a pool of YTDLP_WORKERS processes
+# instead of running the yt-dlp executable for every download
+YTDLP_BACKEND = env("ASS_YTDLP_BACKEND", "subprocess")
+YTDLP_WORKERS = int(env("ASS_YTDLP_WORKERS", 2))
+
+# Downloads are normalized to this integrated loudness (LUFS) once, when they are ingested
+LOUDNESS_TARGET = float(env("ASS_LOUDNESS_TARGET", -16))
+NORMALIZE_LOUDNESS = env("ASS_NORMALIZE_LOUDNESS", "1") == "1"
+
+# Leading and trailing audio quieter than SILENCE_THRESHOLD (dBFS) is cut at ingest time,
+# if there is at least SILENCE_MINIMUM seconds of it on either end
+TRIM_SILENCE = env("ASS_TRIM_SILENCE", "1") == "1"
+SILENCE_THRESHOLD = float(env("ASS_SILENCE_THRESHOLD", -50))
+SILENCE_MINIMUM = float(env("ASS_SILENCE_MINIMUM", 0.3))
+
+# Chrome trace events of every chat request are appended to this file, tracing is off if unset
+TRACE_PATH = env("ASS_TRACE_PATH")
+
+# Prometheus metrics are served on http://127.0.0.1:METRICS_PORT/metrics if set
+METRICS_PORT = env("ASS_METRICS_PORT")
+
+# Event loop stalls longer than this many seconds are logged with the blocking stack, 0 disables
+LOOP_LAG_THRESHOLD = float(env("ASS_LOOP_LAG_THRESHOLD", 0.25))
+
+# Log records waiting for the writer thread before new ones are dropped
+LOG_QUEUE_SIZE = int(env("ASS_LOG_QUEUE_SIZE", 10000))
+
+# Also log to this file, rotated after LOG_MAX_BYTES with LOG_BACKUPS old files kept
+LOG_PATH = env("ASS_LOG_PATH")
+LOG_MAX_BYTES = int(env("ASS_LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUPS = int(env("ASS_LOG_BACKUPS", 3))
+
+# Number of worker processes that pace and send audio packets, 0 keeps playback in-process
+PLAYER_SHARDS = int(env("ASS_PLAYER_SHARDS", 0))
+
+GUILD_IDS: List[int] = [642747343208185857]
+
+
+def init():
+    """
+    Creates the cache directories. Importing the config has no side effects, this is
+    called once at startup.
+    """
+    for directory in (DOWNLOAD_DIR, THEMES_DIR):
+        directory.mkdir(parents=True, exist_ok=True)
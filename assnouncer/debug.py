@@ -1,32 +1,122 @@
 from __future__ import annotations
-from collections import defaultdict
 
-import numpy as np
+import os
+import math
 import time
+import inspect
 import datetime
+import functools
+import threading
 
-from dataclasses import dataclass
-from typing import Callable, ClassVar, List, Tuple, TypeVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Generator, List, TypeVar
 
 T = TypeVar("T")
 U = TypeVar("U")
 
 
-PROFILE_DATA: defaultdict[Callable, List[ProfileEntry]] = defaultdict(list)
+ENABLE_DEBUGGING = os.environ.get("ASS_DEBUG") == "1"
 
-ENABLE_DEBUGGING = False
+# Histogram buckets grow by BUCKET_GROWTH, starting at BUCKET_MIN seconds,
+# which gives about 9% precision for every duration up to an hour
+BUCKET_MIN = 1e-6
+BUCKET_GROWTH = 2 ** (1 / 8)
+BUCKET_COUNT = 256
+
+
+def enable():
+    global ENABLE_DEBUGGING
+    ENABLE_DEBUGGING = True
+
+
+def disable():
+    global ENABLE_DEBUGGING
+    ENABLE_DEBUGGING = False
+
+
+def enabled() -> bool:
+    return ENABLE_DEBUGGING
+
+
+@dataclass(slots=True)
+class Stats:
+    """
+    Constant memory summary of a stream of durations.
+    """
+
+    count: int = 0
+    total: float = 0
+    min: float = math.inf
+    max: float = 0
+    buckets: List[int] = field(default_factory=lambda: [0] * BUCKET_COUNT)
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+        index = 0
+        if value > BUCKET_MIN:
+            index = min(BUCKET_COUNT - 1, int(math.log(value / BUCKET_MIN, BUCKET_GROWTH)))
+        self.buckets[index] += 1
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
+
+    def quantile(self, q: float) -> float:
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                # Geometric middle of the bucket, clamped to what has actually been seen
+                value = BUCKET_MIN * BUCKET_GROWTH ** (index + 0.5)
+                return min(self.max, max(self.min, value))
+        return self.max
+
+
+@dataclass(slots=True)
+class Profile:
+    # Wall time of every call
+    total: Stats = field(default_factory=Stats)
+    # Time spent running the function itself, without nested profiled calls or awaits
+    active: Stats = field(default_factory=Stats)
+    # Coroutines only, time spent suspended in awaits
+    waiting: Stats = None
+
+    def clear(self):
+        self.total = Stats()
+        self.active = Stats()
+        if self.waiting is not None:
+            self.waiting = Stats()
+
+
+PROFILE_DATA: Dict[Callable, Profile] = {}
 
 
-@dataclass
 class Timer:
-    start: float = 0
-    stop: float = 0
-    deduction: float = 0
+    """
+    Nesting-aware stopwatch. Time spent in an inner timer is deducted from the active
+    time of the one it runs inside. Coroutine steps never interleave on one thread, so
+    a per-thread stack suffices.
+    """
+
+    STACKS = threading.local()
+
+    __slots__ = ("start", "stop", "deduction")
 
-    ACTIVE_TIMERS: ClassVar[List[Timer]] = []
+    def __init__(self):
+        self.start = 0.0
+        self.stop = 0.0
+        self.deduction = 0.0
 
-    def deduct(self, amount: float):
-        self.deduction += amount
+    @staticmethod
+    def stack() -> List[Timer]:
+        stack = getattr(Timer.STACKS, "stack", None)
+        if stack is None:
+            stack = Timer.STACKS.stack = []
+        return stack
 
     def total_time(self) -> float:
         return self.stop - self.start
@@ -35,81 +125,135 @@ class Timer:
         return self.total_time() - self.deduction
 
     def __enter__(self) -> Timer:
-        Timer.ACTIVE_TIMERS.append(self)
-
+        Timer.stack().append(self)
         self.deduction = 0
         self.start = time.perf_counter()
-
         return self
 
     def __exit__(self, *_):
         self.stop = time.perf_counter()
 
-        Timer.ACTIVE_TIMERS.pop()
-        if Timer.ACTIVE_TIMERS:
-            Timer.ACTIVE_TIMERS[-1].deduct(self.total_time())
+        stack = Timer.stack()
+        stack.pop()
+        if stack:
+            stack[-1].deduction += self.total_time()
 
 
-@dataclass(slots=True)
-class ProfileEntry:
-    total_time: float
-    active_time: float
-
-
-if ENABLE_DEBUGGING:
-    def print_report(reset: bool = True):
-        def format_time(time: float) -> str:
-            return str(datetime.timedelta(seconds=time))
-
-        def get_times(data: np.ndarray) -> Tuple[str, str, str]:
-            min = data.min()
-            max = data.max()
-            mean = data.mean()
-            min, max, mean = map(format_time, (min, max, mean))
-            return min, max, mean
-
-        parts = ["[debug] Profiling report:"]
-        for func, entries in PROFILE_DATA.items():
-            data = np.array([(entry.total_time, entry.active_time) for entry in entries])
-            total_time = data[:, 0]
-            active_time = data[:, 1]
-            total = get_times(total_time)
-            active = get_times(active_time)
-            parts.extend([
-                f"[debug]   Function: {func.__qualname__}",
-                f"[debug]     Count:    {len(entries)}",
-                f"[debug]     Min:      {total[0]} ({active[0]})",
-                f"[debug]     Max:      {total[1]} ({active[1]})",
-                f"[debug]     Mean:     {total[2]} ({active[2]})"
-            ])
-
-            if reset:
-                entries.clear()
-        print("\n".join(parts))
-
-    def profiled(func: Callable) -> Callable:
-        data = PROFILE_DATA[func]
-
-        def wrapper(*args, **kwargs):
-            with Timer():
+class ProfiledCoroutine:
+    """
+    Drives a coroutine step by step, timing each step separately from the time the
+    coroutine spends suspended.
+    """
+
+    __slots__ = ("coro", "profile")
+
+    def __init__(self, coro: Any, profile: Profile):
+        self.coro = coro
+        self.profile = profile
+
+    def __await__(self) -> Generator[Any, Any, Any]:
+        start = time.perf_counter()
+        running = 0.0
+        active = 0.0
+
+        value: Any = None
+        error: BaseException = None
+        try:
+            while True:
                 with Timer() as timer:
-                    # TODO@Daniel:
-                    #   Support async functions
-                    result = func(*args, **kwargs)
-
-                with Timer():
-                    entry = ProfileEntry(
-                        total_time=timer.total_time(),
-                        active_time=timer.active_time()
-                    )
-                    data.append(entry)
-
-                    return result
-
-        return wrapper
-else:
-    def print_report(reset: bool = True):
-        pass
-
-    def profiled(func: Callable) -> Callable:
-        return func
+                    try:
+                        if error is not None:
+                            yielded = self.coro.throw(error)
+                        else:
+                            yielded = self.coro.send(value)
+                    except StopIteration as stop:
+                        return stop.value
+                    finally:
+                        # The timer is still open here, so finish the step by hand
+                        step = time.perf_counter() - timer.start
+                        running += step
+                        active += step - timer.deduction
+
+                try:
+                    value, error = (yield yielded), None
+                except BaseException as e:
+                    value, error = None, e
+        finally:
+            total = time.perf_counter() - start
+            self.profile.total.add(total)
+            self.profile.active.add(active)
+            self.profile.waiting.add(total - running)
+
+
+def profiled(func: Callable[..., T]) -> Callable[..., T]:
+    """
+    Records call statistics of `func` while debugging is enabled. Works on plain
+    functions and coroutine functions.
+    """
+    profile = PROFILE_DATA[func] = Profile()
+
+    if inspect.iscoroutinefunction(func):
+        profile.waiting = Stats()
+
+        # A coroutine function itself, so that calls can still be scheduled as tasks
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if not ENABLE_DEBUGGING:
+                return await func(*args, **kwargs)
+            return await ProfiledCoroutine(func(*args, **kwargs), profile)
+
+        return async_wrapper  # type: ignore
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not ENABLE_DEBUGGING:
+            return func(*args, **kwargs)
+
+        with Timer() as timer:
+            result = func(*args, **kwargs)
+
+        profile.total.add(timer.total_time())
+        profile.active.add(timer.active_time())
+        return result
+
+    return wrapper
+
+
+def format_report() -> str:
+    def format_time(seconds: float) -> str:
+        return str(datetime.timedelta(seconds=seconds))
+
+    def format_stats(name: str, stats: Stats) -> str:
+        return (
+            f"[debug]     {name + ':':9} mean {format_time(stats.mean())}, "
+            f"min {format_time(stats.min)}, max {format_time(stats.max)}, "
+            f"p50 {format_time(stats.quantile(0.5))}, p95 {format_time(stats.quantile(0.95))}, "
+            f"p99 {format_time(stats.quantile(0.99))}"
+        )
+
+    parts = ["[debug] Profiling report:"]
+    for func, profile in PROFILE_DATA.items():
+        if not profile.total.count:
+            continue
+
+        parts.extend([
+            f"[debug]   Function: {func.__qualname__}",
+            f"[debug]     Count:    {profile.total.count}",
+            format_stats("Total", profile.total),
+            format_stats("Active", profile.active),
+        ])
+        if profile.waiting is not None:
+            parts.append(format_stats("Awaiting", profile.waiting))
+
+    return "\n".join(parts)
+
+
+def print_report(reset: bool = True):
+    if not ENABLE_DEBUGGING:
+        return
+
+    print(format_report())
+
+    if reset:
+        for profile in PROFILE_DATA.values():
+            profile.clear()
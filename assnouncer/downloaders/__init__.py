@@ -1,6 +1,3 @@
 from __future__ import annotations
 
-import assnouncer.downloaders.spotify
-import assnouncer.downloaders.fallback
-
 from assnouncer.downloaders.base import BaseDownloader
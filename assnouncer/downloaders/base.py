@@ -1,23 +1,57 @@
 from __future__ import annotations
 
+import os
+import shlex
 import logging
-import asyncio
-import regex
+import importlib
 
 from assnouncer.config import FFMPEG_PATH
 from assnouncer.asspp import Timestamp
 from assnouncer.metaclass import Descriptor
+from assnouncer.supervisor import SUPERVISOR
+from assnouncer.downloaders import stats
+from assnouncer.downloaders import manifest
 
 from dataclasses import dataclass
-from typing import List, ClassVar
+from typing import Dict, List, ClassVar, Tuple, Type, TYPE_CHECKING
 from pathlib import Path
 
+if TYPE_CHECKING:
+    import regex
+
 
 logger = logging.getLogger(__name__)
 
+
+@dataclass(frozen=True)
+class CanonicalForm:
+    """
+    Maps every spelling of a media URL matching `pattern` to one canonical `uri`.
+    Both templates are formatted with the named groups of the match, `key` is what
+    the download cache is keyed on and defaults to `uri`.
+    """
+
+    pattern: str
+    uri: str
+    key: str = None
+
+
 @dataclass
 class BaseDownloader(metaclass=Descriptor):
     PATTERNS: ClassVar[List[str]] = []
+    CANONICAL: ClassVar[List[CanonicalForm]] = []
+    PRIORITY: ClassVar[int] = 0
+
+    # Every registered pattern in registration order, compiled, the downloaders that declare
+    # it (by descending PRIORITY, then registration order) and one alternation of all of them,
+    # where group `r<N>` matches `ROUTES[N]`
+    ROUTES: ClassVar[List[str]] = []
+    COMPILED: ClassVar[List[regex.Pattern]] = []
+    FALLBACKS: ClassVar[Dict[str, List[Type[BaseDownloader]]]] = {}
+    ROUTER: ClassVar[regex.Pattern] = None
+    # The CANONICAL forms of every downloader in registration order, compiled once
+    CANONICALIZERS: ClassVar[List[Tuple[regex.Pattern, CanonicalForm]]] = []
+    LOADED: ClassVar[bool] = False
 
     @classmethod
     def validate(cls):
@@ -29,9 +63,87 @@ class BaseDownloader(metaclass=Descriptor):
         assert isinstance(cls.PATTERNS, list), msg
         assert all(isinstance(k, str) for k in cls.PATTERNS), msg
 
+        import regex
+        assert not any(regex.compile(k).groupindex for k in cls.PATTERNS), "PATTERNS must not use named groups"
+
+    @classmethod
+    def register(cls):
+        if cls == BaseDownloader:
+            return
+
+        import regex
+
+        for pattern in cls.PATTERNS:
+            if pattern not in BaseDownloader.FALLBACKS:
+                BaseDownloader.ROUTES.append(pattern)
+                BaseDownloader.COMPILED.append(regex.compile(pattern))
+                BaseDownloader.FALLBACKS[pattern] = []
+            BaseDownloader.FALLBACKS[pattern].append(cls)
+            BaseDownloader.FALLBACKS[pattern].sort(key=lambda d: -d.PRIORITY)
+
+        alternation = "|".join(f"(?P<r{idx}>{pattern})" for idx, pattern in enumerate(BaseDownloader.ROUTES))
+        BaseDownloader.ROUTER = regex.compile(alternation)
+
+        # Only the forms the class declares itself, inherited ones are already registered
+        for form in cls.__dict__.get("CANONICAL", []):
+            BaseDownloader.CANONICALIZERS.append((regex.compile(form.pattern), form))
+
+    @staticmethod
+    def load():
+        if BaseDownloader.LOADED:
+            return
+
+        BaseDownloader.LOADED = True
+        for module in manifest.MODULES:
+            importlib.import_module(module)
+
+    @staticmethod
+    def route(url: str) -> List[Type[BaseDownloader]]:
+        BaseDownloader.load()
+        if BaseDownloader.ROUTER is None:
+            return []
+
+        match = BaseDownloader.ROUTER.fullmatch(url)
+        if match is None:
+            return []
+
+        # The alternation only reports the first pattern that matched, the ones after it may
+        # match as well. Their downloaders are tried too, as if each accepted on its own.
+        first = int(match.lastgroup[1:])
+        routes = [BaseDownloader.ROUTES[first]]
+        for pattern, compiled in zip(BaseDownloader.ROUTES[first + 1:], BaseDownloader.COMPILED[first + 1:]):
+            if compiled.fullmatch(url) is not None:
+                routes.append(pattern)
+
+        if len(routes) == 1:
+            return [d for d in BaseDownloader.FALLBACKS[routes[0]] if d.enabled()]
+
+        merged = dict.fromkeys(d for pattern in routes for d in BaseDownloader.FALLBACKS[pattern])
+        return sorted((d for d in merged if d.enabled()), key=lambda d: -d.PRIORITY)
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return True
+
     @classmethod
     def accept(cls, url: str) -> bool:
-        return any(regex.fullmatch(pattern, url) is not None for pattern in cls.PATTERNS)
+        return cls in BaseDownloader.route(url)
+
+    @staticmethod
+    def canonicalize(url: str) -> Tuple[str, str]:
+        BaseDownloader.load()
+
+        for pattern, form in BaseDownloader.CANONICALIZERS:
+            match = pattern.match(url)
+            if match is None:
+                continue
+
+            groups = match.groupdict(default="")
+            uri = form.uri.format(**groups)
+            key = uri if form.key is None else form.key.format(**groups)
+            return uri, key
+
+        return None
 
     @staticmethod
     async def download(uri: str, filename: Path, start: Timestamp = None, stop: Timestamp = None) -> bool:
@@ -46,7 +158,7 @@ class BaseDownloader(metaclass=Descriptor):
         if start is None and stop is None:
             return True
 
-        filename_tmp = filename.with_suffix(".tmp.opus")
+        filename_tmp = filename.with_suffix(".cut.opus")
 
         cmd = f"{FFMPEG_PATH} -hide_banner -loglevel error"
 
@@ -56,13 +168,12 @@ class BaseDownloader(metaclass=Descriptor):
         if stop is not None:
             cmd = f"{cmd} -to {stop.value}"
 
-        cmd = f"{cmd} -i {filename} -c copy {filename_tmp}"
-        process = await asyncio.create_subprocess_shell(cmd)
-        if await process.wait() != 0:
-            filename_tmp.unlink()
-            return False
+        cmd = f"{cmd} -i {shlex.quote(str(filename))} -c copy {shlex.quote(str(filename_tmp))}"
+        with stats.current().phase("cut"):
+            if await SUPERVISOR.run("ffmpeg", cmd) != 0:
+                filename_tmp.unlink(missing_ok=True)
+                return False
 
-        filename.unlink()
-        filename_tmp.rename(filename)
+        os.replace(filename_tmp, filename)
 
         return True
@@ -1,22 +1,28 @@
 from __future__ import annotations
 
+import shlex
 import asyncio
+import logging
 
 from assnouncer.config import FFMPEG_DIR
 from assnouncer.asspp import Timestamp
-from assnouncer.downloaders.base import BaseDownloader
+from assnouncer.supervisor import SUPERVISOR
+from assnouncer.downloaders import stats
+from assnouncer.downloaders.base import BaseDownloader, CanonicalForm
 
 from dataclasses import dataclass
 from typing import List, ClassVar
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class FallbackDownloader(BaseDownloader):
     PATTERNS: ClassVar[List[str]] = [
         r"https://.*.(wav|mp3|mp4|opus|ogg|m4a)",
         r"https://youtu.be/.*",
-        r"https://cdn\.discordapp\.com/attachments/[0-9]+/[0-9]+/.*\.(wav|mp3|mp4|opus|ogg|m4a)",
+        r"https://cdn\.discordapp\.com/attachments/[0-9]+/[0-9]+/.*\.(wav|mp3|mp4|opus|ogg|m4a)(\?.*)?",
         r"https://(www\.)?youtube\.com/watch\?v=.*",
         r"https://(www\.)?soundcloud\.com/.*",
         # TODO(daniel): Dailymotion download takes ages
@@ -24,27 +30,83 @@ class FallbackDownloader(BaseDownloader):
         r"https://(www\.)?vimeo\.com/.*",
         r"https://(www\.)?streamable.com/.*",
     ]
+    CANONICAL: ClassVar[List[CanonicalForm]] = [
+        # Same form as pytube's `watch_url`, so search results already are canonical
+        CanonicalForm(
+            pattern=r"https?://(?:www\.|m\.|music\.)?youtube\.com/watch/?\?(?:[^#]*&)?v=(?P<id>[\w-]{11})",
+            uri="https://youtube.com/watch?v={id}"
+        ),
+        CanonicalForm(
+            pattern=r"https?://(?:www\.|m\.)?youtube\.com/(?:shorts|embed|live|v)/(?P<id>[\w-]{11})",
+            uri="https://youtube.com/watch?v={id}"
+        ),
+        CanonicalForm(
+            pattern=r"https?://youtu\.be/(?P<id>[\w-]{11})",
+            uri="https://youtube.com/watch?v={id}"
+        ),
+        CanonicalForm(
+            pattern=r"https?://(?:www\.|m\.)?soundcloud\.com/(?P<id>(?!discover|search)[\w-]+/(?:sets/)?[\w-]+)",
+            uri="https://soundcloud.com/{id}"
+        ),
+        CanonicalForm(
+            pattern=r"https?://(?:www\.|player\.)?vimeo\.com/(?:video/)?(?P<id>\d+(?:/[0-9a-f]{6,})?)",
+            uri="https://vimeo.com/{id}"
+        ),
+        CanonicalForm(
+            pattern=r"https?://(?:www\.)?streamable\.com/(?:[eo]/)?(?P<id>\w+)",
+            uri="https://streamable.com/{id}"
+        ),
+        # Attachment links carry expiring signatures, which are needed to download
+        # but must not be part of the cache key
+        CanonicalForm(
+            pattern=(
+                r"https?://(?:cdn|media)\.discordapp\.(?:com|net)/attachments/"
+                r"(?P<id>[0-9]+/[0-9]+/[^?#]+)(?P<query>\?[^#]*)?"
+            ),
+            uri="https://cdn.discordapp.com/attachments/{id}{query}",
+            key="https://cdn.discordapp.com/attachments/{id}"
+        ),
+    ]
 
     @staticmethod
     async def download(url: str, filename: Path, start: Timestamp = None, stop: Timestamp = None) -> bool:
         filename_ns = filename.with_suffix("")
+        progress = " ".join(f"--progress-template {shlex.quote(t)}" for t in stats.PROGRESS_TEMPLATES)
 
         cmd = (
             f"yt-dlp "
             f"-x "
             f"-i "
+            f"-q --progress --newline {progress} "
             # f"-f ba "
-            f"-o {filename_ns}.%(ext)s "
+            f"-o {shlex.quote(f'{filename_ns}.%(ext)s')} "
+            f"--continue --part "
             f"--http-chunk-size 10M "
             f"--buffer-size 32K "
             f"--audio-format opus "
             f"--audio-quality 0 "
-            f"--ffmpeg-location {FFMPEG_DIR} "
-            f"{url}"
+            f"--ffmpeg-location {shlex.quote(str(FFMPEG_DIR))} "
+            f"{shlex.quote(url)}"
         )
 
-        process = await asyncio.create_subprocess_shell(cmd)
-        if await process.wait() != 0:
+        current = stats.current()
+        current.begin("resolve")
+
+        # Under -q the post-processing progress and any errors go to stderr, parse both
+        async with SUPERVISOR.spawn(
+            "yt-dlp", cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+        ) as process:
+            async for line in process.stdout:
+                text = line.decode(errors="replace").strip()
+                if current.feed_line(text):
+                    continue
+
+                if text.startswith("ERROR:"):
+                    logger.warning(f"yt-dlp: {text}")
+                else:
+                    logger.debug(f"yt-dlp: {text}")
+
+        if process.returncode != 0:
             return False
 
         if not await BaseDownloader.cut(filename, start=start, stop=stop):
@@ -0,0 +1,13 @@
+"""
+Modules that define downloaders, imported together the first time a URI is routed
+or canonicalized.
+"""
+from __future__ import annotations
+
+from typing import List
+
+MODULES: List[str] = [
+    "assnouncer.downloaders.spotify",
+    "assnouncer.downloaders.fallback",
+    "assnouncer.downloaders.ytdlp",
+]
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
-import asyncio
+import shlex
 
 from assnouncer.config import FFMPEG_PATH
 from assnouncer.asspp import Timestamp
-from assnouncer.downloaders.base import BaseDownloader
+from assnouncer.supervisor import SUPERVISOR
+from assnouncer.downloaders import stats
+from assnouncer.downloaders.base import BaseDownloader, CanonicalForm
 
 from typing import List, ClassVar
 from pathlib import Path
@@ -14,22 +16,32 @@ class SpotifyDownloader(BaseDownloader):
     PATTERNS: ClassVar[List[str]] = [
         r"https://(www\.)?open\.spotify\.com/track/.*",
     ]
+    CANONICAL: ClassVar[List[CanonicalForm]] = [
+        CanonicalForm(
+            pattern=r"https?://(?:www\.)?open\.spotify\.com/(?:intl-[\w-]+/)?track/(?P<id>\w+)",
+            uri="https://open.spotify.com/track/{id}"
+        ),
+        CanonicalForm(
+            pattern=r"spotify:track:(?P<id>\w+)",
+            uri="https://open.spotify.com/track/{id}"
+        ),
+    ]
 
     @staticmethod
     async def download(url: str, filename: Path, start: Timestamp = None, stop: Timestamp = None) -> bool:
         cmd = (
             f"spotdl "
-            f"-f {FFMPEG_PATH} "
-            f"-p {filename} "
+            f"-f {shlex.quote(str(FFMPEG_PATH))} "
+            f"-p {shlex.quote(str(filename))} "
             f"--output-format opus "
-            f"{url}"
+            f"{shlex.quote(url)}"
         )
 
-        process = await asyncio.create_subprocess_shell(cmd)
-        if await process.wait() != 0:
-            return False
+        with stats.current().phase("fetch"):
+            if await SUPERVISOR.run("spotdl", cmd) != 0:
+                return False
 
-        if not BaseDownloader.cut(filename, start=start, stop=stop):
+        if not await BaseDownloader.cut(filename, start=start, stop=stop):
             filename.unlink()
             return False
 
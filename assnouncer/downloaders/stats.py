@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import json
+import time
+import logging
+import statistics
+
+from dataclasses import dataclass, field
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_PREFIX = "ass:"
+
+# Makes yt-dlp print one JSON object per progress update, see `DownloadStats.feed_line`
+PROGRESS_TEMPLATES = [
+    f"download:{PROGRESS_PREFIX}download "
+    f"%(progress.{{status,downloaded_bytes,total_bytes,total_bytes_estimate,elapsed,speed}})j",
+    f"postprocess:{PROGRESS_PREFIX}postprocess %(progress.{{status,postprocessor}})j",
+]
+
+
+@dataclass
+class DownloadStats:
+    uri: str
+    downloader: str
+    started: float = field(default_factory=time.time)
+    phases: Dict[str, float] = field(default_factory=dict)
+    open: Dict[str, float] = field(default_factory=dict)
+    bytes: int = 0
+    wall_time: float = None
+    success: bool = None
+    clock: float = field(default_factory=time.perf_counter)
+
+    def begin(self, name: str):
+        self.open.setdefault(name, time.perf_counter())
+
+    def end(self, name: str):
+        start = self.open.pop(name, None)
+        if start is not None:
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - start
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def feed(self, kind: str, payload: Dict[str, Any]):
+        status = payload.get("status")
+        if kind == "download":
+            if status == "downloading":
+                self.end("resolve")
+                self.begin("fetch")
+            elif status == "finished":
+                self.end("fetch")
+
+            downloaded = payload.get("downloaded_bytes")
+            if downloaded is not None:
+                self.bytes = max(self.bytes, downloaded)
+        elif kind == "postprocess":
+            if status == "started":
+                self.end("resolve")
+                self.begin("post-process")
+            elif status == "finished":
+                self.end("post-process")
+
+    def feed_line(self, line: str) -> bool:
+        if not line.startswith(PROGRESS_PREFIX):
+            return False
+
+        kind, _, data = line[len(PROGRESS_PREFIX):].partition(" ")
+        try:
+            self.feed(kind, json.loads(data))
+        except ValueError:
+            return False
+
+        return True
+
+    def finish(self, success: bool, filename: Path = None):
+        for name in list(self.open):
+            self.end(name)
+
+        self.success = success
+        self.wall_time = time.perf_counter() - self.clock
+
+        if not self.bytes and success and filename is not None and filename.is_file():
+            self.bytes = filename.stat().st_size
+
+    @property
+    def throughput(self) -> float:
+        fetch = self.phases.get("fetch")
+        if not fetch or not self.bytes:
+            return None
+
+        return self.bytes / fetch
+
+    def format(self) -> str:
+        phases = " ".join(f"{name}={seconds:.2f}s" for name, seconds in self.phases.items())
+        throughput = "-" if self.throughput is None else f"{self.throughput / 1024:.0f}KiB/s"
+        outcome = "ok" if self.success else "FAILED"
+        return (
+            f"{outcome:6} {self.wall_time:6.2f}s {self.bytes / 1024:8.0f}KiB {throughput:>10} "
+            f"{self.downloader}: {phases} {self.uri}"
+        )
+
+
+@dataclass
+class DownloadHistory:
+    entries: deque[DownloadStats] = field(default_factory=lambda: deque(maxlen=200))
+
+    def add(self, stats: DownloadStats):
+        self.entries.append(stats)
+        logger.info(f"Download stats: {stats.format()}")
+
+    def summary(self) -> Dict[str, float]:
+        done = [entry for entry in self.entries if entry.wall_time is not None]
+        succeeded = [entry for entry in done if entry.success]
+
+        summary: Dict[str, float] = {
+            "count": len(done),
+            "success_rate": len(succeeded) / len(done) if done else 0,
+        }
+
+        if succeeded:
+            wall_times = sorted(entry.wall_time for entry in succeeded)
+            summary["wall_time_mean"] = statistics.fmean(wall_times)
+            summary["wall_time_p50"] = wall_times[len(wall_times) // 2]
+            summary["wall_time_p95"] = wall_times[min(len(wall_times) - 1, int(len(wall_times) * 0.95))]
+
+            throughputs = [entry.throughput for entry in succeeded if entry.throughput is not None]
+            if throughputs:
+                summary["throughput_mean"] = statistics.fmean(throughputs)
+
+            names = {name for entry in succeeded for name in entry.phases}
+            for name in sorted(names):
+                summary[f"{name}_mean"] = statistics.fmean(entry.phases.get(name, 0) for entry in succeeded)
+
+        return summary
+
+    def format(self, count: int = 10) -> str:
+        lines: List[str] = [entry.format() for entry in list(self.entries)[-count:]]
+        summary = ", ".join(
+            f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+            for key, value in self.summary().items()
+        )
+        lines.append(f"Summary: {summary}")
+        return "\n".join(lines)
+
+
+HISTORY = DownloadHistory()
+
+CURRENT: ContextVar[DownloadStats] = ContextVar("download_stats")
+
+
+def current() -> DownloadStats:
+    """
+    Stats of the download running in this task, or a detached instance that nobody
+    reads when called outside of `util.download`.
+    """
+    stats = CURRENT.get(None)
+    if stats is None:
+        stats = DownloadStats(uri=None, downloader=None)
+    return stats
@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import os
+import signal
+import asyncio
+import logging
+import itertools
+import multiprocessing
+
+from assnouncer import config
+from assnouncer.config import FFMPEG_DIR
+from assnouncer.asspp import Timestamp
+from assnouncer.downloaders import stats
+from assnouncer.downloaders.base import BaseDownloader
+from assnouncer.downloaders.fallback import FallbackDownloader
+from assnouncer.supervisor import LIMITS, SUPERVISOR, ProcessRecord
+
+from dataclasses import dataclass
+from typing import Any, Callable, ClassVar, Dict, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from threading import Thread
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[str, Dict[str, Any]], None]
+
+OPTIONS: Dict[str, Any] = {
+    "format": "bestaudio/best",
+    "ignoreerrors": False,
+    "quiet": True,
+    "noprogress": True,
+    "continuedl": True,
+    "nopart": False,
+    "http_chunk_size": 10 * 1024 * 1024,
+    "buffersize": 32 * 1024,
+    "ffmpeg_location": str(FFMPEG_DIR),
+    "postprocessors": [{
+        "key": "FFmpegExtractAudio",
+        "preferredcodec": "opus",
+        "preferredquality": "0",
+    }],
+}
+
+WARM_EXTRACTORS = ["Youtube", "Soundcloud", "Vimeo", "Streamable", "Generic"]
+
+PROGRESS_FIELDS = ["status", "downloaded_bytes", "total_bytes", "total_bytes_estimate", "elapsed", "speed", "eta"]
+
+
+@dataclass
+class DownloadInfo:
+    title: str = None
+    duration: float = None
+    uploader: str = None
+    webpage_url: str = None
+
+
+#
+# Worker process side
+#
+WORKER_YDL: Any = None
+WORKER_EVENTS: Any = None
+WORKER_TOKEN: int = None
+
+
+def worker_init(events: multiprocessing.Queue):
+    global WORKER_YDL
+    global WORKER_EVENTS
+
+    from yt_dlp import YoutubeDL
+
+    def on_progress(status: Dict[str, Any]):
+        payload = {k: status.get(k) for k in PROGRESS_FIELDS}
+        WORKER_EVENTS.put((WORKER_TOKEN, "download", payload))
+
+    def on_postprocess(status: Dict[str, Any]):
+        payload = {"status": status.get("status"), "postprocessor": status.get("postprocessor")}
+        WORKER_EVENTS.put((WORKER_TOKEN, "postprocess", payload))
+
+    WORKER_EVENTS = events
+    # Lets the main process account for and kill this worker
+    WORKER_EVENTS.put((None, "started", os.getpid()))
+    WORKER_YDL = YoutubeDL(dict(OPTIONS, progress_hooks=[on_progress], postprocessor_hooks=[on_postprocess]))
+
+    for key in WARM_EXTRACTORS:
+        WORKER_YDL.get_info_extractor(key)
+
+
+def worker_download(token: int, url: str, outtmpl: str) -> Dict[str, Any]:
+    global WORKER_TOKEN
+
+    WORKER_TOKEN = token
+    WORKER_YDL.params["outtmpl"]["default"] = outtmpl
+
+    try:
+        info = WORKER_YDL.extract_info(url, download=True)
+    except Exception as e:
+        # yt-dlp errors hold unpicklable state, only the message crosses the process boundary
+        raise RuntimeError(str(e)) from None
+
+    if info is None:
+        return None
+
+    return {
+        "title": info.get("title"),
+        "duration": info.get("duration"),
+        "uploader": info.get("uploader"),
+        "webpage_url": info.get("webpage_url"),
+    }
+
+
+#
+# Main process side
+#
+@dataclass
+class WorkerPool:
+    workers: int
+    executor: ProcessPoolExecutor
+    events: multiprocessing.Queue
+    listeners: Dict[int, Tuple[asyncio.AbstractEventLoop, ProgressCallback]]
+    tokens: itertools.count
+    thread: Thread
+    # The supervisor's records of the live workers, by pid
+    records: Dict[int, ProcessRecord]
+
+    @staticmethod
+    def create(workers: int) -> WorkerPool:
+        context = multiprocessing.get_context("spawn")
+        pool = WorkerPool(
+            workers=workers,
+            executor=None,
+            events=context.Queue(),
+            listeners={},
+            tokens=itertools.count(),
+            thread=None,
+            records={}
+        )
+        pool.thread = Thread(target=pool.relay, name="yt-dlp-events", daemon=True)
+        pool.thread.start()
+        pool.executor = pool.spawn()
+        return pool
+
+    def spawn(self) -> ProcessPoolExecutor:
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=worker_init,
+            initargs=(self.events,)
+        )
+
+        # Spin up and warm every worker now rather than on the first download
+        for _ in range(self.workers):
+            executor.submit(int)
+
+        return executor
+
+    def recycle(self):
+        """
+        Kills every worker and starts over with fresh ones. A worker stuck in a download
+        can not be interrupted on its own, and killing it breaks its executor anyway, so
+        the downloads the others were running fail as well.
+        """
+        # Swapped first, the new workers report in on the relay thread while they start
+        records, self.records = self.records, {}
+        executor, self.executor = self.executor, self.spawn()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        for record in records.values():
+            SUPERVISOR.kill(record)
+            SUPERVISOR.release(record, -signal.SIGTERM)
+
+    def close(self):
+        self.executor.shutdown()
+
+        records, self.records = self.records, {}
+        for record in records.values():
+            SUPERVISOR.release(record, 0)
+
+    def relay(self):
+        while True:
+            token, kind, payload = self.events.get()
+            if kind == "started":
+                self.records[payload] = SUPERVISOR.register("yt-dlp-worker", "yt-dlp worker", payload, group=False)
+                continue
+
+            listener = self.listeners.get(token)
+            if listener is not None:
+                loop, callback = listener
+                loop.call_soon_threadsafe(callback, kind, payload)
+
+    async def download(self, url: str, outtmpl: str, progress: ProgressCallback = None) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        token = next(self.tokens)
+        if progress is not None:
+            self.listeners[token] = (loop, progress)
+
+        timeout = LIMITS["yt-dlp"].timeout
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self.executor, worker_download, token, url, outtmpl),
+                timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warn(f"yt-dlp took longer than {timeout}s for {url}, restarting its workers")
+            self.recycle()
+            raise
+        finally:
+            self.listeners.pop(token, None)
+
+
+class YtDlpDownloader(FallbackDownloader):
+    PRIORITY: ClassVar[int] = 1
+
+    POOL: ClassVar[WorkerPool] = None
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return config.YTDLP_BACKEND == "inprocess"
+
+    @classmethod
+    def pool(cls) -> WorkerPool:
+        if cls.POOL is None:
+            cls.POOL = WorkerPool.create(config.YTDLP_WORKERS)
+        return cls.POOL
+
+    @staticmethod
+    async def fetch(
+        url: str,
+        filename: Path,
+        start: Timestamp = None,
+        stop: Timestamp = None,
+        progress: ProgressCallback = None
+    ) -> DownloadInfo:
+        outtmpl = f"{filename.with_suffix('')}.%(ext)s"
+
+        try:
+            info = await YtDlpDownloader.pool().download(url, outtmpl, progress=progress)
+        except Exception as e:
+            logger.warn(f"yt-dlp failed for {url}: {e}")
+            return None
+
+        if info is None or not filename.is_file():
+            return None
+
+        if not await BaseDownloader.cut(filename, start=start, stop=stop):
+            filename.unlink()
+            return None
+
+        return DownloadInfo(**info)
+
+    @staticmethod
+    async def download(url: str, filename: Path, start: Timestamp = None, stop: Timestamp = None) -> bool:
+        current = stats.current()
+        current.begin("resolve")
+
+        info = await YtDlpDownloader.fetch(url, filename, start=start, stop=stop, progress=current.feed)
+        return info is not None
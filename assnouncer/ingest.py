@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import os
+import json
+import math
+import shlex
+import asyncio
+import logging
+
+from assnouncer import config
+from assnouncer.config import FFMPEG_PATH
+from assnouncer.asspp import Timestamp
+from assnouncer.supervisor import SUPERVISOR
+from assnouncer.downloaders import stats
+
+from typing import Dict, Tuple, TYPE_CHECKING
+from pathlib import Path
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Files within this many LU of the target are left alone rather than re-encoded
+LOUDNESS_TOLERANCE = 1.0
+
+TRUE_PEAK = -1.5
+LOUDNESS_RANGE = 11
+
+# Silence detection runs on mono PCM at this rate, in windows of SILENCE_WINDOW seconds
+ANALYSIS_RATE = 8000
+SILENCE_WINDOW = 0.01
+# Seconds of silence kept in front of and after the audible part
+SILENCE_PADDING = 0.1
+
+
+async def decode(path: Path) -> np.ndarray:
+    cmd = (
+        f"{FFMPEG_PATH} -hide_banner -loglevel error -i {shlex.quote(str(path))} "
+        f"-ac 1 -ar {ANALYSIS_RATE} -f s16le -"
+    )
+    async with SUPERVISOR.spawn("ffmpeg", cmd, stdout=asyncio.subprocess.PIPE) as process:
+        output, _ = await process.communicate()
+
+    if process.returncode != 0:
+        return None
+
+    import numpy as np
+
+    return np.frombuffer(output, dtype=np.int16)
+
+
+def find_audible(samples: np.ndarray) -> Tuple[float, float]:
+    """
+    Start and end in seconds of the part of `samples` that is louder than the silence
+    threshold, or None if all of it is silent.
+    """
+    import numpy as np
+
+    window = int(ANALYSIS_RATE * SILENCE_WINDOW)
+    count = len(samples) // window
+    if count == 0:
+        return None
+
+    frames = samples[:count * window].reshape(count, window).astype(np.float32) / 32768
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    audible = np.flatnonzero(rms > 10 ** (config.SILENCE_THRESHOLD / 20))
+    if len(audible) == 0:
+        return None
+
+    return float(audible[0] * SILENCE_WINDOW), float((audible[-1] + 1) * SILENCE_WINDOW)
+
+
+async def trim(path: Path, start: Timestamp = None, stop: Timestamp = None) -> bool:
+    """
+    Cuts leading and trailing silence with a stream copy. Ends that the user has cut
+    explicitly with `start`/`stop` are kept as they are.
+    """
+    samples = await decode(path)
+    if samples is None:
+        return False
+
+    audible = find_audible(samples)
+    if audible is None:
+        return False
+
+    duration = len(samples) / ANALYSIS_RATE
+    lead = 0.0 if start is not None else max(0.0, audible[0] - SILENCE_PADDING)
+    end = duration if stop is not None else min(duration, audible[1] + SILENCE_PADDING)
+    if lead < config.SILENCE_MINIMUM and duration - end < config.SILENCE_MINIMUM:
+        return False
+
+    trimmed = path.with_suffix(".ingest.opus")
+    cmd = (
+        f"{FFMPEG_PATH} -hide_banner -loglevel error -y "
+        f"-ss {lead:.3f} -to {end:.3f} -i {shlex.quote(str(path))} -c copy {shlex.quote(str(trimmed))}"
+    )
+    if await SUPERVISOR.run("ffmpeg", cmd) != 0:
+        trimmed.unlink(missing_ok=True)
+        return False
+
+    logger.info(f"Trimmed {lead:.2f}s of leading and {duration - end:.2f}s of trailing silence from {path}")
+    os.replace(trimmed, path)
+    return True
+
+
+async def measure(path: Path) -> Dict[str, str]:
+    """
+    First loudnorm pass, the EBU R128 measurements of the whole file.
+    """
+    cmd = (
+        f"{FFMPEG_PATH} -hide_banner -nostats -i {shlex.quote(str(path))} "
+        f"-af loudnorm=I={config.LOUDNESS_TARGET}:TP={TRUE_PEAK}:LRA={LOUDNESS_RANGE}:print_format=json "
+        f"-f null -"
+    )
+    async with SUPERVISOR.spawn("ffmpeg", cmd, stderr=asyncio.subprocess.PIPE) as process:
+        _, output = await process.communicate()
+
+    text = output.decode(errors="replace")
+    try:
+        return json.loads(text[text.rfind("{"):text.rfind("}") + 1])
+    except ValueError:
+        logger.warn(f"Could not measure loudness of {path}")
+        return None
+
+
+async def normalize(path: Path, measured: Dict[str, str]) -> bool:
+    """
+    Second loudnorm pass with the measured values, which allows a plain linear gain.
+    Written back as Opus so that playback stays a stream copy.
+    """
+    normalized = path.with_suffix(".ingest.opus")
+
+    loudnorm = ":".join([
+        f"loudnorm=I={config.LOUDNESS_TARGET}",
+        f"TP={TRUE_PEAK}",
+        f"LRA={LOUDNESS_RANGE}",
+        f"measured_I={measured['input_i']}",
+        f"measured_TP={measured['input_tp']}",
+        f"measured_LRA={measured['input_lra']}",
+        f"measured_thresh={measured['input_thresh']}",
+        f"offset={measured['target_offset']}",
+        "linear=true",
+    ])
+    cmd = (
+        f"{FFMPEG_PATH} -hide_banner -loglevel error -y -i {shlex.quote(str(path))} "
+        f"-af {loudnorm} -ar 48000 -c:a libopus -b:a 128k {shlex.quote(str(normalized))}"
+    )
+    if await SUPERVISOR.run("ffmpeg", cmd) != 0:
+        normalized.unlink(missing_ok=True)
+        return False
+
+    os.replace(normalized, path)
+    return True
+
+
+async def run(path: Path, start: Timestamp = None, stop: Timestamp = None) -> float:
+    """
+    Processes a freshly downloaded file in place, before it is committed to the cache.
+    Returns the integrated loudness of the result in LUFS, or None if it is unknown.
+    """
+    current = stats.current()
+
+    if config.TRIM_SILENCE:
+        with current.phase("trim"):
+            await trim(path, start=start, stop=stop)
+
+    with current.phase("loudness"):
+        measured = await measure(path)
+    if measured is None:
+        return None
+
+    loudness = float(measured["input_i"])
+    if not math.isfinite(loudness):
+        # Silence measures -inf, no gain brings it to the target
+        logger.info(f"Not normalizing {path}, it is silent")
+        return None
+
+    if not config.NORMALIZE_LOUDNESS or abs(loudness - config.LOUDNESS_TARGET) <= LOUDNESS_TOLERANCE:
+        return loudness
+
+    with current.phase("normalize"):
+        if not await normalize(path, measured):
+            logger.warn(f"Could not normalize {path}, keeping it at {loudness} LUFS")
+            return loudness
+
+    return config.LOUDNESS_TARGET
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import os
+import json
+import time
+import asyncio
+import logging
+
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, TextIO
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Rewrite the journal as a snapshot of the live entries after this many appended records
+COMPACT_EVERY = 256
+
+# Seconds between two playback offset records of the same song
+OFFSET_INTERVAL = 5.0
+
+
+@dataclass
+class Entry:
+    id: int
+    query: str
+    # Canonical URI, None until the query has been resolved
+    uri: str = None
+    # Cut in seconds, as passed to util.download
+    start: int = None
+    stop: int = None
+    channel: int = None
+    # Seconds played of the cut file, for the song that was playing
+    offset: float = 0
+
+
+@dataclass
+class Journal:
+    """
+    Append-only log of the song queue of one guild, one JSON record per line:
+
+        enqueue  a song was queued, with everything needed to play it again
+        resolve  its query resolved to a canonical URI
+        pop      it started playing
+        offset   how far it got
+        skip     it was skipped
+        done     it finished, or failed to play
+        drop     it failed to download
+        clear    the queue was cleared, except for the song that is playing
+
+    Every record is flushed before returning, so a crashed process loses nothing. The
+    journal is compacted into one `enqueue` per live song whenever it is opened and
+    after every COMPACT_EVERY records, in the background when there is an event loop.
+    """
+
+    path: Path
+    entries: Dict[int, Entry] = field(default_factory=dict)
+    current: int = None
+    next_id: int = 0
+    appended: int = 0
+    offset_written: float = 0
+    file: TextIO = None
+    # Running background compaction, and the records written since it took its snapshot
+    task: asyncio.Task = None
+    backlog: List[str] = field(default_factory=list)
+
+    @staticmethod
+    def open(path: Path) -> Journal:
+        journal = Journal(path=path)
+        journal.load()
+        journal.compact()
+        return journal
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def load(self):
+        try:
+            lines = self.path.read_text(encoding="utf8").splitlines()
+        except FileNotFoundError:
+            return
+
+        for number, line in enumerate(lines, start=1):
+            try:
+                self.apply(json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                # Most likely the last line, torn by the crash we are recovering from
+                logger.warning(f"Ignoring invalid record on line {number} of {self.path}")
+
+    def apply(self, record: Dict[str, Any]):
+        op = record["op"]
+        entry = self.entries.get(record.get("id"))
+
+        if op == "enqueue":
+            entry = Entry(**{k: v for k, v in record.items() if k != "op"})
+            self.entries[entry.id] = entry
+            self.next_id = max(self.next_id, entry.id + 1)
+        elif op == "clear":
+            self.entries = {k: v for k, v in self.entries.items() if k == self.current}
+        elif entry is None:
+            return
+        elif op == "resolve":
+            entry.uri = record["uri"]
+        elif op == "pop":
+            self.current = entry.id
+        elif op == "offset":
+            entry.offset = record["offset"]
+        elif op in ("skip", "done", "drop"):
+            del self.entries[entry.id]
+            if self.current == entry.id:
+                self.current = None
+        else:
+            raise ValueError(f"Unknown journal operation {op!r}")
+
+    def write(self, op: str, **record: Any):
+        record = dict(op=op, **record)
+        self.apply(record)
+
+        # Closed on shutdown while the players still run, from here on nothing is recorded
+        if self.file is None:
+            return
+
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        self.file.write(line)
+        self.file.flush()
+
+        self.appended += 1
+        if self.task is not None:
+            self.backlog.append(line)
+        elif self.appended >= COMPACT_EVERY:
+            try:
+                self.task = asyncio.get_running_loop().create_task(self.compact_in_background())
+            except RuntimeError:
+                self.compact()
+
+    def snapshot(self) -> str:
+        lines = [json.dumps(dict(op="enqueue", **asdict(entry)), ensure_ascii=False) for entry in self.entries.values()]
+        if self.current is not None:
+            lines.append(json.dumps(dict(op="pop", id=self.current)))
+        return "".join(f"{line}\n" for line in lines)
+
+    def stage(self, snapshot: str) -> Path:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        staging = self.path.with_suffix(".compact")
+        with staging.open("w", encoding="utf8") as file:
+            file.write(snapshot)
+            file.flush()
+            os.fsync(file.fileno())
+        return staging
+
+    def commit(self, staging: Path):
+        # Records written while staging go to both files until the rename, so none is lost
+        with staging.open("a", encoding="utf8") as file:
+            file.writelines(self.backlog)
+        os.replace(staging, self.path)
+
+        self.close()
+        self.file = self.path.open("a", encoding="utf8")
+        self.appended = len(self.backlog)
+        self.backlog.clear()
+
+    def compact(self):
+        self.commit(self.stage(self.snapshot()))
+
+    async def compact_in_background(self):
+        try:
+            # Writing and syncing the snapshot is the slow part, the rename is cheap
+            staging = await asyncio.to_thread(self.stage, self.snapshot())
+            if self.file is None:
+                staging.unlink()
+            else:
+                self.commit(staging)
+        except OSError as e:
+            logger.warning(f"Could not compact {self.path}: {e}")
+        finally:
+            self.task = None
+            self.backlog.clear()
+
+    def pending(self) -> List[Entry]:
+        """
+        The song that was playing, followed by the queue in order.
+        """
+        entries = list(self.entries.values())
+        entries.sort(key=lambda entry: entry.id != self.current)
+        return entries
+
+    def enqueue(self, query: str, uri: str = None, start: int = None, stop: int = None, channel: int = None) -> int:
+        id = self.next_id
+        self.write("enqueue", id=id, query=query, uri=uri, start=start, stop=stop, channel=channel, offset=0)
+        return id
+
+    def resolve(self, id: int, uri: str):
+        entry = self.entries.get(id)
+        if entry is not None and entry.uri != uri:
+            self.write("resolve", id=id, uri=uri)
+
+    def pop(self, id: int):
+        self.offset_written = time.monotonic()
+        self.write("pop", id=id)
+
+    def offset(self, id: int, offset: float):
+        now = time.monotonic()
+        if now - self.offset_written >= OFFSET_INTERVAL and id in self.entries:
+            self.offset_written = now
+            self.write("offset", id=id, offset=round(offset, 2))
+
+    def skip(self, id: int):
+        if id in self.entries:
+            self.write("skip", id=id)
+
+    def done(self, id: int):
+        if id in self.entries:
+            self.write("done", id=id)
+
+    def drop(self, id: int):
+        if id in self.entries:
+            self.write("drop", id=id)
+
+    def clear(self):
+        if any(id != self.current for id in self.entries):
+            self.write("clear")
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import copy
+import queue
+import logging
+
+from logging import LogRecord, Handler, WARNING
+from logging.handlers import QueueHandler, QueueListener
+from collections import Counter
+from typing import List
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Hands records to a bounded queue without ever blocking the logging thread. When
+    the writer falls behind, records are dropped and counted per level, and a warning
+    with the count is queued as soon as there is room again.
+    """
+
+    def __init__(self, capacity: int):
+        super().__init__(queue.Queue(maxsize=capacity))
+        self.dropped: Counter[str] = Counter()
+        self.reported = 0
+        self.listener: QueueListener = None
+
+    @property
+    def dropped_total(self) -> int:
+        return sum(self.dropped.values())
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        # Only merge the arguments here, while they still hold the values they had when logging.
+        # Timestamps, colours and tracebacks are formatted by the writer thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: LogRecord):
+        try:
+            unreported = self.dropped_total - self.reported
+            if unreported:
+                self.queue.put_nowait(self.report(unreported))
+                self.reported += unreported
+
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped[record.levelname] += 1
+
+    def report(self, count: int) -> LogRecord:
+        counts = ", ".join(f"{level}: {n}" for level, n in sorted(self.dropped.items()))
+        return logging.makeLogRecord(dict(
+            name=__name__,
+            levelno=WARNING,
+            levelname=logging.getLevelName(WARNING),
+            msg=f"Log queue full, dropped {count} record(s) (total {counts})",
+        ))
+
+
+class BlockingQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # The queue may be full, wait for the writer instead of losing the sentinel
+        self.queue.put(self._sentinel)  # type: ignore
+
+
+def start(handlers: List[Handler], capacity: int) -> DroppingQueueHandler:
+    """
+    Routes the records of the root logger through a queue to `handlers`, which are
+    then only ever called from a single background thread.
+    """
+    handler = DroppingQueueHandler(capacity)
+    listener = BlockingQueueListener(handler.queue, *handlers, respect_handler_level=True)  # type: ignore
+    listener.start()
+    listener._thread.name = "log-writer"  # type: ignore
+
+    handler.listener = listener
+    return handler
@@ -11,8 +11,12 @@ class Descriptor(type):
 
         if bases:
             cls.validate()
+            cls.register()
 
         return cls
 
     def validate(cls):
         pass
+
+    def register(cls):
+        pass
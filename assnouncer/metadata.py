@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import json
+import shlex
+import asyncio
+import logging
+import sqlite3
+
+from assnouncer import config
+from assnouncer.config import FFPROBE_PATH
+from assnouncer.supervisor import SUPERVISOR
+
+from dataclasses import dataclass, astuple, fields
+from typing import Iterable, List
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    codec TEXT,
+    bitrate INTEGER,
+    channels INTEGER,
+    duration REAL,
+    loudness REAL
+)
+"""
+
+# Unfinished downloads, cuts and ingests, see `util.get_staging_path`, `BaseDownloader.cut`
+# and `ingest.normalize`
+TEMPORARY_SUFFIXES = (".staging.opus", ".cut.opus", ".ingest.opus")
+
+
+@dataclass
+class Metadata:
+    codec: str = None
+    # kbit/s, as FFmpegOpusAudio expects it
+    bitrate: int = None
+    channels: int = None
+    duration: float = None
+    # Integrated loudness in LUFS, filled in by ingest
+    loudness: float = None
+
+
+COLUMNS = [f.name for f in fields(Metadata)]
+
+
+@dataclass
+class MetadataStore:
+    """
+    Probe results of every file in the download and theme caches, keyed by path and
+    invalidated when the size or modification time of the file changes.
+    """
+
+    path: Path
+    connection: sqlite3.Connection = None
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path)
+            self.connection.execute(SCHEMA)
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def get(self, path: Path) -> Metadata:
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+
+        row = self.connect().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM media WHERE path = ? AND size = ? AND mtime = ?",
+            (path.as_posix(), stat.st_size, stat.st_mtime_ns)
+        ).fetchone()
+
+        if row is None:
+            return None
+        return Metadata(*row)
+
+    def put(self, path: Path, metadata: Metadata):
+        stat = path.stat()
+        with self.connect() as connection:
+            connection.execute(
+                f"INSERT OR REPLACE INTO media (path, size, mtime, {', '.join(COLUMNS)}) "
+                f"VALUES (?, ?, ?, {', '.join('?' * len(COLUMNS))})",
+                (path.as_posix(), stat.st_size, stat.st_mtime_ns, *astuple(metadata))
+            )
+
+    def prune(self):
+        connection = self.connect()
+        missing = [
+            (path,)
+            for path, in connection.execute("SELECT path FROM media")
+            if not Path(path).is_file()
+        ]
+
+        with connection:
+            connection.executemany("DELETE FROM media WHERE path = ?", missing)
+
+
+STORE = MetadataStore(config.METADATA_PATH)
+
+
+async def probe(path: Path) -> Metadata:
+    cmd = (
+        f"{FFPROBE_PATH} -v error -select_streams a:0 "
+        f"-show_entries stream=codec_name,channels,bit_rate:format=duration,bit_rate "
+        f"-of json {shlex.quote(str(path))}"
+    )
+    async with SUPERVISOR.spawn("ffprobe", cmd, stdout=asyncio.subprocess.PIPE) as process:
+        output, _ = await process.communicate()
+
+    try:
+        info = json.loads(output)
+        stream = info["streams"][0]
+        bitrate = stream.get("bit_rate") or info["format"].get("bit_rate")
+
+        return Metadata(
+            codec=stream.get("codec_name"),
+            bitrate=round(int(bitrate) / 1000) if bitrate else None,
+            channels=stream.get("channels"),
+            duration=float(info["format"]["duration"])
+        )
+    except (ValueError, LookupError):
+        logger.warn(f"Could not probe {path}")
+        return None
+
+
+async def index(path: Path) -> Metadata:
+    metadata = STORE.get(path)
+    if metadata is not None:
+        return metadata
+
+    metadata = await probe(path)
+    if metadata is not None:
+        STORE.put(path, metadata)
+
+    return metadata
+
+
+def media_files(directories: Iterable[Path]) -> List[Path]:
+    return [
+        path
+        for directory in directories
+        for path in directory.glob("*.opus")
+        if not path.name.endswith(TEMPORARY_SUFFIXES)
+    ]
+
+
+async def scan(directories: Iterable[Path] = (config.DOWNLOAD_DIR, config.THEMES_DIR)):
+    """
+    Indexes every cached file that is not in the store yet. Probes run in parallel,
+    bounded by the ffprobe concurrency limit of the supervisor.
+    """
+    STORE.prune()
+
+    missing = [path for path in media_files(directories) if STORE.get(path) is None]
+    if not missing:
+        return
+
+    logger.info(f"Probing {len(missing)} unindexed file(s)")
+    results = await asyncio.gather(*map(index, missing))
+    logger.info(f"Indexed {sum(r is not None for r in results)}/{len(missing)} file(s)")
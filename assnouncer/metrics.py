@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import os
+import time
+import bisect
+import asyncio
+import logging
+
+import assnouncer
+
+from assnouncer import config
+
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Tuple, Union, TYPE_CHECKING
+from pathlib import Path
+
+if TYPE_CHECKING:
+    from assnouncer.assnouncer import Assnouncer
+
+logger = logging.getLogger(__name__)
+
+LAG_INTERVAL = 0.5
+
+
+@dataclass
+class Counter:
+    name: str
+    help: str
+    value: float = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def expose(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        yield f"{self.name} {self.value}"
+
+
+@dataclass
+class Gauge:
+    name: str
+    help: str
+    value: float = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def expose(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {self.value}"
+
+
+@dataclass
+class Histogram:
+    """
+    Fixed buckets allocated up front, so that observing a value never allocates.
+    Safe to observe from any thread, a lost update under contention is acceptable.
+    """
+
+    name: str
+    help: str
+    bounds: List[float]
+    counts: List[int] = None
+    sum: float = 0
+    count: int = 0
+
+    def __post_init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def expose(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            yield f'{self.name}_bucket{{le="{bound}"}} {cumulative}'
+        yield f'{self.name}_bucket{{le="+Inf"}} {self.count}'
+        yield f"{self.name}_sum {self.sum}"
+        yield f"{self.name}_count {self.count}"
+
+
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+JITTER_BUCKETS = [0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1]
+LAG_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5]
+
+CACHE_HITS = Counter("assnouncer_cache_hits_total", "Requests served from the download cache")
+CACHE_MISSES = Counter("assnouncer_cache_misses_total", "Requests that had to be downloaded")
+RECONNECTS = Counter("assnouncer_voice_reconnects_total", "Voice connection attempts after the first one")
+DOWNLOADS = Gauge("assnouncer_downloads_in_progress", "Downloads currently running")
+
+SEARCH_LATENCY = Histogram("assnouncer_search_seconds", "YouTube search latency", LATENCY_BUCKETS)
+DOWNLOAD_TIME = Histogram("assnouncer_download_seconds", "Wall time of download attempts", LATENCY_BUCKETS)
+FIRST_PACKET = Histogram(
+    "assnouncer_time_to_first_packet_seconds",
+    "Time from a chat command to its first audio packet",
+    LATENCY_BUCKETS
+)
+PACING_JITTER = Histogram(
+    "assnouncer_pacing_jitter_seconds",
+    "Deviation of the interval between audio packets from 20ms",
+    JITTER_BUCKETS
+)
+LOOP_LAG = Histogram("assnouncer_loop_lag_seconds", "Event loop scheduling lag", LAG_BUCKETS)
+
+STATIC: List[Union[Counter, Gauge, Histogram]] = [
+    CACHE_HITS, CACHE_MISSES, RECONNECTS, DOWNLOADS,
+    SEARCH_LATENCY, DOWNLOAD_TIME, FIRST_PACKET, PACING_JITTER, LOOP_LAG
+]
+
+
+def disk_usage(directory: Path) -> int:
+    try:
+        return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+    except OSError:
+        return 0
+
+
+def gauges(ass: Assnouncer) -> Iterable[Tuple[str, str, Dict[str, object], float]]:
+    """
+    Values read from the bot's state when scraped. Names ending in `_total` only ever
+    grow and are exposed as counters.
+    """
+    for guild_id, player in ass.players.items():
+        labels: Dict[str, object] = dict(guild=guild_id)
+        yield "assnouncer_song_queue_depth", "Songs waiting in the queue", labels, len(player.song_queue.data)
+        yield "assnouncer_theme_queue_depth", "Themes waiting in the queue", labels, len(player.theme_queue.data)
+
+    caches: Dict[str, Path] = dict(downloads=config.DOWNLOAD_DIR, themes=config.THEMES_DIR)
+    for name, directory in caches.items():
+        yield "assnouncer_cache_bytes", "Disk usage of cached audio", {"cache": name}, disk_usage(directory)
+
+    dropped = assnouncer.handler.dropped
+    for level in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+        help = "Log records dropped by a full log queue"
+        yield "assnouncer_log_records_dropped_total", help, {"level": level}, dropped[level]
+
+    outbox = ass.outbox
+    yield "assnouncer_messages_posted", "Messages posted to the outbox", {}, outbox.posted
+    yield "assnouncer_messages_sent", "Discord messages sent by the outbox", {}, outbox.sent
+    yield "assnouncer_rate_limit_hits", "429 responses from Discord", {}, outbox.rate_limit_hits
+    yield "assnouncer_rate_limit_wait_seconds", "Time spent waiting for the rate limit", {}, outbox.rate_limit_wait_time
+
+
+def expose(ass: Assnouncer) -> str:
+    lines: List[str] = []
+    for metric in STATIC:
+        lines.extend(metric.expose())
+
+    described = set()
+    for name, help, labels, value in gauges(ass):
+        if name not in described:
+            described.add(name)
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+
+        label = ",".join(f'{k}="{v}"' for k, v in labels.items())
+        lines.append(f"{name}{{{label}}} {value}" if label else f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+async def measure_lag():
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        LOOP_LAG.observe(max(0, time.perf_counter() - start - LAG_INTERVAL))
+
+
+def handler(ass: Assnouncer) -> Callable:
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            path = request.split(b" ", 2)[1] if request.count(b" ") >= 2 else b""
+
+            if path == b"/metrics":
+                # Disk usage walks the cache directories, keep that off the loop
+                status, body = "200 OK", await asyncio.to_thread(expose, ass)
+            else:
+                status, body = "404 Not Found", "Not found\n"
+
+            payload = body.encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+@dataclass
+class MetricsServer:
+    """
+    Serves /metrics in the Prometheus text format on localhost.
+    """
+
+    ass: Assnouncer
+    port: int
+    server: asyncio.AbstractServer = None
+    tasks: List[asyncio.Task] = field(default_factory=list)
+
+    async def start(self):
+        self.server = await asyncio.start_server(handler(self.ass), host="127.0.0.1", port=self.port)
+        self.tasks.append(asyncio.create_task(measure_lag(), name="loop-lag"))
+        logger.info(f"Serving metrics on http://127.0.0.1:{self.port}/metrics")
+
+    def close(self):
+        for task in self.tasks:
+            task.cancel()
+
+        if self.server is not None:
+            self.server.close()
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+
+from assnouncer import config
+
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Dict, List, TYPE_CHECKING
+from discord import HTTPException
+
+if TYPE_CHECKING:
+    from discord.abc import MessageableChannel
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_LIMIT = 2000
+FENCE = "```"
+
+# Discord allows 5 messages per 5 seconds in a channel
+RATE_LIMIT_BURST = 5
+RATE_LIMIT_PERIOD = 5.0
+
+
+class Priority(IntEnum):
+    ERROR = 0
+    NOW_PLAYING = 1
+    RESPONSE = 2
+
+
+@dataclass(order=True)
+class Outgoing:
+    priority: Priority
+    sequence: int
+    text: str = field(compare=False)
+
+
+def fence_after(text: str, fence: str) -> str:
+    """
+    The opening line of the code block still open at the end of `text`, given the one
+    open at its start, or None.
+    """
+    for line in text.split("\n"):
+        if line.count(FENCE) % 2 == 0:
+            continue
+
+        if fence is not None:
+            fence = None
+        else:
+            language = line.rsplit(FENCE, 1)[1].strip()
+            fence = FENCE + language if language.isidentifier() else FENCE
+
+    return fence
+
+
+def split(text: str) -> List[str]:
+    """
+    Cuts `text` into messages of at most MESSAGE_LIMIT characters, at line breaks where
+    possible. A code block that is cut is closed at the end of one message and opened
+    again, with its language, at the start of the next.
+    """
+    messages: List[str] = []
+    fence: str = None
+    while text:
+        head = "" if fence is None else fence + "\n"
+        if len(head) + len(text) <= MESSAGE_LIMIT:
+            messages.append(head + text)
+            break
+
+        # Keep room to close a block left open by the cut
+        limit = MESSAGE_LIMIT - len(head) - len(FENCE) - 1
+        cut = text.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+
+        part, text = text[:cut], text[cut:]
+        if text.startswith("\n"):
+            text = text[1:]
+
+        fence = fence_after(part, fence)
+        messages.append(head + part + ("" if fence is None else "\n" + FENCE))
+
+    return messages
+
+
+@dataclass
+class RateLimiter:
+    tokens: float = RATE_LIMIT_BURST
+    updated: float = field(default_factory=time.monotonic)
+
+    def delay(self) -> float:
+        now = time.monotonic()
+        rate = RATE_LIMIT_BURST / RATE_LIMIT_PERIOD
+
+        self.tokens = min(RATE_LIMIT_BURST, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+
+        delay = (1 - self.tokens) / rate
+        self.tokens = 0
+        self.updated = now + delay
+        return delay
+
+
+@dataclass
+class ChannelQueue:
+    outbox: Outbox
+    channel: MessageableChannel
+    pending: List[Outgoing] = field(default_factory=list)
+    limiter: RateLimiter = field(default_factory=RateLimiter)
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+    task: asyncio.Task = None
+
+    def put(self, item: Outgoing):
+        heapq.heappush(self.pending, item)
+        self.wakeup.set()
+
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.drain())
+
+    def merge(self) -> str:
+        parts: List[str] = []
+        length = 0
+        while self.pending:
+            text = self.pending[0].text
+            if parts and length + 1 + len(text) > MESSAGE_LIMIT:
+                break
+
+            heapq.heappop(self.pending)
+            parts.append(text)
+            length += len(text) + bool(length)
+
+        return "\n".join(parts)
+
+    async def drain(self):
+        while True:
+            await self.wakeup.wait()
+            await asyncio.sleep(self.outbox.window)
+            self.wakeup.clear()
+
+            while self.pending:
+                for text in split(self.merge()):
+                    await self.send(text)
+
+    async def send(self, text: str):
+        delay = self.limiter.delay()
+        if delay > 0:
+            self.outbox.rate_limit_waits += 1
+            self.outbox.rate_limit_wait_time += delay
+            await asyncio.sleep(delay)
+
+        try:
+            await self.channel.send(text)
+            self.outbox.sent += 1
+        except HTTPException as e:
+            if e.status == 429:
+                self.outbox.rate_limit_hits += 1
+            logger.warn(f"Could not send message to {self.channel}: {e}")
+
+
+@dataclass
+class Outbox:
+    """
+    Per-channel outgoing message queues. Messages posted to the same channel within
+    `window` seconds are merged into as few Discord messages as possible, highest
+    priority first, and sends are spaced out to stay under the channel rate limit.
+    """
+
+    window: float = field(default_factory=lambda: config.OUTBOX_WINDOW)
+    queues: Dict[int, ChannelQueue] = field(default_factory=dict)
+    sequence: itertools.count = field(default_factory=itertools.count)
+    posted: int = 0
+    sent: int = 0
+    rate_limit_hits: int = 0
+    rate_limit_waits: int = 0
+    rate_limit_wait_time: float = 0
+
+    def post(self, channel: MessageableChannel, text: str, priority: Priority = Priority.RESPONSE):
+        queue = self.queues.get(channel.id)
+        if queue is None:
+            queue = self.queues[channel.id] = ChannelQueue(outbox=self, channel=channel)
+
+        self.posted += 1
+        queue.put(Outgoing(priority=priority, sequence=next(self.sequence), text=text))
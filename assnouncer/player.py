@@ -0,0 +1,361 @@
+from __future__ import annotations
+
+import time
+import asyncio
+import logging
+
+from assnouncer import debug
+from assnouncer import trace
+from assnouncer import metrics
+from assnouncer import util
+from assnouncer import config
+from assnouncer.util import SongRequest
+from assnouncer.asspp import Timestamp
+from assnouncer.journal import Entry, Journal
+from assnouncer.queue import Queue
+from assnouncer.outbox import Priority
+from assnouncer.audio import music
+from assnouncer.audio.music import AudioSource, MusicState, Pacer
+
+from dataclasses import dataclass, field
+from typing import Awaitable, List, Tuple, TYPE_CHECKING
+from concurrent.futures import Future
+from threading import Event
+from asyncio import Lock, Task
+from discord import (
+    TextChannel, Guild, VoiceClient, Member,
+    VoiceChannel, SpeakingState
+)
+
+if TYPE_CHECKING:
+    from assnouncer.assnouncer import Assnouncer
+
+    from discord.abc import MessageableChannel
+
+
+logger = logging.getLogger(__name__)
+
+# How often play_sharded checks the voice connection while nothing else happens
+VOICE_CHECK_INTERVAL = 1.0
+
+
+@dataclass
+class Player:
+    ass: Assnouncer
+    guild_id: int
+    skip_event: Event = field(default_factory=Event)
+    # Set along with skips and themes, for play_sharded to hand them to the shard pool
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+    song_queue: Queue[Future[SongRequest]] = field(default_factory=Queue)
+    theme_queue: Queue[SongRequest] = field(default_factory=Queue)
+    lock: Lock = field(default_factory=Lock)
+    pacer: Pacer = field(default_factory=Pacer)
+    task: Task = None
+    journal: Journal = None
+    server: Guild = None
+    general: TextChannel = None
+    voice: VoiceClient = None
+
+    def skip(self):
+        # Journaled by whatever stops playing, which may be a theme rather than the song
+        self.skip_event.set()
+        self.wakeup.set()
+
+    def stop(self):
+        self.song_queue.clear()
+        self.journal.clear()
+        self.skip()
+
+    async def set_speaking(self, speaking: SpeakingState):
+        return await self.voice.ws.speak(speaking)
+
+    async def message(
+        self,
+        message: str,
+        channel: MessageableChannel = None,
+        priority: Priority = Priority.RESPONSE
+    ):
+        if channel is None:
+            channel = self.general
+
+        await self.ass.message(message, channel=channel, priority=priority)
+
+    async def reconnect_callback(self) -> VoiceClient:
+        return await self.ensure_connected()
+
+    @debug.profiled
+    def skip_requested(self) -> bool:
+        if self.skip_event.is_set():
+            self.skip_event.clear()
+
+            return True
+        return False
+
+    async def skip_callback(self) -> MusicState:
+        if self.skip_requested():
+            return MusicState.STOPPED
+        return MusicState.CONTINUED
+
+    async def theme_callback(self) -> MusicState:
+        state = await self.skip_callback()
+        if state is MusicState.STOPPED:
+            return MusicState.STOPPED
+
+        while not self.theme_queue.empty():
+            state = MusicState.INTERRUPTED
+
+            request = self.theme_queue.pop()
+            assert isinstance(request.source, AudioSource)
+            await music.play(
+                request.source,
+                self.pacer,
+                reconnect_callback=self.reconnect_callback,
+                state_callback=self.skip_callback
+            )
+
+        return state
+
+    async def play_sharded(self, request: SongRequest):
+        shards = self.ass.shards
+        shards.attach(self.guild_id, await self.ensure_connected())
+
+        # Themes are pushed on top of the song, a skip drops whichever plays. The requests
+        # stay referenced with their futures, collecting one deletes its file.
+        themes: List[Tuple[SongRequest, Future[None]]] = []
+        future = asyncio.wrap_future(shards.play(self.guild_id, request.source))
+        while not future.done():
+            self.wakeup.clear()
+
+            if self.skip_requested():
+                if request.journal_id is not None and all(played.done() for _, played in themes):
+                    self.journal.skip(request.journal_id)
+                shards.skip(self.guild_id)
+
+            while not self.theme_queue.empty():
+                theme = self.theme_queue.pop()
+                themes.append((theme, shards.play(self.guild_id, theme.source)))
+
+            if not self.voice.is_connected():
+                shards.attach(self.guild_id, await self.ensure_connected())
+
+            wakeup = asyncio.ensure_future(self.wakeup.wait())
+            waiting: List[asyncio.Future] = [future, wakeup]
+            await asyncio.wait(waiting, timeout=VOICE_CHECK_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+            wakeup.cancel()
+
+        for _, played in themes:
+            await asyncio.wrap_future(played)
+
+    async def handle_song(self, request: SongRequest):
+        # Songs restored from the journal can come up before anything connected
+        await self.ensure_connected()
+
+        if not request.sneaky:
+            parts = ["Playing", request.uri]
+            if (request.start, request.stop) != (None, None):
+                start = "<"
+                stop = ">"
+
+                if request.start is not None:
+                    start = str(request.start)
+
+                if request.stop is not None:
+                    stop = str(request.stop)
+
+                parts.append(f"[{start}-{stop}]")
+
+            if request.uri != request.query:
+                parts.append(f"({request.query!r})")
+
+            await self.message(" ".join(parts), channel=request.channel, priority=Priority.NOW_PLAYING)
+
+        self.skip_event.clear()
+
+        await self.set_speaking(SpeakingState.soundshare)
+        if self.ass.shards is not None:
+            await self.play_sharded(request)
+        else:
+            async def state_callback() -> MusicState:
+                if request.journal_id is not None:
+                    # Packets still in the buffer have been read but not played
+                    buffered = len(self.pacer.buffer.packets) * music.OPUS_DELAY
+                    self.journal.offset(request.journal_id, max(0, request.source.position - buffered))
+
+                # A skip while a theme plays only stops the theme, STOPPED means the song was skipped
+                state = await self.theme_callback()
+                if state is MusicState.STOPPED and request.journal_id is not None:
+                    self.journal.skip(request.journal_id)
+                return state
+
+            assert isinstance(request.source, AudioSource)
+            await music.play(
+                request.source,
+                self.pacer,
+                reconnect_callback=self.reconnect_callback,
+                state_callback=state_callback
+            )
+            await self.pacer.drained()
+        await self.set_speaking(SpeakingState.none)
+
+    async def song_loop(self):
+        while True:
+            request = self.theme_queue.pop() or self.song_queue.pop()
+            if request is None:
+                await asyncio.sleep(0.1)
+                continue
+
+            if isinstance(request, Future):
+                try:
+                    request = await asyncio.wrap_future(request)
+                except Exception:
+                    logger.exception("Could not prepare a queued song")
+                    request = None
+
+            if request is None:
+                message = "Маняк на бота му стана лошо, няма такава песен"
+                await self.message(message, priority=Priority.ERROR)
+                continue
+
+            if request.journal_id is not None:
+                self.journal.pop(request.journal_id)
+
+            token = trace.attach(request.trace)
+            try:
+                if request.trace is not None and request.trace.queued is not None:
+                    request.trace.record("queued", request.trace.queued, time.perf_counter())
+
+                with trace.span("handle song", uri=request.uri):
+                    await self.handle_song(request)
+            finally:
+                trace.detach(token)
+
+            # Not when cancelled, a song interrupted by shutting down is played again on startup
+            if request.journal_id is not None:
+                self.journal.done(request.journal_id)
+
+            debug.print_report()
+
+    def start(self):
+        if self.journal is None:
+            self.journal = Journal.open(config.JOURNAL_DIR / f"{self.guild_id}.jsonl")
+            self.restore()
+
+        if self.task is None or self.task.done():
+            self.task = self.ass.loop.create_task(self.song_loop(), name=f"player-{self.guild_id}")
+
+        if self.ass.shards is None:
+            self.pacer.start(name=f"pacer-{self.guild_id}")
+
+    @debug.profiled
+    async def ensure_connected(self):
+        async with self.lock:
+            if self.voice is not None and self.voice.is_connected():
+                return self.voice
+
+            if self.voice is not None:
+                metrics.RECONNECTS.inc()
+                logger.info(f"Trying to reconnect to voice in {self.guild_id}")
+                if await self.voice.potential_reconnect():
+                    self.pacer.client = self.voice
+                    return self.voice
+
+            logger.info(f"Connecting to {self.guild_id}")
+            self.server = self.ass.get_guild(self.guild_id)
+            self.general = self.server.text_channels[0]
+            vc: VoiceChannel = self.server.voice_channels[0]
+
+            while True:
+                try:
+                    self.voice = await vc.connect(timeout=10.0)
+                    self.pacer.client = self.voice
+                    return self.voice
+                except TimeoutError:
+                    logger.warn(f"Failed to connect to {self.guild_id}")
+
+    async def journaled(self, journal_id: int, request: Awaitable[SongRequest]) -> SongRequest:
+        try:
+            song = await request
+        except Exception:
+            self.journal.drop(journal_id)
+            raise
+
+        if song is None:
+            self.journal.drop(journal_id)
+        else:
+            song.journal_id = journal_id
+            self.journal.resolve(journal_id, song.uri)
+        return song
+
+    async def queue_song(
+        self,
+        request: Awaitable[SongRequest],
+        query: str,
+        uri: str = None,
+        start: Timestamp = None,
+        stop: Timestamp = None,
+        channel: MessageableChannel = None
+    ):
+        current = trace.current()
+        if current is not None:
+            current.queued = time.perf_counter()
+
+        journal_id = self.journal.enqueue(
+            query,
+            uri=uri,
+            start=None if start is None else start.value,
+            stop=None if stop is None else stop.value,
+            channel=None if channel is None else channel.id
+        )
+        self.song_queue.put(self.ass.run_coroutine(self.journaled(journal_id, request)))
+
+    async def recover(self, entry: Entry) -> SongRequest:
+        uri = entry.uri
+        if uri is None:
+            uri = await util.resolve_uri(entry.query)
+            if uri is None:
+                return None
+
+        channel: MessageableChannel = None
+        if entry.channel is not None:
+            channel = self.ass.get_channel(entry.channel)  # type: ignore
+
+        # Songs in the cache are loaded from disk, the rest are downloaded again
+        return await util.download(
+            entry.query,
+            uri,
+            start=None if entry.start is None else Timestamp.new(entry.start),
+            stop=None if entry.stop is None else Timestamp.new(entry.stop),
+            channel=channel,
+            offset=entry.offset
+        )
+
+    def restore(self):
+        entries = self.journal.pending()
+        if entries:
+            logger.info(f"Restoring {len(entries)} song(s) in {self.guild_id} from the queue journal")
+
+        for entry in entries:
+            self.song_queue.put(self.ass.run_coroutine(self.journaled(entry.id, self.recover(entry))))
+
+    async def play_theme(self, user: Member):
+        await self.ensure_connected()
+
+        theme_path = util.get_theme_path(user)
+
+        source = await util.load_source(theme_path)
+        if source is None:
+            logger.warn(f"No theme for {user}")
+            return
+
+        request = SongRequest(
+            source=source,
+            query=f"{user}'s theme",
+            uri=f"{user}'s theme",
+            channel=self.general
+        )
+
+        self.queue_theme(request)
+
+    def queue_theme(self, request: SongRequest):
+        self.theme_queue.put(request)
+        self.wakeup.set()
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import sys
+import time
+import asyncio
+import logging
+import threading
+
+from assnouncer import config
+
+from dataclasses import dataclass, field
+from collections import Counter
+from types import CodeType, FrameType
+from typing import Dict, List, Set, Tuple
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# 100 Hz, walking every stack costs tens of microseconds per sample, which keeps the
+# time the sampler holds the GIL well below the 20 ms between two Opus packets
+INTERVAL = 0.01
+MAX_DURATION = 120.0
+
+# A thread whose innermost Python frame is in one of these is waiting, not working
+IDLE_FILES = {"threading.py", "selectors.py", "queue.py", "connection.py", "thread.py"}
+
+Stack = Tuple[str, ...]
+
+
+@dataclass
+class Sampler:
+    """
+    Periodically records the stacks of every other thread (event loop, player, pacer,
+    executor workers...) from a background thread. Nothing is installed in the sampled
+    threads, so the overhead is limited to the sampler holding the GIL while it walks.
+    """
+
+    duration: float
+    interval: float = INTERVAL
+    stacks: Counter[Stack] = field(default_factory=Counter)
+    labels: Dict[CodeType, str] = field(default_factory=dict)
+    idle: Set[str] = field(default_factory=set)
+    samples: int = 0
+    elapsed: float = 0
+
+    def label(self, code: CodeType) -> str:
+        label = self.labels.get(code)
+        if label is None:
+            filename = Path(code.co_filename).name
+            # The collapsed format separates frames with ;
+            label = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+            self.labels[code] = label
+
+            if filename in IDLE_FILES:
+                self.idle.add(label)
+        return label
+
+    def walk(self, thread: str, frame: FrameType) -> Stack:
+        stack: List[str] = []
+        while frame is not None:
+            stack.append(self.label(frame.f_code))
+            frame = frame.f_back
+
+        stack.append(thread.replace(";", ":"))
+        stack.reverse()
+        return tuple(stack)
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        for ident, frame in sys._current_frames().items():
+            if ident != own:
+                self.stacks[self.walk(names.get(ident, str(ident)), frame)] += 1
+        self.samples += 1
+
+    def run(self):
+        start = time.perf_counter()
+        deadline = start + self.duration
+
+        next_sample = start
+        while next_sample < deadline:
+            self.sample()
+
+            next_sample += self.interval
+            time.sleep(max(0, next_sample - time.perf_counter()))
+
+        self.elapsed = time.perf_counter() - start
+
+    def collapsed(self) -> str:
+        """
+        One `frame;frame;frame count` line per distinct stack, rooted at the thread name,
+        as read by flamegraph.pl, speedscope and friends.
+        """
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def busy(self) -> Dict[Stack, int]:
+        return {stack: count for stack, count in self.stacks.items() if stack[-1] not in self.idle}
+
+    def top(self, count: int = 10) -> List[Tuple[str, int, int]]:
+        """
+        The `count` frames with the most samples on top of a busy stack, with their self
+        and total sample counts.
+        """
+        own: Counter[str] = Counter()
+        total: Counter[str] = Counter()
+        for stack, samples in self.busy().items():
+            own[stack[-1]] += samples
+            for frame in set(stack[1:]):
+                total[frame] += samples
+
+        return [(frame, samples, total[frame]) for frame, samples in own.most_common(count)]
+
+    def format(self, count: int = 10) -> str:
+        stacks = sum(self.stacks.values())
+        busy = sum(self.busy().values())
+        lines = [
+            f"{self.samples} samples of {stacks // max(self.samples, 1)} thread(s) over {self.elapsed:.1f}s, "
+            f"{1 - busy / max(stacks, 1):.0%} of them waiting",
+            f"{'self':>6} {'total':>6}  frame",
+        ]
+        for frame, own, total in self.top(count):
+            lines.append(f"{own / stacks:>6.1%} {total / stacks:>6.1%}  {frame}")
+        return "\n".join(lines)
+
+
+LOCK = asyncio.Lock()
+
+
+async def profile(duration: float) -> Tuple[Sampler, Path]:
+    """
+    Samples all threads for `duration` seconds and writes the collapsed stacks to
+    PROFILES_DIR. Only one profile runs at a time.
+    """
+    sampler = Sampler(duration=min(duration, MAX_DURATION))
+
+    async with LOCK:
+        await asyncio.to_thread(sampler.run)
+
+    config.PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+    path = config.PROFILES_DIR / f"profile-{time.strftime('%Y%m%d-%H%M%S')}.collapsed"
+    await asyncio.to_thread(path.write_text, sampler.collapsed(), encoding="utf8")
+
+    logger.info(f"Wrote {sampler.samples} samples to {path}")
+    return sampler, path
@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import os
+import time
+import signal
+import asyncio
+import logging
+
+from dataclasses import dataclass, field
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Tuple
+from subprocess import Popen
+from threading import Lock, Thread
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PROC = Path("/proc")
+
+SAMPLE_INTERVAL = 0.5
+
+
+@dataclass(frozen=True)
+class Limits:
+    timeout: float = None
+    concurrency: int = None
+
+
+# Keyed by the kind passed to `spawn`/`run`/`watch`, unknown kinds are unlimited
+LIMITS: Dict[str, Limits] = {
+    "yt-dlp": Limits(timeout=600, concurrency=3),
+    "spotdl": Limits(timeout=600, concurrency=2),
+    "ffmpeg": Limits(timeout=120, concurrency=os.cpu_count()),
+    "ffprobe": Limits(timeout=30, concurrency=4),
+    "pip": Limits(timeout=300, concurrency=1),
+    # Playback runs for as long as the song does and the worker pools for as long as the bot,
+    # they are only accounted for
+    "ffmpeg-play": Limits(),
+    "yt-dlp-worker": Limits(),
+    "player-worker": Limits(),
+}
+
+
+@dataclass
+class ProcessRecord:
+    kind: str
+    command: str
+    pid: int
+    group: bool
+    timeout: float = None
+    started: float = field(default_factory=time.perf_counter)
+    wall_time: float = None
+    cpu_time: float = 0
+    max_rss: int = 0
+    returncode: int = None
+    killed: bool = False
+
+    def elapsed(self) -> float:
+        if self.wall_time is not None:
+            return self.wall_time
+        return time.perf_counter() - self.started
+
+    def format(self) -> str:
+        state = "running" if self.wall_time is None else f"exit {self.returncode}"
+        if self.killed:
+            state = "KILLED"
+
+        return (
+            f"{self.kind:12} {state:8} wall={self.elapsed():7.2f}s cpu={self.cpu_time:7.2f}s "
+            f"rss={self.max_rss / 2 ** 20:6.1f}MiB {self.command[:60]}"
+        )
+
+
+def read_stat(pid: str) -> Tuple[int, float, int]:
+    """
+    Process group, CPU seconds (including reaped children) and RSS bytes of `pid`.
+    """
+    try:
+        stat = (PROC / pid / "stat").read_text()
+    except OSError:
+        return None
+
+    fields = stat[stat.rfind(")") + 2:].split()
+    ticks = sum(int(value) for value in fields[11:15])
+    return int(fields[2]), ticks / os.sysconf("SC_CLK_TCK"), int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+
+
+@dataclass
+class Supervisor:
+    """
+    Starts and accounts for every child process of the bot. Each kind of tool gets
+    its own concurrency limit and timeout, after which the whole process group is
+    killed. CPU time and peak RSS are sampled from /proc by a background thread.
+    """
+
+    limits: Dict[str, Limits] = field(default_factory=lambda: dict(LIMITS))
+    semaphores: Dict[str, asyncio.Semaphore] = field(default_factory=dict)
+    running: Dict[int, ProcessRecord] = field(default_factory=dict)
+    finished: deque[ProcessRecord] = field(default_factory=lambda: deque(maxlen=500))
+    lock: Lock = field(default_factory=Lock)
+    thread: Thread = None
+
+    def semaphore(self, kind: str) -> asyncio.Semaphore:
+        semaphore = self.semaphores.get(kind)
+        if semaphore is None:
+            concurrency = self.limits.get(kind, Limits()).concurrency
+            semaphore = self.semaphores[kind] = asyncio.Semaphore(concurrency or 2 ** 16)
+        return semaphore
+
+    def register(self, kind: str, command: str, pid: int, group: bool) -> ProcessRecord:
+        record = ProcessRecord(
+            kind=kind,
+            command=command,
+            pid=pid,
+            group=group,
+            timeout=self.limits.get(kind, Limits()).timeout
+        )
+
+        with self.lock:
+            self.running[pid] = record
+
+            if self.thread is None:
+                self.thread = Thread(target=self.monitor, name="process-supervisor", daemon=True)
+                self.thread.start()
+
+        return record
+
+    def release(self, record: ProcessRecord, returncode: int):
+        # Called on the event loop, so no walk over /proc for a whole group: by now its leader
+        # has exited and the monitor's last totals stand. A single process is one cheap read.
+        totals = {} if record.group else self.sample([record])
+
+        with self.lock:
+            if self.running.pop(record.pid, None) is None:
+                return
+
+            self.update([record], totals)
+            record.returncode = returncode
+            record.wall_time = time.perf_counter() - record.started
+            self.finished.append(record)
+
+    def kill(self, record: ProcessRecord):
+        record.killed = True
+        try:
+            if record.group:
+                os.killpg(record.pid, signal.SIGKILL)
+            else:
+                os.kill(record.pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+    @asynccontextmanager
+    async def spawn(self, kind: str, cmd: str, **kwargs) -> AsyncIterator[asyncio.subprocess.Process]:
+        """
+        Runs the shell command `cmd` in its own process group. Leaving the block waits
+        for the process to exit, or kills it if the block raised.
+        """
+        group = os.name == "posix"
+
+        async with self.semaphore(kind):
+            process = await asyncio.create_subprocess_shell(cmd, start_new_session=group, **kwargs)
+            record = self.register(kind, cmd, process.pid, group)
+
+            try:
+                yield process
+                await process.wait()
+            finally:
+                if process.returncode is None:
+                    self.kill(record)
+                    await process.wait()
+
+                self.release(record, process.returncode)
+
+    async def run(self, kind: str, cmd: str, **kwargs) -> int:
+        async with self.spawn(kind, cmd, **kwargs) as process:
+            return await process.wait()
+
+    def watch(self, kind: str, process: Popen) -> ProcessRecord:
+        """
+        Accounts for a process started elsewhere, e.g. by discord.py.
+        """
+        return self.register(kind, str(process.args), process.pid, group=False)
+
+    def sample(self, records: List[ProcessRecord]) -> Dict[int, Tuple[float, int]]:
+        """
+        CPU seconds and RSS bytes of each record, by pid, summed over its process group
+        for group records. Reads /proc without holding the lock.
+        """
+        if not PROC.is_dir():
+            return {}
+
+        groups = {record.pid: record for record in records if record.group}
+        totals: Dict[int, Tuple[float, int]] = {}
+
+        pids = [entry.name for entry in PROC.iterdir() if entry.name.isdigit()] if groups else []
+        for pid in pids + [str(record.pid) for record in records if not record.group]:
+            stat = read_stat(pid)
+            if stat is None:
+                continue
+
+            pgrp, cpu, rss = stat
+            owner = pgrp if pgrp in groups else int(pid)
+            cpu_total, rss_total = totals.get(owner, (0, 0))
+            totals[owner] = (cpu_total + cpu, rss_total + rss)
+
+        return totals
+
+    def update(self, records: List[ProcessRecord], totals: Dict[int, Tuple[float, int]]):
+        for record in records:
+            cpu, rss = totals.get(record.pid, (0, 0))
+            record.cpu_time = max(record.cpu_time, cpu)
+            record.max_rss = max(record.max_rss, rss)
+
+    def monitor(self):
+        while True:
+            with self.lock:
+                records = list(self.running.values())
+
+            totals = self.sample(records)
+            with self.lock:
+                self.update(records, totals)
+
+            for record in records:
+                if record.timeout is not None and not record.killed and record.elapsed() > record.timeout:
+                    logger.warn(f"Killing {record.kind} (pid {record.pid}) after {record.timeout}s: {record.command}")
+                    self.kill(record)
+
+            time.sleep(SAMPLE_INTERVAL)
+
+    def top(self, count: int = 5) -> List[ProcessRecord]:
+        with self.lock:
+            records = list(self.finished) + list(self.running.values())
+        return sorted(records, key=lambda r: r.cpu_time, reverse=True)[:count]
+
+    def totals(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            records = list(self.finished) + list(self.running.values())
+
+        totals: Dict[str, Dict[str, float]] = {}
+        for record in records:
+            total = totals.setdefault(record.kind, dict(count=0, cpu_time=0, wall_time=0, killed=0))
+            total["count"] += 1
+            total["cpu_time"] += record.cpu_time
+            total["wall_time"] += record.elapsed()
+            total["killed"] += record.killed
+        return totals
+
+    def format(self, count: int = 5) -> str:
+        lines = [
+            f"{kind:12} n={total['count']:<4} cpu={total['cpu_time']:8.2f}s "
+            f"wall={total['wall_time']:8.2f}s killed={total['killed']}"
+            for kind, total in sorted(self.totals().items())
+        ]
+        lines.append("Top consumers:")
+        lines.extend(record.format() for record in self.top(count))
+        return "\n".join(lines)
+
+
+SUPERVISOR = Supervisor()
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import os
+import json
+import time
+import asyncio
+import itertools
+
+from assnouncer import config
+from assnouncer import metrics
+
+from dataclasses import dataclass, field
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Dict, IO, Iterator
+from threading import Lock
+from pathlib import Path
+from weakref import WeakKeyDictionary
+
+# Chrome traces want wall clock microseconds, spans are timed with perf_counter
+EPOCH = time.time() - time.perf_counter()
+
+
+@dataclass
+class TraceWriter:
+    """
+    Appends trace events to `path`, one per line. The file is a JSON array without
+    its closing bracket, which chrome://tracing and Perfetto both accept as is.
+    """
+
+    path: Path
+    file: IO[str] = None
+    lock: Lock = field(default_factory=Lock)
+
+    def write(self, event: Dict[str, Any]):
+        with self.lock:
+            if self.file is None:
+                new = not self.path.is_file() or self.path.stat().st_size == 0
+                self.file = self.path.open("a", encoding="utf8")
+                if new:
+                    self.file.write("[\n")
+
+            self.file.write(json.dumps(event, default=str) + ",\n")
+            self.file.flush()
+
+
+@dataclass
+class Trace:
+    """
+    Timeline of one chat request, shown as its own track in the trace viewer.
+    """
+
+    id: int
+    name: str
+    # Without a writer the trace only keeps the timestamps used for metrics
+    writer: TraceWriter = None
+    args: Dict[str, Any] = field(default_factory=dict)
+    start: float = field(default_factory=time.perf_counter)
+    queued: float = None
+    first_packet: float = None
+
+    def event(self, name: str, phase: str, start: float, **extra):
+        if self.writer is None:
+            return
+
+        self.writer.write(dict(
+            name=name,
+            cat="assnouncer",
+            ph=phase,
+            ts=round((EPOCH + start) * 1e6),
+            pid=os.getpid(),
+            tid=self.id,
+            **extra
+        ))
+
+    def record(self, name: str, start: float, stop: float, **args):
+        self.event(name, "X", start, dur=round((stop - start) * 1e6), args=args)
+
+    def instant(self, name: str, **args):
+        self.event(name, "i", time.perf_counter(), s="t", args=args)
+
+    def __str__(self) -> str:
+        return f"{self.name} #{self.id} {self.args}"
+
+
+WRITER: TraceWriter = None
+
+IDS = itertools.count(1)
+
+CURRENT: ContextVar[Trace] = ContextVar("trace", default=None)
+
+# The trace each task was started or attached with, readable from other threads
+TASKS: WeakKeyDictionary[asyncio.Task, Trace] = WeakKeyDictionary()
+
+
+def current() -> Trace:
+    return CURRENT.get()
+
+
+def begin(name: str, **args) -> Trace:
+    """
+    Starts a new trace for the current task and everything it spawns. Events are only
+    written out if TRACE_PATH is configured.
+    """
+    global WRITER
+
+    if WRITER is None and config.TRACE_PATH is not None:
+        WRITER = TraceWriter(Path(config.TRACE_PATH))
+
+    trace = Trace(id=next(IDS), name=name, writer=WRITER, args=args)
+    trace.event("thread_name", "M", trace.start, args=dict(name=f"{name} #{trace.id}"))
+    trace.instant(name, **args)
+
+    attach(trace)
+    return trace
+
+
+def attach(trace: Trace) -> Token[Trace]:
+    task = asyncio.current_task()
+    if task is not None and trace is not None:
+        TASKS[task] = trace
+
+    return CURRENT.set(trace)
+
+
+def detach(token: Token[Trace]):
+    task = asyncio.current_task()
+    if task is not None:
+        TASKS.pop(task, None)
+
+    CURRENT.reset(token)
+
+
+@contextmanager
+def span(name: str, **args) -> Iterator[Trace]:
+    trace = CURRENT.get()
+    if trace is None:
+        yield None
+        return
+
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.record(name, start, time.perf_counter(), **args)
+
+
+def first_packet():
+    trace = CURRENT.get()
+    if trace is None or trace.first_packet is not None:
+        return
+
+    trace.first_packet = time.perf_counter()
+    trace.record("time to first packet", trace.start, trace.first_packet)
+    metrics.FIRST_PACKET.observe(trace.first_packet - trace.start)
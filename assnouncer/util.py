@@ -1,36 +1,65 @@
 from __future__ import annotations
 
+import os
+import time
+import asyncio
 import hashlib
 import logging
+import re
 
+from assnouncer import trace
+from assnouncer import config
+from assnouncer import metrics
+from assnouncer import ingest
+from assnouncer import metadata
 from assnouncer.config import THEMES_DIR, DOWNLOAD_DIR
+from assnouncer.metadata import Metadata
 from assnouncer.asspp import Timestamp
-from assnouncer.downloaders import BaseDownloader
-from assnouncer.audio.music import AudioSource
+from assnouncer.downloaders import BaseDownloader, stats
+from assnouncer.downloaders.stats import DownloadStats
+from assnouncer.audio.music import AudioSource, SourceFile
+from assnouncer.trace import Trace
 
 from dataclasses import dataclass
-from typing import List, TypeVar, Union, TYPE_CHECKING
-from pytube import YouTube, Search
+from typing import Dict, List, TypeVar, Union, TYPE_CHECKING
+from urllib.parse import urlsplit, parse_qs
 from pathlib import Path
 from discord import User, Member
 
 if TYPE_CHECKING:
     from discord.abc import MessageableChannel
+    from pytube import YouTube
 
 T = TypeVar("T", bound="type")
 
 logger = logging.getLogger(__name__)
 
+PENDING_DOWNLOADS: Dict[Path, asyncio.Future[bool]] = {}
+
+OFFSET_KEYS = ["t", "start", "time_continue"]
+OFFSET_PATTERN = re.compile(r"(?:(?P<h>\d+)h)?(?:(?P<m>\d+)m)?(?:(?P<s>\d+)s?)?")
+
 
 @dataclass
 class SongRequest:
-    source: AudioSource
+    # An AudioSource, or only the file when shard workers do the decoding
+    source: SourceFile
     query: str
     uri: str
     start: Timestamp = None
     stop: Timestamp = None
     channel: MessageableChannel = None
     sneaky: bool = False
+    trace: Trace = None
+    # Set for songs that are kept in the queue journal
+    journal_id: int = None
+
+
+@dataclass(frozen=True)
+class MediaUri:
+    uri: str
+    key: str
+    start: Timestamp = None
 
 
 def subclasses(cls: T) -> List[T]:
@@ -53,13 +82,56 @@ def get_theme_path(user: Union[Member, User, str]) -> Path:
     return (THEMES_DIR / f"{user}").with_suffix(".opus")
 
 
+def parse_offset(uri: str) -> Timestamp:
+    parts = urlsplit(uri)
+    if parts.scheme not in ("http", "https"):
+        return None
+
+    params = parse_qs(parts.query)
+    params.update(parse_qs(parts.fragment))
+    for key in OFFSET_KEYS:
+        for value in params.get(key, []):
+            if ":" in value:
+                try:
+                    return Timestamp.parse(None, None, value)
+                except ValueError:
+                    continue
+
+            match = OFFSET_PATTERN.fullmatch(value)
+            if match is None or not any(match.groups()):
+                continue
+
+            hours, minutes, seconds = (int(part or 0) for part in match.groups())
+            return Timestamp.new(hours * 3600 + minutes * 60 + seconds)
+
+    return None
+
+
+def canonicalize(uri: str) -> MediaUri:
+    start = parse_offset(uri)
+
+    canonical = BaseDownloader.canonicalize(uri)
+    if canonical is not None:
+        uri, key = canonical
+        return MediaUri(uri=uri, key=key, start=start)
+
+    return MediaUri(uri=uri, key=uri, start=start)
+
+
 def get_download_path(uri: str, start: Timestamp = None, stop: Timestamp = None) -> Path:
-    hash_string = f"[{start}-{stop}] {uri}"
+    hash_string = f"[{start}-{stop}] {canonicalize(uri).key}"
     hash_value = hashlib.md5(hash_string.encode("utf8")).hexdigest()
     return (DOWNLOAD_DIR / hash_value).with_suffix(".opus")
 
 
+def get_staging_path(filename: Path) -> Path:
+    # Deterministic, so that a restarted download finds and resumes the partial files of the last one
+    return filename.with_suffix(".staging.opus")
+
+
 def search_song(query: str) -> str:
+    from pytube import Search
+
     results: List[YouTube]
     results, _ = Search(query).fetch_and_parse()
     if results:
@@ -71,21 +143,33 @@ def search_song(query: str) -> str:
 
 
 def can_download(uri: str) -> bool:
-    return any(d.accept(uri) for d in subclasses(BaseDownloader))
+    return bool(BaseDownloader.route(uri))
 
 
 async def resolve_uri(query: str) -> str:
-    if can_download(query):
-        return query
-    else:
-        return search_song(query)
+    uri = canonicalize(query).uri
+    if can_download(uri):
+        return uri
+
+    with trace.span("search", query=query):
+        start = time.perf_counter()
+        uri = await asyncio.to_thread(search_song, query)
+        metrics.SEARCH_LATENCY.observe(time.perf_counter() - start)
+    if uri is None:
+        return None
+
+    return canonicalize(uri).uri
 
 
-async def load_source(uri: Path) -> AudioSource:
+async def load_source(uri: Path, offset: float = 0) -> SourceFile:
     if not uri.is_file():
         return None
 
-    return await AudioSource.from_source(uri)
+    with trace.span("load source"):
+        if config.PLAYER_SHARDS > 0:
+            # Shard workers run their own ffmpeg, starting one here would only be thrown away
+            return await SourceFile.from_source(uri, offset=offset)
+        return await AudioSource.from_source(uri, offset=offset)
 
 
 async def download(
@@ -96,13 +180,17 @@ async def download(
     filename: Path = None,
     channel: MessageableChannel = None,
     sneaky: bool = False,
-    force: bool = False
+    force: bool = False,
+    offset: float = 0
 ) -> SongRequest:
+    if start is None:
+        start = canonicalize(query).start
+
     if filename is None:
         filename = get_download_path(uri, start=start, stop=stop)
 
     async def load_song() -> SongRequest:
-        source = await load_source(filename)
+        source = await load_source(filename, offset=offset)
         return SongRequest(
             source=source,
             query=query,
@@ -110,22 +198,94 @@ async def download(
             start=start,
             stop=stop,
             channel=channel,
-            sneaky=sneaky
+            sneaky=sneaky,
+            trace=trace.current()
         )
 
-    if filename.is_file():
-        if force:
-            filename.unlink()
-        else:
-            return await load_song()
+    # Forced downloads replace the file only once the new one is complete
+    if filename.is_file() and not force:
+        metrics.CACHE_HITS.inc()
+        return await load_song()
+
+    metrics.CACHE_MISSES.inc()
 
-    for downloader in subclasses(BaseDownloader):
-        if downloader.accept(uri):
-            logger.info(f"Downloading via {downloader.__name__}")
-            if await downloader.download(uri, filename, start=start, stop=stop):
-                logger.info("Download successful")
-                return await load_song()
-            else:
-                logger.warn("Download unsuccessful")
+    with trace.span("download", uri=uri):
+        fetched = await fetch(uri, filename, start=start, stop=stop)
+
+    if fetched:
+        return await load_song()
 
     return None
+
+
+async def fetch(uri: str, filename: Path, start: Timestamp = None, stop: Timestamp = None) -> bool:
+    pending = PENDING_DOWNLOADS.get(filename)
+    if pending is None:
+        pending = asyncio.ensure_future(fetch_uncached(uri, filename, start=start, stop=stop))
+        PENDING_DOWNLOADS[filename] = pending
+        metrics.DOWNLOADS.inc()
+
+        def done(_):
+            PENDING_DOWNLOADS.pop(filename, None)
+            metrics.DOWNLOADS.dec()
+
+        pending.add_done_callback(done)
+    else:
+        logger.info(f"Joining pending download of {uri}")
+
+    return await asyncio.shield(pending)
+
+
+async def commit(staging: Path, filename: Path, loudness: float = None) -> bool:
+    """
+    Moves a finished download into the cache, if it is a non-empty file with a duration.
+    """
+    info: Metadata = None
+    with stats.current().phase("verify"):
+        if staging.is_file() and staging.stat().st_size > 0:
+            info = await metadata.probe(staging)
+
+    if info is None or not info.duration:
+        logger.warn(f"Discarding invalid download {staging}")
+        staging.unlink(missing_ok=True)
+        return False
+
+    info.loudness = loudness
+    os.replace(staging, filename)
+    metadata.STORE.put(filename, info)
+    return True
+
+
+async def fetch_uncached(uri: str, filename: Path, start: Timestamp = None, stop: Timestamp = None) -> bool:
+    staging = get_staging_path(filename)
+
+    for downloader in BaseDownloader.route(uri):
+        logger.info(f"Downloading via {downloader.__name__}")
+
+        current = DownloadStats(uri=uri, downloader=downloader.__name__)
+        stats.CURRENT.set(current)
+
+        # A finished but uncommitted file may already be cut, only partial fetches are resumed
+        staging.unlink(missing_ok=True)
+
+        success = False
+        try:
+            with trace.span(f"fetch via {downloader.__name__}"):
+                success = await downloader.download(uri, staging, start=start, stop=stop)
+
+            if success:
+                with trace.span("ingest"):
+                    loudness = await ingest.run(staging, start=start, stop=stop)
+                success = await commit(staging, filename, loudness=loudness)
+        finally:
+            current.finish(success, filename)
+            stats.HISTORY.add(current)
+            metrics.DOWNLOAD_TIME.observe(current.wall_time)
+
+        if success:
+            logger.info("Download successful")
+            return True
+        else:
+            logger.warn("Download unsuccessful")
+
+    return False
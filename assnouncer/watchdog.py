@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+
+from assnouncer import trace
+
+from dataclasses import dataclass
+from threading import Event, Thread
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Watchdog:
+    """
+    Pings the event loop from a separate thread. If a ping is not answered within
+    `threshold` seconds, the stack of the loop thread is captured while it is still
+    blocked and logged together with the task and request that were running.
+    """
+
+    loop: asyncio.AbstractEventLoop
+    threshold: float
+    thread_id: int = None
+    thread: Thread = None
+    closed: bool = False
+
+    def start(self):
+        self.thread_id = threading.get_ident()
+        self.thread = Thread(target=self.run, name="loop-watchdog", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.closed = True
+
+    def describe(self) -> str:
+        task = asyncio.current_task(self.loop)
+        if task is None:
+            return "outside of any task"
+
+        request = trace.TASKS.get(task)
+        if request is None:
+            return f"in task {task.get_name()!r}"
+        return f"in task {task.get_name()!r} handling {request}"
+
+    def capture(self) -> str:
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return "<no stack>"
+        return "".join(traceback.format_stack(frame))
+
+    def run(self):
+        while not self.closed:
+            answered = Event()
+            sent = time.perf_counter()
+            self.loop.call_soon_threadsafe(answered.set)
+
+            if not answered.wait(self.threshold):
+                where = self.describe()
+                stack = self.capture()
+
+                answered.wait()
+                lag = time.perf_counter() - sent
+                logger.warn(f"Event loop blocked for {lag:.3f}s {where}, stack while blocked:\n{stack}")
+
+            time.sleep(self.threshold)
@@ -0,0 +1,60 @@
+"""
+Runs the benchmark suite, saves the results and optionally compares them to a baseline.
+
+    python -m benchmarks --output results.json
+    python -m benchmarks --baseline results.json --threshold 0.1
+    python -m benchmarks -k asspp -k commands --quick
+
+Exits with status 1 if any metric regressed against the baseline.
+"""
+from __future__ import annotations
+
+import re
+import sys
+import json
+import logging
+
+from argparse import ArgumentParser
+from pathlib import Path
+
+# Registration order is run order, the quick micro-benchmarks first
+from benchmarks import micro  # noqa: F401
+from benchmarks import macro
+from benchmarks.suite import BENCHMARKS, compare, run, save
+
+parser = ArgumentParser(prog="benchmarks", description=__doc__.strip().splitlines()[0])
+parser.add_argument("-k", dest="patterns", action="append", help="Only run benchmarks matching this regex")
+parser.add_argument("--output", type=Path, help="Write the results to this JSON file")
+parser.add_argument("--baseline", type=Path, help="Compare against the results in this JSON file")
+parser.add_argument("--threshold", type=float, default=0.2, help="Relative change that counts as a regression")
+parser.add_argument("--quick", action="store_true", help="Shorter audio and fewer load levels")
+parser.add_argument("--list", action="store_true", help="List the benchmarks and exit")
+args = parser.parse_args()
+
+logging.getLogger().setLevel(logging.WARNING)
+macro.QUICK = args.quick
+
+selected = [
+    bench for bench in BENCHMARKS
+    if not args.patterns or any(re.search(pattern, bench.name) for pattern in args.patterns)
+]
+
+if args.list:
+    print("\n".join(bench.name for bench in selected))
+    sys.exit(0)
+
+# Read it first, a typo in the path should not cost a whole run
+baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+
+results = run(selected)
+if args.output is not None:
+    save(results, args.output)
+
+if baseline is not None:
+    regressions = compare(results, baseline, threshold=args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:")
+        print("\n".join(regressions))
+        sys.exit(1)
+
+    print(f"\nNo regressions over {args.threshold:.0%} against {args.baseline}")
@@ -0,0 +1,303 @@
+"""
+Stand-ins for the parts of Discord and the download backends that the bot talks to,
+so that a real `Assnouncer` can be driven offline.
+"""
+from __future__ import annotations
+
+import os
+import time
+import shutil
+import asyncio
+import functools
+import itertools
+import tempfile
+
+from assnouncer import config
+from assnouncer import trace
+from assnouncer import metadata
+from assnouncer.asspp import Timestamp
+from assnouncer.assnouncer import Assnouncer
+from assnouncer.audio.music import OPUS_DELAY
+from assnouncer.downloaders.base import BaseDownloader
+from assnouncer.supervisor import SUPERVISOR
+
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from typing import ClassVar, Dict, Iterator, List, Tuple
+from urllib.parse import urlsplit, parse_qs
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from unittest import mock
+from pathlib import Path
+
+IDS = itertools.count(1_000_000)
+
+# A gap longer than this between two packets is a new song, not jitter
+SONG_GAP = 0.25
+
+
+@dataclass(eq=False)
+class FakeUser:
+    name: str
+    discriminator: str = "0001"
+    id: int = field(default_factory=lambda: next(IDS))
+
+    def __str__(self) -> str:
+        return f"{self.name}#{self.discriminator}"
+
+
+@dataclass(eq=False)
+class FakeTextChannel:
+    name: str
+    id: int = field(default_factory=lambda: next(IDS))
+    sent: List[Tuple[float, str]] = field(default_factory=list)
+    latency: float = 0.05
+
+    async def send(self, text: str):
+        await asyncio.sleep(self.latency)
+        self.sent.append((time.perf_counter(), text))
+
+
+@dataclass
+class FakeWebSocket:
+    async def speak(self, *_):
+        pass
+
+
+@dataclass(eq=False)
+class FakeVoiceClient:
+    """
+    Records when every packet was handed over instead of sending it.
+    """
+
+    connected: bool = True
+    ws: FakeWebSocket = field(default_factory=FakeWebSocket)
+    sends: List[float] = field(default_factory=list)
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    async def potential_reconnect(self) -> bool:
+        self.connected = True
+        return True
+
+    def send_audio_packet(self, data: bytes, encode: bool = True):
+        self.sends.append(time.perf_counter())
+
+
+@dataclass(eq=False)
+class FakeVoiceChannel:
+    name: str
+    id: int = field(default_factory=lambda: next(IDS))
+    clients: List[FakeVoiceClient] = field(default_factory=list)
+
+    async def connect(self, timeout: float = None) -> FakeVoiceClient:
+        client = FakeVoiceClient()
+        self.clients.append(client)
+        return client
+
+
+@dataclass(eq=False)
+class FakeGuild:
+    id: int = field(default_factory=lambda: next(IDS))
+    text_channels: List[FakeTextChannel] = field(default_factory=lambda: [FakeTextChannel("general")])
+    voice_channels: List[FakeVoiceChannel] = field(default_factory=lambda: [FakeVoiceChannel("General")])
+
+    @property
+    def voice(self) -> FakeVoiceClient:
+        clients = self.voice_channels[0].clients
+        return clients[-1] if clients else None
+
+
+@dataclass(eq=False)
+class FakeMessage:
+    content: str
+    guild: FakeGuild
+    author: FakeUser
+    channel: FakeTextChannel
+
+
+class SyntheticDownloader(BaseDownloader):
+    """
+    Serves `synthetic://<name>?d=<seconds>&latency=<seconds>` from a sine tone, after
+    sleeping for the given latency. Each distinct duration is only encoded once.
+    """
+
+    PATTERNS: ClassVar[List[str]] = [r"synthetic://.*"]
+    PRIORITY: ClassVar[int] = 100
+
+    TEMPLATES: ClassVar[Dict[float, Path]] = {}
+    WORKDIR: ClassVar[Path] = Path(".")
+
+    @staticmethod
+    async def template(duration: float) -> Path:
+        path = SyntheticDownloader.TEMPLATES.get(duration)
+        if path is not None:
+            return path
+
+        path = SyntheticDownloader.WORKDIR / f"synthetic-{duration}.opus"
+        cmd = (
+            f"{config.FFMPEG_PATH} -hide_banner -loglevel error -y "
+            f"-f lavfi -i sine=frequency=440:duration={duration} -ac 2 -ar 48000 -c:a libopus {path}"
+        )
+        if await SUPERVISOR.run("ffmpeg", cmd) != 0:
+            raise RuntimeError(f"Could not generate synthetic audio with {config.FFMPEG_PATH}")
+
+        SyntheticDownloader.TEMPLATES[duration] = path
+        return path
+
+    @staticmethod
+    async def download(uri: str, filename: Path, start: Timestamp = None, stop: Timestamp = None) -> bool:
+        query = parse_qs(urlsplit(uri).query)
+        duration = float(query.get("d", ["2"])[0])
+        latency = float(query.get("latency", ["0"])[0])
+
+        await asyncio.sleep(latency)
+        shutil.copyfile(await SyntheticDownloader.template(duration), filename)
+        return True
+
+
+@contextmanager
+def workspace(prefix: str = "assnouncer-bench-") -> Iterator[Path]:
+    """
+    Runs the body inside a fresh temporary working directory. The caches live relative
+    to the working directory, this keeps them out of the real ones.
+    """
+    cwd = Path.cwd()
+    with tempfile.TemporaryDirectory(prefix=prefix) as workdir:
+        os.chdir(workdir)
+        config.init()
+        SyntheticDownloader.WORKDIR = Path(workdir)
+        SyntheticDownloader.TEMPLATES.clear()
+        # Bound to the event loop they were first used on, and every asyncio.run makes a new one
+        SUPERVISOR.semaphores.clear()
+
+        try:
+            yield Path(workdir)
+        finally:
+            metadata.STORE.close()
+            os.chdir(cwd)
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *_):
+        pass
+
+
+@contextmanager
+def serve(directory: Path) -> Iterator[str]:
+    """
+    Serves the files in `directory` over HTTP on localhost, for downloaders that need
+    a real URL. Yields the base URL.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=str(directory)))
+    thread = Thread(target=server.serve_forever, name="bench-http", daemon=True)
+    thread.start()
+
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@dataclass
+class Harness:
+    """
+    A real `Assnouncer` wired to `guilds` fake guilds. Messages go straight into
+    `on_message` and the fake voice clients record the resulting packet timings.
+    """
+
+    guilds: int
+    ass: Assnouncer = None
+    fakes: Dict[int, FakeGuild] = field(default_factory=dict)
+    author: FakeUser = field(default_factory=lambda: FakeUser("load-tester"))
+    latencies: List[float] = field(default_factory=list)
+    first_packets: List[float] = field(default_factory=list)
+    # Undoes the patched module globals on close
+    patches: ExitStack = field(default_factory=ExitStack)
+
+    async def start(self):
+        self.fakes = {guild.id: guild for guild in (FakeGuild() for _ in range(self.guilds))}
+        self.patches.enter_context(mock.patch.object(config, "GUILD_IDS", list(self.fakes)))
+        SUPERVISOR.semaphores.clear()
+
+        self.ass = Assnouncer()
+        self.ass.get_guild = self.fakes.get  # type: ignore
+        await self.ass._async_setup_hook()
+        await self.ass.setup_hook()
+
+        original = trace.first_packet
+
+        def first_packet():
+            current = trace.current()
+            seen = current is not None and current.first_packet is not None
+            original()
+            if current is not None and not seen:
+                self.first_packets.append(current.first_packet - current.start)
+
+        self.patches.enter_context(mock.patch.object(trace, "first_packet", first_packet))
+
+    async def close(self):
+        try:
+            for player in self.ass.players.values():
+                if player.task is not None:
+                    player.task.cancel()
+            # Drained forever, left alone they are destroyed while pending once the harness is gone
+            for queue in self.ass.outbox.queues.values():
+                if queue.task is not None:
+                    queue.task.cancel()
+            await self.ass.close()
+        finally:
+            self.patches.close()
+
+    async def send(self, guild: FakeGuild, content: str):
+        message = FakeMessage(content=content, guild=guild, author=self.author, channel=guild.text_channels[0])
+
+        start = time.perf_counter()
+        await self.ass.on_message(message)  # type: ignore
+        self.latencies.append(time.perf_counter() - start)
+
+    def busy(self) -> bool:
+        for guild_id, player in self.ass.players.items():
+            if not player.song_queue.empty() or not player.pacer.buffer.empty():
+                return True
+
+            # Songs leave the journal when they finished playing, a song that is still being
+            # downloaded is in neither queue
+            if player.journal is not None and player.journal.entries:
+                return True
+
+            voice = self.fakes[guild_id].voice
+            if voice is not None and voice.sends and time.perf_counter() - voice.sends[-1] < SONG_GAP:
+                return True
+        return False
+
+    async def settle(self, timeout: float = 120):
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(SONG_GAP)
+            if not self.busy():
+                return
+        raise TimeoutError("Players did not finish in time")
+
+    def jitter(self) -> List[float]:
+        jitter: List[float] = []
+        for guild in self.fakes.values():
+            for client in guild.voice_channels[0].clients:
+                for before, after in zip(client.sends, client.sends[1:]):
+                    interval = after - before
+                    if interval < SONG_GAP:
+                        jitter.append(abs(interval - OPUS_DELAY))
+        return jitter
+
+    def packets(self) -> int:
+        return sum(len(c.sends) for guild in self.fakes.values() for c in guild.voice_channels[0].clients)
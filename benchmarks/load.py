@@ -0,0 +1,262 @@
+"""
+Offline load test. Drives the bot with synthetic or replayed chat traffic over a
+growing number of fake guilds and reports throughput, latency, CPU time and memory
+at each level.
+
+    python -m benchmarks.load --guilds 1 2 4 8
+    python -m benchmarks.load --replay traffic.jsonl
+
+A replay file has one JSON object per line: {"t": seconds, "guild": index, "content": "..."}.
+"""
+from __future__ import annotations
+
+import gc
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+
+from argparse import ArgumentParser
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Tuple
+from pathlib import Path
+
+from assnouncer import config
+from assnouncer.supervisor import read_stat
+
+from benchmarks.harness import Harness, percentile, workspace
+
+# Non-command chatter that the prefilter should drop, and cheap commands
+CHATTER = ["lol", "ok", "who is playing?", "brb", "gg", "nice one"]
+COMMANDS = ["queue", "help", "print queue"]
+
+Traffic = List[Tuple[float, int, str]]
+
+
+@dataclass
+class LevelResult:
+    guilds: int
+    messages: int
+    songs: int
+    messages_per_second: float
+    latency_p50: float
+    latency_p95: float
+    latency_p99: float
+    first_packet_p50: float
+    first_packet_p95: float
+    jitter_p50: float
+    jitter_p99: float
+    packets: int
+    wall_time: float
+    # CPU seconds of the whole process (and its reaped children) during the level, and
+    # how much the RSS grew with the guilds still live, both also per guild
+    cpu_time: float
+    cpu_per_guild: float
+    rss: int
+    rss_growth: int
+    rss_per_guild: int
+
+
+def usage() -> Tuple[float, int]:
+    """
+    CPU seconds used by this process and its reaped children, and its RSS in bytes.
+    """
+    stat = read_stat("self")
+    if stat is not None:
+        _, cpu, rss = stat
+        return cpu, rss
+
+    # Without /proc only the peak RSS is known, in KiB except on macOS
+    import resource
+
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    return cpu, own.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def synthetic(guilds: int, songs: int, duration: float, latency: float, rate: float, seed: int) -> Traffic:
+    """
+    `songs` play commands per guild mixed with chatter and cheap commands, spread
+    uniformly over the time it takes to send them at `rate` messages per second.
+    """
+    rng = random.Random(seed)
+    run = f"{time.time_ns()}"
+
+    messages: List[Tuple[int, str]] = []
+    for guild in range(guilds):
+        for song in range(songs):
+            messages.append((guild, f"play synthetic://{run}/{guild}/{song}?d={duration}&latency={latency}"))
+        for _ in range(songs * 3):
+            messages.append((guild, rng.choice(CHATTER)))
+        messages.append((guild, rng.choice(COMMANDS)))
+
+    rng.shuffle(messages)
+    return [(idx / rate, guild, content) for idx, (guild, content) in enumerate(messages)]
+
+
+def chat_log(messages: int, commands: float, seed: int) -> List[str]:
+    """
+    `messages` lines of ordinary chat of which a `commands` fraction are cheap commands,
+    what a busy channel looks like to `on_message`.
+    """
+    rng = random.Random(seed)
+    return [rng.choice(COMMANDS if rng.random() < commands else CHATTER) for _ in range(messages)]
+
+
+def replay(path: Path) -> Traffic:
+    traffic: Traffic = []
+    with path.open(encoding="utf8") as file:
+        for line in file:
+            if line.strip():
+                entry = json.loads(line)
+                traffic.append((float(entry["t"]), int(entry.get("guild", 0)), entry["content"]))
+    return sorted(traffic)
+
+
+async def throughput(guilds: int, traffic: Traffic) -> float:
+    """
+    Messages per second that `on_message` sustains for `traffic` sent back to back,
+    ignoring its timestamps. Paced traffic would only measure the rate it was sent at.
+    """
+    harness = Harness(guilds=guilds)
+    await harness.start()
+
+    try:
+        fakes = list(harness.fakes.values())
+        start = time.perf_counter()
+        for _, guild, content in traffic:
+            await harness.send(fakes[guild % len(fakes)], content)
+        dispatched = time.perf_counter() - start
+
+        await harness.settle()
+    finally:
+        await harness.close()
+
+    return len(traffic) / dispatched if dispatched else float("nan")
+
+
+async def run_level(guilds: int, traffic: Traffic) -> LevelResult:
+    """
+    Latency, playback and resource use with `traffic` paced by its timestamps, and
+    throughput from a second, unpaced run.
+    """
+    gc.collect()
+    cpu_before, rss_before = usage()
+
+    harness = Harness(guilds=guilds)
+    await harness.start()
+
+    try:
+        fakes = list(harness.fakes.values())
+        start = time.perf_counter()
+
+        sends = []
+        for offset, guild, content in traffic:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sends.append(asyncio.create_task(harness.send(fakes[guild % len(fakes)], content)))
+
+        await asyncio.gather(*sends)
+
+        await harness.settle()
+        wall_time = time.perf_counter() - start
+
+        gc.collect()
+        cpu_after, rss_after = usage()
+    finally:
+        await harness.close()
+
+    jitter = harness.jitter()
+    latencies = harness.latencies
+    messages_per_second = await throughput(guilds, traffic)
+    return LevelResult(
+        guilds=guilds,
+        messages=len(traffic),
+        songs=sum(content.startswith("play") for _, _, content in traffic),
+        messages_per_second=messages_per_second,
+        latency_p50=percentile(latencies, 0.5),
+        latency_p95=percentile(latencies, 0.95),
+        latency_p99=percentile(latencies, 0.99),
+        first_packet_p50=percentile(harness.first_packets, 0.5),
+        first_packet_p95=percentile(harness.first_packets, 0.95),
+        jitter_p50=percentile(jitter, 0.5),
+        jitter_p99=percentile(jitter, 0.99),
+        packets=harness.packets(),
+        wall_time=wall_time,
+        cpu_time=cpu_after - cpu_before,
+        cpu_per_guild=(cpu_after - cpu_before) / guilds,
+        rss=rss_after,
+        rss_growth=rss_after - rss_before,
+        rss_per_guild=(rss_after - rss_before) // guilds
+    )
+
+
+def format_results(results: List[LevelResult]) -> str:
+    header = (
+        f"{'guilds':>6} {'msgs':>6} {'msg/s':>8} {'lat p50':>9} {'lat p99':>9} "
+        f"{'ttfp p50':>9} {'ttfp p95':>9} {'jit p50':>9} {'jit p99':>9} {'packets':>8} "
+        f"{'cpu':>7} {'cpu/g':>7} {'rss':>9} {'rss/g':>9}"
+    )
+    rows = [
+        f"{r.guilds:>6} {r.messages:>6} {r.messages_per_second:>8.1f} "
+        f"{r.latency_p50 * 1e3:>7.2f}ms {r.latency_p99 * 1e3:>7.2f}ms "
+        f"{r.first_packet_p50:>8.3f}s {r.first_packet_p95:>8.3f}s "
+        f"{r.jitter_p50 * 1e3:>7.3f}ms {r.jitter_p99 * 1e3:>7.3f}ms {r.packets:>8} "
+        f"{r.cpu_time:>6.2f}s {r.cpu_per_guild:>6.2f}s "
+        f"{r.rss / 2 ** 20:>6.1f}MiB {r.rss_per_guild / 2 ** 20:>6.2f}MiB"
+        for r in results
+    ]
+    return "\n".join([header, *rows])
+
+
+async def run(levels: List[int], traffic: Dict[int, Traffic]) -> List[LevelResult]:
+    results = []
+    for guilds in levels:
+        result = await run_level(guilds, traffic[guilds])
+        results.append(result)
+        print(format_results([result]).splitlines()[-1], flush=True)
+    return results
+
+
+def main(argv: List[str] = None) -> List[LevelResult]:
+    parser = ArgumentParser(prog="benchmarks.load", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--guilds", type=int, nargs="+", default=[1, 2, 4, 8], help="Guild counts to run")
+    parser.add_argument("--songs", type=int, default=3, help="Songs per guild")
+    parser.add_argument("--duration", type=float, default=2.0, help="Seconds per synthetic song")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds each fake download takes")
+    parser.add_argument("--rate", type=float, default=50.0, help="Messages per second")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--replay", type=Path, help="Replay this JSON-lines file instead of synthetic traffic")
+    parser.add_argument("--no-ingest", action="store_true", help="Skip silence trimming and normalization")
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.no_ingest:
+        config.TRIM_SILENCE = False
+        config.NORMALIZE_LOUDNESS = False
+
+    recorded = replay(args.replay) if args.replay else None
+    traffic = {
+        guilds: recorded or synthetic(guilds, args.songs, args.duration, args.latency, args.rate, args.seed)
+        for guilds in args.guilds
+    }
+
+    output = args.json.resolve() if args.json else None
+    with workspace(prefix="assnouncer-load-"):
+        print(format_results([]))
+        results = asyncio.run(run(args.guilds, traffic))
+
+    if output is not None:
+        output.write_text(json.dumps([asdict(r) for r in results], indent=2))
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
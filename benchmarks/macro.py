@@ -0,0 +1,167 @@
+"""
+End-to-end benchmarks: loading sources, pacing playback, the download backends and
+driving the whole bot through the offline harness. All but the chat replay need ffmpeg.
+"""
+from __future__ import annotations
+
+import time
+import asyncio
+import statistics
+
+from assnouncer.audio import music
+from assnouncer.audio.music import AudioSource, MusicState, Pacer, OPUS_DELAY
+from assnouncer.downloaders import stats
+from assnouncer.downloaders.fallback import FallbackDownloader
+from assnouncer.downloaders.ytdlp import YtDlpDownloader
+
+from typing import Dict, List
+from pathlib import Path
+
+from benchmarks.harness import FakeVoiceClient, Harness, SyntheticDownloader, percentile, serve, workspace
+from benchmarks.load import chat_log, run_level, synthetic
+from benchmarks.suite import Metric, benchmark
+
+# Set by `python -m benchmarks --quick`
+QUICK = False
+
+
+@benchmark("audio.from_source", needs_ffmpeg=True)
+def bench_from_source() -> Dict[str, Metric]:
+    async def measure() -> List[float]:
+        path = await SyntheticDownloader.template(5.0)
+
+        times = []
+        for _ in range(3 if QUICK else 10):
+            start = time.perf_counter()
+            source = await AudioSource.from_source(path)
+            source.read()
+            times.append(time.perf_counter() - start)
+            source.cleanup()
+        return times
+
+    with workspace():
+        times = asyncio.run(measure())
+
+    return {"first_packet": Metric(statistics.median(times))}
+
+
+@benchmark("audio.play", needs_ffmpeg=True)
+def bench_play() -> Dict[str, Metric]:
+    duration = 2.0 if QUICK else 10.0
+
+    async def measure() -> FakeVoiceClient:
+        client = FakeVoiceClient()
+        pacer = Pacer(client=client)
+        pacer.start(name="bench-pacer")
+
+        async def reconnect() -> FakeVoiceClient:
+            return client
+
+        async def state() -> MusicState:
+            return MusicState.CONTINUED
+
+        source = await AudioSource.from_source(await SyntheticDownloader.template(duration))
+        try:
+            await music.play(source, pacer, reconnect_callback=reconnect, state_callback=state)
+            await pacer.drained()
+        finally:
+            source.cleanup()
+        return client
+
+    with workspace():
+        client = asyncio.run(measure())
+
+    intervals = [after - before for before, after in zip(client.sends, client.sends[1:])]
+    jitter = [abs(interval - OPUS_DELAY) for interval in intervals]
+    elapsed = client.sends[-1] - client.sends[0]
+    return {
+        "jitter.p50": Metric(percentile(jitter, 0.5)),
+        "jitter.p99": Metric(percentile(jitter, 0.99)),
+        "jitter.max": Metric(max(jitter)),
+        "drift": Metric(abs(elapsed - OPUS_DELAY * len(intervals))),
+    }
+
+
+@benchmark("downloaders.ytdlp", needs_ffmpeg=True)
+def bench_ytdlp() -> Dict[str, Metric]:
+    # Per-download overhead of a short clip served from localhost: a yt-dlp process per
+    # download against the warmed in-process worker pool. The clip already is opus, so
+    # neither spends time converting it.
+    count = 3 if QUICK else 10
+
+    async def measure(directory: Path, url: str) -> Dict[str, Metric]:
+        results = {}
+        for name, download in (("subprocess", FallbackDownloader.download), ("inprocess", YtDlpDownloader.download)):
+            times = []
+            # The first one spins up and warms the pool, which happens once per process
+            for idx in range(count + 1):
+                filename = directory / f"{name}-{idx}.opus"
+
+                start = time.perf_counter()
+                if not await download(url, filename):
+                    raise RuntimeError(f"{name} download of {url} failed")
+                times.append(time.perf_counter() - start)
+
+            results[f"{name}.first"] = Metric(times[0])
+            results[f"{name}.median"] = Metric(statistics.median(times[1:]))
+        return results
+
+    with workspace() as directory:
+        clip = asyncio.run(SyntheticDownloader.template(2.0))
+        try:
+            with serve(directory) as base:
+                return asyncio.run(measure(directory, f"{base}/{clip.name}"))
+        finally:
+            if YtDlpDownloader.POOL is not None:
+                YtDlpDownloader.POOL.close()
+                YtDlpDownloader.POOL = None
+
+
+@benchmark("load.guilds", needs_ffmpeg=True)
+def bench_guilds() -> Dict[str, Metric]:
+    results = {}
+    stats.HISTORY.entries.clear()
+
+    with workspace():
+        for guilds in (1, 4) if QUICK else (1, 2, 4, 8):
+            traffic = synthetic(guilds, songs=2, duration=1.0, latency=0.1, rate=50.0, seed=0)
+            level = asyncio.run(run_level(guilds, traffic))
+            results[f"{guilds}.messages_per_second"] = Metric(level.messages_per_second, "msg/s", lower_is_better=False)
+            results[f"{guilds}.latency_p95"] = Metric(level.latency_p95)
+            results[f"{guilds}.first_packet_p95"] = Metric(level.first_packet_p95)
+            results[f"{guilds}.jitter_p99"] = Metric(level.jitter_p99)
+            results[f"{guilds}.cpu_per_guild"] = Metric(level.cpu_per_guild)
+            results[f"{guilds}.rss_per_guild"] = Metric(level.rss_per_guild / 2 ** 20, "MiB")
+
+    summary = stats.HISTORY.summary()
+    results["downloads.success_rate"] = Metric(summary["success_rate"], "", lower_is_better=False)
+    for key, value in summary.items():
+        if key.endswith(("_mean", "_p95")) and not key.startswith("throughput"):
+            results[f"downloads.{key}"] = Metric(value)
+    return results
+
+
+@benchmark("commands.on_message")
+def bench_on_message() -> Dict[str, Metric]:
+    async def measure(log: List[str]) -> Dict[str, Metric]:
+        harness = Harness(guilds=1)
+        await harness.start()
+        try:
+            guild = next(iter(harness.fakes.values()))
+
+            # Back to back, the rate is what on_message sustains and not how fast it was fed
+            start = time.perf_counter()
+            for content in log:
+                await harness.send(guild, content)
+            elapsed = time.perf_counter() - start
+        finally:
+            await harness.close()
+
+        return {
+            "messages_per_second": Metric(len(log) / elapsed, "msg/s", lower_is_better=False),
+            "latency_p50": Metric(percentile(harness.latencies, 0.5)),
+            "latency_p99": Metric(percentile(harness.latencies, 0.99)),
+        }
+
+    with workspace():
+        return asyncio.run(measure(chat_log(2000 if QUICK else 20000, commands=0.02, seed=0)))
@@ -0,0 +1,179 @@
+"""
+Micro-benchmarks of the parser, command dispatch, routing, cache lookups and startup.
+"""
+from __future__ import annotations
+
+import sys
+import statistics
+import subprocess
+
+from assnouncer import asspp
+from assnouncer import util
+from assnouncer import sampler
+from assnouncer.asspp import Identifier
+from assnouncer.commands import BaseCommand
+from assnouncer.downloaders import BaseDownloader
+
+from typing import Callable, Dict
+
+from benchmarks.suite import Metric, benchmark, timeit
+
+REALISTIC = {
+    "plain": "play never gonna give you up",
+    "url": "play https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=42",
+    "cut": 'play["never gonna give you up", 0:10, 1:20]',
+    "kwargs": "play[start=1:00, stop=2:30] https://youtu.be/dQw4w9WgXcQ",
+    "nested": "add[1, mul[2, sub[10, div[9, 3]]]]",
+}
+
+ADVERSARIAL = {
+    "deep": "add[" * 40 + "1" + "]" * 40,
+    "wide": "print[" + "x, " * 2000 + "x]",
+    "unterminated": 'print["' + "a\\" * 3000,
+    "garbage": "play " + "@#$%^&*" * 1000,
+    "comment": "play" + " # " * 2000,
+}
+
+URIS = [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://youtu.be/dQw4w9WgXcQ?t=42",
+    "https://open.spotify.com/track/4cOdK2wGLETKBW3PvgPWqT",
+    "https://soundcloud.com/artist/track",
+    "some search words that are not a url",
+]
+
+
+def attempt(func: Callable[[str], object], text: str) -> Callable[[], object]:
+    """
+    Also times inputs that fail, rejecting them quickly is part of the hot path.
+    """
+    def call():
+        try:
+            return func(text)
+        except (SyntaxError, TypeError, RecursionError):
+            return None
+
+    return call
+
+
+@benchmark("asspp.tokenize")
+def bench_tokenize() -> Dict[str, Metric]:
+    inputs = {**REALISTIC, **ADVERSARIAL}
+    return {
+        name: timeit(attempt(asspp.tokenize, text), number=20 if name in ADVERSARIAL else 500)
+        for name, text in inputs.items()
+    }
+
+
+@benchmark("asspp.parse")
+def bench_parse() -> Dict[str, Metric]:
+    inputs = {**REALISTIC, **ADVERSARIAL}
+    return {
+        name: timeit(attempt(asspp.parse, text), number=20 if name in ADVERSARIAL else 500)
+        for name, text in inputs.items()
+    }
+
+
+@benchmark("commands.is_command")
+def bench_is_command() -> Dict[str, Metric]:
+    return {
+        "command": timeit(lambda: BaseCommand.is_command(REALISTIC["plain"]), number=10000),
+        "chatter": timeit(lambda: BaseCommand.is_command("who is playing tonight?"), number=10000),
+    }
+
+
+@benchmark("commands.dispatch")
+def bench_dispatch() -> Dict[str, Metric]:
+    name = Identifier.parse(0, 4, "play")
+    command = asspp.parse(REALISTIC["cut"])
+    command_type = BaseCommand.find_command(name)
+    help = command_type.analyze()
+
+    return {
+        "find_command": timeit(lambda: BaseCommand.find_command(name), number=10000),
+        "analyze": timeit(command_type.analyze, number=1000),
+        "validate": timeit(lambda: help.validate(command.arguments.args, command.arguments.kwargs), number=1000),
+    }
+
+
+# Every downloader and the misses that fall through to a search
+ROUTED = [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PLFgquLnL59alCl_2TQvOiD5Vgm1hCaGSI",
+    "https://youtu.be/dQw4w9WgXcQ?t=42",
+    "https://open.spotify.com/track/4cOdK2wGLETKBW3PvgPWqT?si=abcdef",
+    "https://soundcloud.com/artist/track",
+    "https://vimeo.com/76979871",
+    "https://streamable.com/abc12",
+    "https://cdn.discordapp.com/attachments/1234/5678/song.mp3?ex=65e1&is=65ce&hm=aaaa",
+    "https://example.com/song.mp3",
+    "https://example.com/not/media",
+    "never gonna give you up",
+]
+
+
+@benchmark("downloaders.route")
+def bench_route() -> Dict[str, Metric]:
+    import regex
+
+    def route():
+        for uri in ROUTED:
+            BaseDownloader.route(uri)
+
+    def per_pattern():
+        # What routing did before ROUTER, one fullmatch per pattern of every downloader
+        for uri in ROUTED:
+            for pattern in BaseDownloader.ROUTES:
+                regex.fullmatch(pattern, uri)
+
+    def canonicalize():
+        for uri in ROUTED:
+            util.canonicalize(uri)
+
+    BaseDownloader.load()
+    return {
+        "route": timeit(route, number=500),
+        "per_pattern": timeit(per_pattern, number=500),
+        "canonicalize": timeit(canonicalize, number=500),
+    }
+
+
+@benchmark("util.cache")
+def bench_cache() -> Dict[str, Metric]:
+    results = {}
+    for idx, uri in enumerate(URIS):
+        results[f"canonicalize.{idx}"] = timeit(lambda: util.canonicalize(uri), number=1000)
+    results["get_download_path"] = timeit(lambda: [util.get_download_path(uri) for uri in URIS], number=200)
+    return results
+
+
+@benchmark("sampler")
+def bench_sampler() -> Dict[str, Metric]:
+    # The sampler holds the GIL for this long every INTERVAL, stalling every other thread
+    return {"sample": timeit(sampler.Sampler(duration=0).sample, number=200)}
+
+
+def import_time(module: str) -> float:
+    """
+    Cumulative seconds `python -X importtime` reports for importing `module` in a fresh
+    interpreter.
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True
+    ).stderr
+    last = output.strip().splitlines()[-1]
+    return int(last.split("|")[1]) / 1e6
+
+
+@benchmark("startup")
+def bench_startup() -> Dict[str, Metric]:
+    results = {
+        f"import.{module}": Metric(statistics.median(import_time(module) for _ in range(5)))
+        for module in ("assnouncer.config", "assnouncer.asspp", "assnouncer.util", "assnouncer.assnouncer")
+    }
+
+    def help():
+        subprocess.run([sys.executable, "-m", "assnouncer", "--help"], capture_output=True, check=True)
+
+    results["cli.help"] = timeit(help, number=1, repeat=5)
+    return results
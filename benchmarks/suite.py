@@ -0,0 +1,144 @@
+"""
+Benchmark registry, timing helpers, result files and baseline comparison.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import statistics
+import subprocess
+
+from assnouncer import config
+
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List
+from pathlib import Path
+
+
+@dataclass
+class Metric:
+    value: float
+    unit: str = "s"
+    lower_is_better: bool = True
+
+
+@dataclass
+class Benchmark:
+    name: str
+    func: Callable[[], Dict[str, Metric]]
+    needs_ffmpeg: bool = False
+
+
+BENCHMARKS: List[Benchmark] = []
+
+
+def benchmark(name: str, needs_ffmpeg: bool = False) -> Callable:
+    def register(func: Callable[[], Dict[str, Metric]]) -> Callable[[], Dict[str, Metric]]:
+        BENCHMARKS.append(Benchmark(name=name, func=func, needs_ffmpeg=needs_ffmpeg))
+        return func
+
+    return register
+
+
+def timeit(func: Callable[[], object], number: int = 1000, repeat: int = 7) -> Metric:
+    """
+    Median seconds per call over `repeat` runs of `number` calls each.
+    """
+    func()
+
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        runs.append((time.perf_counter() - start) / number)
+
+    return Metric(statistics.median(runs))
+
+
+def have_ffmpeg() -> bool:
+    return all(
+        Path(tool).is_file() or shutil.which(str(tool)) is not None
+        for tool in (config.FFMPEG_PATH, config.FFPROBE_PATH)
+    )
+
+
+def machine() -> Dict[str, object]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def run(selected: List[Benchmark], log: Callable[[str], None] = print) -> Dict[str, object]:
+    results: Dict[str, Dict[str, object]] = {}
+    skipped: List[str] = []
+
+    ffmpeg = have_ffmpeg()
+    for bench in selected:
+        if bench.needs_ffmpeg and not ffmpeg:
+            skipped.append(bench.name)
+            log(f"{bench.name}: skipped, no ffmpeg/ffprobe in {config.FFMPEG_DIR}")
+            continue
+
+        for key, metric in bench.func().items():
+            name = f"{bench.name}.{key}" if key else bench.name
+            results[name] = asdict(metric)
+            log(f"{name}: {format_value(metric.value, metric.unit)}")
+
+    return {"machine": machine(), "results": results, "skipped": skipped}
+
+
+def format_value(value: float, unit: str) -> str:
+    if unit != "s":
+        return f"{value:.4g} {unit}"
+
+    for scale, suffix in ((1, "s"), (1e-3, "ms"), (1e-6, "us")):
+        if value >= scale:
+            return f"{value / scale:.3f} {suffix}"
+    return f"{value / 1e-9:.1f} ns"
+
+
+def save(results: Dict[str, object], path: Path):
+    path.write_text(json.dumps(results, indent=2))
+
+
+def compare(results: Dict[str, object], baseline: Dict[str, object], threshold: float) -> List[str]:
+    """
+    Names and changes of every metric that got worse than `baseline` by more than
+    `threshold` (a fraction).
+    """
+    regressions: List[str] = []
+
+    current: Dict[str, Dict] = results["results"]  # type: ignore
+    previous: Dict[str, Dict] = baseline["results"]  # type: ignore
+    for name, metric in current.items():
+        old = previous.get(name)
+        if old is None or not old["value"]:
+            continue
+
+        ratio = metric["value"] / old["value"]
+        worse = ratio > 1 + threshold if metric["lower_is_better"] else ratio < 1 - threshold
+        if worse:
+            regressions.append(
+                f"{name}: {format_value(old['value'], old['unit'])} -> "
+                f"{format_value(metric['value'], metric['unit'])} ({ratio - 1:+.1%})"
+            )
+
+    return regressions
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import pytest
+
+from assnouncer import util
+
+VIDEO = "dQw4w9WgXcQ"
+WATCH = f"https://youtube.com/watch?v={VIDEO}"
+TRACK = "4cOdK2wGLETKBW3PvgPWqT"
+ATTACHMENT = "https://cdn.discordapp.com/attachments/1234/5678/song.mp3"
+
+# URL, canonical URI, offset in seconds
+CASES = [
+    # YouTube
+    (f"https://www.youtube.com/watch?v={VIDEO}", WATCH, None),
+    (f"https://youtube.com/watch?v={VIDEO}", WATCH, None),
+    (f"http://m.youtube.com/watch?v={VIDEO}", WATCH, None),
+    (f"https://music.youtube.com/watch?v={VIDEO}&feature=share", WATCH, None),
+    (f"https://youtu.be/{VIDEO}", WATCH, None),
+    (f"https://youtu.be/{VIDEO}?si=tracking", WATCH, None),
+    (f"https://www.youtube.com/shorts/{VIDEO}", WATCH, None),
+    (f"https://www.youtube.com/embed/{VIDEO}", WATCH, None),
+    (f"https://www.youtube.com/live/{VIDEO}?feature=share", WATCH, None),
+    # Playlists
+    (f"https://youtube.com/watch?v={VIDEO}&list=PLFgquLnL59alCl_2TQvOiD5Vgm1hCaGSI", WATCH, None),
+    (f"https://www.youtube.com/watch?list=PLFgquLnL59alCl_2TQvOiD5Vgm1hCaGSI&index=2&v={VIDEO}", WATCH, None),
+    # Offsets
+    (f"https://youtu.be/{VIDEO}?t=42", WATCH, 42),
+    (f"https://www.youtube.com/watch?v={VIDEO}&t=30", WATCH, 30),
+    (f"https://www.youtube.com/watch?v={VIDEO}&t=30s", WATCH, 30),
+    (f"https://www.youtube.com/watch?v={VIDEO}&t=1m30s", WATCH, 90),
+    (f"https://www.youtube.com/watch?v={VIDEO}&t=1h2m3s", WATCH, 3723),
+    (f"https://www.youtube.com/watch?v={VIDEO}#t=1:05", WATCH, 65),
+    (f"https://www.youtube.com/embed/{VIDEO}?start=15", WATCH, 15),
+    (f"https://www.youtube.com/watch?v={VIDEO}&t=soon", WATCH, None),
+    # Spotify
+    (f"https://open.spotify.com/track/{TRACK}", f"https://open.spotify.com/track/{TRACK}", None),
+    (f"https://open.spotify.com/track/{TRACK}?si=abcdef", f"https://open.spotify.com/track/{TRACK}", None),
+    (f"https://open.spotify.com/intl-de/track/{TRACK}", f"https://open.spotify.com/track/{TRACK}", None),
+    (f"spotify:track:{TRACK}", f"https://open.spotify.com/track/{TRACK}", None),
+    # SoundCloud, Vimeo, Streamable
+    ("https://soundcloud.com/artist/track?in=artist/sets/album", "https://soundcloud.com/artist/track", None),
+    ("https://m.soundcloud.com/artist/sets/album", "https://soundcloud.com/artist/sets/album", None),
+    ("https://player.vimeo.com/video/76979871", "https://vimeo.com/76979871", None),
+    ("https://vimeo.com/76979871/0123abcd", "https://vimeo.com/76979871/0123abcd", None),
+    ("https://streamable.com/e/abc12", "https://streamable.com/abc12", None),
+    # Everything else is left alone
+    ("never gonna give you up", "never gonna give you up", None),
+    ("https://example.com/song.mp3", "https://example.com/song.mp3", None),
+]
+
+
+@pytest.mark.parametrize("url, uri, start", CASES, ids=[case[0] for case in CASES])
+def test_canonicalize(url: str, uri: str, start: int):
+    canonical = util.canonicalize(url)
+
+    assert canonical.uri == uri
+    assert canonical.key == uri
+    assert (None if canonical.start is None else canonical.start.value) == start
+
+
+def test_canonical_uri_is_stable():
+    for url, uri, _ in CASES:
+        assert util.canonicalize(uri).uri == uri, url
+
+
+def test_discord_signature_is_not_part_of_the_key():
+    first = util.canonicalize(f"{ATTACHMENT}?ex=65e1&is=65ce&hm=aaaa")
+    second = util.canonicalize("https://media.discordapp.net/attachments/1234/5678/song.mp3?ex=75e1&hm=bbbb")
+
+    # Downloading needs the signature, the cache must not depend on it
+    assert first.uri == f"{ATTACHMENT}?ex=65e1&is=65ce&hm=aaaa"
+    assert first.key == second.key == ATTACHMENT
+    assert util.get_download_path(first.uri) == util.get_download_path(second.uri)
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import json
+import asyncio
+
+import pytest
+
+from assnouncer import journal
+from assnouncer.journal import Entry, Journal
+
+from pathlib import Path
+from typing import Any, Dict, List
+
+
+@pytest.fixture(autouse=True)
+def no_offset_interval(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(journal, "OFFSET_INTERVAL", 0)
+
+
+def replay(path: Path) -> Journal:
+    """
+    The state the records in `path` describe, without compacting them.
+    """
+    replayed = Journal(path=path)
+    replayed.load()
+    return replayed
+
+
+def records(path: Path) -> List[Dict[str, Any]]:
+    return [json.loads(line) for line in path.read_text(encoding="utf8").splitlines()]
+
+
+def test_replay(tmp_path: Path):
+    path = tmp_path / "guild.jsonl"
+    queue = Journal.open(path)
+
+    first = queue.enqueue("never gonna give you up", channel=1)
+    second = queue.enqueue("https://youtu.be/dQw4w9WgXcQ", start=10, stop=70)
+    third = queue.enqueue("darude sandstorm")
+    fourth = queue.enqueue("https://example.com/song.mp3")
+
+    queue.pop(first)
+    queue.resolve(first, "https://youtube.com/watch?v=dQw4w9WgXcQ")
+    queue.done(first)
+    queue.skip(third)
+    queue.pop(second)
+    queue.resolve(second, "https://youtube.com/watch?v=dQw4w9WgXcQ")
+    queue.offset(second, 42.123)
+    fifth = queue.enqueue("all star", channel=2)
+    queue.close()
+
+    assert replay(path).pending() == [
+        Entry(id=second, query="https://youtu.be/dQw4w9WgXcQ", uri="https://youtube.com/watch?v=dQw4w9WgXcQ",
+              start=10, stop=70, offset=42.12),
+        Entry(id=fourth, query="https://example.com/song.mp3"),
+        Entry(id=fifth, query="all star", channel=2),
+    ]
+    assert replay(path).current == second
+
+
+def test_current_song_comes_first(tmp_path: Path):
+    queue = Journal.open(tmp_path / "guild.jsonl")
+    ids = [queue.enqueue(f"song {idx}") for idx in range(3)]
+    queue.pop(ids[2])
+    queue.close()
+
+    assert [entry.id for entry in replay(queue.path).pending()] == [ids[2], ids[0], ids[1]]
+
+
+def test_clear_keeps_the_current_song(tmp_path: Path):
+    queue = Journal.open(tmp_path / "guild.jsonl")
+    ids = [queue.enqueue(f"song {idx}") for idx in range(3)]
+    queue.pop(ids[1])
+    queue.clear()
+    queue.close()
+
+    assert [entry.id for entry in replay(queue.path).pending()] == [ids[1]]
+
+
+def churn(queue: Journal, count: int):
+    """
+    Queues and plays `count` songs, every third one is still live afterwards.
+    """
+    for idx in range(count):
+        id = queue.enqueue(f"song {idx}")
+        if idx % 3:
+            queue.pop(id)
+            queue.offset(id, idx)
+            queue.done(id)
+
+
+def assert_compacted(queue: Journal):
+    """
+    One `enqueue` per live song, followed by a `pop` of the one that is playing.
+    """
+    expected = [("enqueue", id) for id in queue.entries]
+    if queue.current is not None:
+        expected.append(("pop", queue.current))
+
+    assert [(record["op"], record["id"]) for record in records(queue.path)] == expected
+    assert replay(queue.path).pending() == queue.pending()
+
+
+def test_compaction_keeps_the_live_entries(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(journal, "COMPACT_EVERY", 16)
+
+    queue = Journal.open(tmp_path / "guild.jsonl")
+    churn(queue, 30)
+    queue.compact()
+    queue.close()
+
+    assert len(queue.entries) == 10
+    assert_compacted(queue)
+
+
+def test_background_compaction_keeps_records_written_meanwhile(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(journal, "COMPACT_EVERY", 16)
+
+    async def run() -> Journal:
+        queue = Journal.open(tmp_path / "guild.jsonl")
+        churn(queue, 6)
+        assert queue.task is not None
+
+        # Written while the snapshot is staged, they have to end up in the compacted file
+        later = [queue.enqueue(f"late {idx}") for idx in range(3)]
+        queue.done(later[0])
+        await queue.task
+        assert queue.task is None
+
+        queue.close()
+        return queue
+
+    queue = asyncio.run(run())
+
+    assert [entry.query for entry in replay(queue.path).pending()] == ["song 0", "song 3", "late 1", "late 2"]
+    assert replay(queue.path).pending() == queue.pending()
+
+
+def test_torn_last_line_is_ignored(tmp_path: Path):
+    path = tmp_path / "guild.jsonl"
+    queue = Journal.open(path)
+    ids = [queue.enqueue(f"song {idx}") for idx in range(2)]
+    queue.pop(ids[0])
+    queue.close()
+
+    with path.open("a", encoding="utf8") as file:
+        file.write('{"op": "done", "id": ')
+
+    reopened = Journal.open(path)
+    reopened.close()
+
+    assert [entry.id for entry in reopened.pending()] == ids
+    assert reopened.current == ids[0]
+    assert_compacted(reopened)
+
+
+def test_write_after_close_is_not_recorded(tmp_path: Path):
+    queue = Journal.open(tmp_path / "guild.jsonl")
+    id = queue.enqueue("song")
+    queue.pop(id)
+    queue.close()
+
+    queue.done(id)
+
+    assert queue.pending() == []
+    assert [entry.id for entry in replay(queue.path).pending()] == [id]
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import asyncio
+
+from assnouncer.outbox import FENCE, MESSAGE_LIMIT, Outbox, Priority, split
+
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+
+@dataclass(eq=False)
+class FakeChannel:
+    id: int = 1
+    sent: List[str] = field(default_factory=list)
+
+    async def send(self, text: str):
+        self.sent.append(text)
+
+
+def post_burst(burst: List[Tuple[str, Priority]]) -> List[str]:
+    async def run() -> List[str]:
+        outbox = Outbox(window=0.01)
+        channel = FakeChannel()
+        for text, priority in burst:
+            outbox.post(channel, text, priority=priority)
+
+        await asyncio.sleep(0.1)
+        for queue in outbox.queues.values():
+            queue.task.cancel()
+        return channel.sent
+
+    return asyncio.run(run())
+
+
+def test_burst_is_merged_into_one_message():
+    sent = post_burst([(f"line {idx}", Priority.RESPONSE) for idx in range(20)])
+
+    assert sent == ["\n".join(f"line {idx}" for idx in range(20))]
+
+
+def test_errors_jump_the_queue():
+    sent = post_burst([
+        ("echo 1", Priority.RESPONSE),
+        ("Playing x", Priority.NOW_PLAYING),
+        ("echo 2", Priority.RESPONSE),
+        ("it broke", Priority.ERROR),
+    ])
+
+    assert sent == ["it broke\nPlaying x\necho 1\necho 2"]
+
+
+def test_long_burst_stays_under_the_limit():
+    texts = [f"{idx:04} " + "x" * 300 for idx in range(30)]
+    sent = post_burst([(text, Priority.RESPONSE) for text in texts])
+
+    assert 1 < len(sent) < len(texts)
+    assert all(len(message) <= MESSAGE_LIMIT for message in sent)
+    assert "\n".join(sent) == "\n".join(texts)
+
+
+def test_split_plain_text():
+    assert split("") == []
+    assert split("short") == ["short"]
+    assert all(len(part) <= MESSAGE_LIMIT for part in split("x" * 5000))
+    assert "".join(split("x" * 5000)) == "x" * 5000
+
+
+def test_split_reopens_code_blocks():
+    lines = [f"print[{idx}]" for idx in range(600)]
+    text = "\n".join(["Output:", f"{FENCE}ass", *lines, FENCE, "done"])
+
+    parts = split(text)
+
+    assert len(parts) > 1
+    assert all(len(part) <= MESSAGE_LIMIT for part in parts)
+    assert all(part.count(FENCE) % 2 == 0 for part in parts)
+    assert all(part.startswith(f"{FENCE}ass\n") for part in parts[1:])
+    assert all(part.endswith(f"\n{FENCE}") for part in parts[:-1])
+    assert parts[-1].endswith(f"{FENCE}\ndone")
+
+    body = [line for part in parts for line in part.split("\n") if line.startswith("print")]
+    assert body == lines
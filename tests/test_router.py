@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from unittest import mock
+
+from assnouncer import config
+from assnouncer.downloaders import BaseDownloader
+from assnouncer.downloaders.fallback import FallbackDownloader
+from assnouncer.downloaders.spotify import SpotifyDownloader
+from assnouncer.downloaders.ytdlp import YtDlpDownloader
+
+TRACK = "https://open.spotify.com/track/4cOdK2wGLETKBW3PvgPWqT"
+
+
+def route(url: str, backend: str = "inprocess"):
+    with mock.patch.object(config, "YTDLP_BACKEND", backend):
+        return BaseDownloader.route(url)
+
+
+def test_single_pattern():
+    assert route(TRACK) == [SpotifyDownloader]
+    assert route("https://youtu.be/dQw4w9WgXcQ") == [YtDlpDownloader, FallbackDownloader]
+    assert route("https://youtu.be/dQw4w9WgXcQ", backend="subprocess") == [FallbackDownloader]
+
+
+def test_misses():
+    assert route("never gonna give you up") == []
+    assert route("https://example.com/not/media") == []
+
+
+def test_overlapping_patterns_are_merged():
+    # Both SpotifyDownloader's pattern and FallbackDownloader's file extension pattern match
+    url = f"{TRACK}.mp3"
+
+    assert route(url) == [YtDlpDownloader, FallbackDownloader, SpotifyDownloader]
+    assert route(url, backend="subprocess") == [FallbackDownloader, SpotifyDownloader]
+    assert all(downloader.accept(url) for downloader in (SpotifyDownloader, FallbackDownloader))